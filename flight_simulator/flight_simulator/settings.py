@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'flights.invalidation.CacheGenerationMiddleware',
+    'flights.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,12 +78,57 @@ WSGI_APPLICATION = 'flight_simulator.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE selects the backend: "sqlite" (default) or "postgres".
+# SQLite uses a busy timeout so concurrent seat reservations wait for the write
+# lock instead of failing with "database is locked", and write transactions
+# take the lock up front (BEGIN IMMEDIATE). WAL mode is only switched on for a
+# database configured with DB_NAME: it is persistent and rewrites the file
+# header, so the db.sqlite3 checked into the repo stays in rollback mode.
+# PostgreSQL keeps connections open for DB_CONN_MAX_AGE seconds, or, with
+# DB_POOL=1, uses psycopg's connection pool (requires psycopg[pool]).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'flight_simulator'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL', '') in ('1', 'true', 'yes'):
+        # Pooled connections are returned to the pool instead of persisting.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 20)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+else:
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', 20))  # seconds
+    SQLITE_WAL = 'DB_NAME' in os.environ
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    ('PRAGMA journal_mode=WAL;' if SQLITE_WAL else '')
+                    + f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000};'
+                    'PRAGMA synchronous=NORMAL;'
+                ),
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -127,3 +175,225 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Cache invalidation
+# The route index, connection index, fare cache and search cache live in each
+# process. Model saves keep them current through signals; bulk writes such as
+# import_flights bump a shared generation row instead, which every process
+# checks at most every CHECK_INTERVAL seconds before serving a request, so
+# other workers see an import within that window rather than a cache TTL.
+
+CACHE_INVALIDATION = {
+    'CHECK_INTERVAL': 2.0,
+}
+
+
+# Flight search
+# In-process route/day -> flight id index used by FlightSearchView.
+
+FLIGHT_SEARCH_INDEX_ENABLED = True
+FLIGHT_SEARCH_INDEX_SIZE = 10000
+FLIGHT_SEARCH_INDEX_TTL = 60
+
+
+# Fare quote cache
+# BACKEND is 'local' (in-process LRU) or 'django' (uses CACHES[CACHE_ALIAS]).
+
+FARE_QUOTE_CACHE = {
+    'BACKEND': 'local',
+    'CACHE_ALIAS': 'default',
+    'MAX_ENTRIES': 50000,
+    'BUCKET_SECONDS': 30,
+}
+
+
+# Seat holds
+# Seconds seats reserved by /flights/book/begin/ (and the price in its quote)
+# stay locked, and how often each process releases expired holds (0 disables
+# the in-process reaper; `manage.py release_expired_holds` can run instead).
+
+SEAT_HOLD_TTL = 600
+SEAT_HOLD_REAPER_INTERVAL = 30
+
+
+# Seat map
+# Cabins are contiguous blocks of rows, front to back, sized by fraction of rows.
+
+SEAT_MAP = {
+    'SEATS_PER_ROW': 6,
+    'CABINS': [
+        ('First', 0.05),
+        ('Business', 0.10),
+        ('Premium Economy', 0.15),
+        ('Economy', 0.70),
+    ],
+}
+
+
+# Payments
+# CLASS implements flights.payments.PaymentGateway. Charges are awaited by the
+# async confirm view (serve flight_simulator.asgi:application with an ASGI
+# server such as uvicorn to get the full benefit), at most MAX_CONCURRENCY per
+# event loop, each attempt bounded by TIMEOUT seconds and retried RETRIES times.
+
+PAYMENT_GATEWAY = {
+    'CLASS': 'flights.payments.SimulatedPaymentGateway',
+    'OPTIONS': {'latency': 0.0, 'jitter': 0.0},
+    'MAX_CONCURRENCY': 100,
+    'TIMEOUT': 5.0,
+    'RETRIES': 2,
+    'BACKOFF': 0.1,
+}
+
+# Upper bound on passengers across all items of one /flights/book/bulk/ request.
+BULK_BOOKING_MAX_PASSENGERS = 500
+
+
+# Fare history
+# Every quote served by the fare cache is buffered and bulk-inserted into
+# FareHistory; `manage.py rollup_fare_history` compacts old samples hourly.
+
+FARE_HISTORY = {
+    'ENABLED': True,
+    'BUFFER_SIZE': 500,
+    'FLUSH_INTERVAL': 5.0,
+}
+
+
+# Demand engine
+# Searches, holds and confirms feed per-flight decayed scores that each worker
+# merges into Flight.demand_factor every FLUSH_INTERVAL seconds (0 disables
+# flushing); the stored level decays from Flight.demand_updated_at, and rows
+# never written by the engine (NULL timestamp) start from BASELINE.
+
+DEMAND_ENGINE = {
+    'HALF_LIFE': 3600.0,
+    'SATURATION': 50.0,
+    'BASELINE': 0.2,
+    'WEIGHTS': {'search': 1.0, 'hold': 5.0, 'confirm': 10.0},
+    'MIN_CHANGE': 0.01,
+    'FLUSH_INTERVAL': 60,
+}
+
+
+# Metrics
+# Per-endpoint latency, SQL query count/time and hot-path stage timings,
+# served in Prometheus text format at /metrics.
+
+METRICS_ENABLED = True
+
+
+# PNR allocation
+# Each process reserves PNR sequence numbers in blocks of this size (one
+# database write per block).
+
+PNR_BLOCK_SIZE = 1000
+
+
+# Fare grid
+# Flight.current_fare is refreshed every REFRESH_INTERVAL seconds for flights
+# whose seats/demand changed or that crossed a time-to-departure tier; search
+# and begin-booking read it instead of pricing on every request.
+
+FARE_GRID = {
+    'REFRESH_INTERVAL': 5,
+    'BATCH_SIZE': 1000,
+}
+
+
+# Search response cache
+# Encoded /flights/search/ responses per (origin, destination, day, passengers),
+# dropped on seat/flight changes and after TTL seconds. Responses carry an
+# ETag (If-None-Match -> 304) and are gzipped above GZIP_MIN_BYTES if GZIP.
+
+SEARCH_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 5000,
+    'TTL': 10,
+    'GZIP': True,
+    'GZIP_MIN_BYTES': 1024,
+}
+
+
+# Itinerary search
+# /flights/itineraries/ finds direct, one- and two-stop itineraries from an
+# in-memory index of flights departing within HORIZON_DAYS, rebuilt every
+# INDEX_TTL seconds and updated in place when a Flight is saved or deleted.
+
+ITINERARY_SEARCH = {
+    'MAX_STOPS': 2,
+    'MIN_LAYOVER_MINUTES': 45,
+    'MAX_LAYOVER_MINUTES': 360,
+    'HORIZON_DAYS': 365,
+    'INDEX_TTL': 300,
+    'MAX_CANDIDATES': 2000,
+}
+
+
+# Cancellations and refunds
+# Bulk cancellations queue a PENDING Refund per paid booking; the refund
+# processor sends them every PROCESS_INTERVAL seconds (0 disables it; run
+# `manage.py cancel_bookings --process-refunds` instead) and gives up after
+# MAX_ATTEMPTS failures. A batch is claimed before the processor is called;
+# claims left PROCESSING for CLAIM_TIMEOUT seconds (a crashed worker) are
+# retried. /flights/book/cancel/bulk/ takes at most BULK_CANCEL_MAX_PNRS PNRs
+# per request.
+
+REFUNDS = {
+    'PROCESS_INTERVAL': 5,
+    'BATCH_SIZE': 500,
+    'MAX_ATTEMPTS': 3,
+    'CLAIM_TIMEOUT': 300,
+    'BULK_CANCEL_MAX_PNRS': 1000,
+}
+
+
+# Pricing rules
+# Fares follow flights.pricing_rules.DEFAULT_RULES, overridden section by
+# section (and per route) by the JSON file at FILE when set. Each process
+# re-checks the file every CHECK_INTERVAL seconds and swaps in the recompiled
+# rules without a restart; a file that fails validation is logged and ignored.
+# `manage.py check_pricing_rules FILE` validates a file before it goes live.
+
+PRICING_RULES = {
+    'FILE': os.environ.get('PRICING_RULES_FILE'),
+    'CHECK_INTERVAL': 5,
+}
+
+
+# Passenger lookup
+# Bookings reuse the Passenger with the same normalized (email, phone);
+# CACHE_SIZE recently resolved identities are kept in-process per worker.
+
+PASSENGER_LOOKUP = {
+    'CACHE_SIZE': 50000,
+}
+
+
+# Market simulation
+# `manage.py simulate_market` advances a virtual clock STEP_MINUTES per tick
+# and samples fares into FareHistory every SAMPLE_EVERY ticks. ARRIVALS
+# overrides flights.simulation.DEFAULT_ARRIVALS (search rate and conversion).
+
+MARKET_SIMULATION = {
+    'STEP_MINUTES': 15,
+    'SAMPLE_EVERY': 4,
+    'ARRIVALS': {},
+}
+
+
+# Overbooking
+# Every REFRESH_INTERVAL seconds (0 disables it) each route's share of booked
+# seats that ended CANCELLED or FAILED, over departures in the last
+# LOOKBACK_DAYS, sets how far upcoming flights are oversold: total_seats *
+# (1 / (1 - rate)), capped at MAX_FACTOR. Routes with fewer than MIN_SEATS
+# booked seats are not oversold. Passengers beyond the cabin are booked
+# without a seat and seated at check-in.
+
+OVERBOOKING = {
+    'REFRESH_INTERVAL': 3600,
+    'LOOKBACK_DAYS': 90,
+    'MIN_SEATS': 200,
+    'MAX_FACTOR': 1.10,
+}
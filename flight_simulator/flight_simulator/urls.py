@@ -19,10 +19,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from flights.views import MetricsView
+
 urlpatterns = [
     path('', include('frontend.urls')),
     path('admin/', admin.site.urls),
     path('flights/', include('flights.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
 
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class FlightsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flights'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .seatmap import check_config
+        check_config()
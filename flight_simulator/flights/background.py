@@ -0,0 +1,59 @@
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask(threading.Thread):
+    # Daemon thread that calls func every interval seconds with fresh DB connections.
+
+    def __init__(self, name: str, interval: float, func):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self.func = func
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                close_old_connections()
+                self.func()
+            except Exception:
+                logger.exception("Background task %s failed", self.name)
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_tasks = {}
+_tasks_lock = threading.Lock()
+
+
+def start_periodic_task(name: str, interval: float, func):
+    # Start func on its own thread once per process; a falsy interval disables it.
+    if not interval:
+        return None
+    with _tasks_lock:
+        if name not in _tasks:
+            _tasks[name] = PeriodicTask(name, interval, func)
+            _tasks[name].start()
+        return _tasks[name]
+
+
+def start_background_tasks():
+    # Called from wsgi.py/asgi.py so only serving processes run these threads.
+    from .cancellations import start_refund_processor
+    from .demand import start_demand_flusher
+    from .fare_grid import start_fare_refresher
+    from .holds import start_hold_reaper
+    from .overbooking import start_oversell_refresher
+
+    start_hold_reaper()
+    start_demand_flusher()
+    start_fare_refresher()
+    start_refund_processor()
+    start_oversell_refresher()
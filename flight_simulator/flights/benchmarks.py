@@ -0,0 +1,258 @@
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .fare_cache import fare_cache
+from .fare_grid import refresh_fares
+from .fare_history import fare_recorder
+from .models import Flight, normalize_airport
+from .pricing import compute_dynamic_fare, compute_dynamic_fares
+from .search_index import route_index
+
+AIRPORTS = ['DEL', 'BOM', 'BLR', 'MAA', 'CCU', 'LHR', 'JFK', 'CDG', 'DXB', 'SIN']
+
+
+def seed_catalog(routes=10, days=7, flights_per_day=20, seed=1):
+    # Bulk-insert routes * days * flights_per_day flights and return the routes used.
+    rng = random.Random(seed)
+    pairs = [(a, b) for a in AIRPORTS for b in AIRPORTS if a != b]
+    rng.shuffle(pairs)
+    chosen = pairs[:routes]
+
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    flights = []
+    for origin, destination in chosen:
+        for day in range(1, days + 1):
+            for _ in range(flights_per_day):
+                departure = today + timedelta(days=day, minutes=rng.randint(0, 24 * 60 - 1))
+                total = rng.choice([120, 150, 180, 220])
+                flights.append(Flight(
+                    origin=origin,
+                    destination=destination,
+                    origin_key=normalize_airport(origin),
+                    destination_key=normalize_airport(destination),
+                    departure_time=departure,
+                    arrival_time=departure + timedelta(minutes=rng.randint(60, 600)),
+                    base_price=Decimal(rng.randint(2000, 20000)),
+                    total_seats=total,
+                    available_seats=rng.randint(total // 4, total),
+                    demand_factor=round(rng.random(), 3),
+                ))
+    Flight.objects.bulk_create(flights, batch_size=2000)
+    refresh_fares()
+    route_index.clear()
+    fare_cache.clear()
+    return chosen
+
+
+def summarize(latencies, queries=None, elapsed=None, errors=0):
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def pct(p):
+        return latencies[min(count - 1, max(0, int(round(p / 100.0 * count)) - 1))] * 1000.0
+
+    result = {
+        'requests': count,
+        'errors': errors,
+        'latency_ms': {
+            'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+            'mean': statistics.fmean(latencies) * 1000.0, 'max': latencies[-1] * 1000.0,
+        } if count else None,
+    }
+    if elapsed:
+        result['throughput_rps'] = count / elapsed
+    if queries:
+        result['queries'] = {'mean': statistics.fmean(queries), 'max': max(queries)}
+    return result
+
+
+def bench_pricing(sample_size=10000, repeat=3, seed=2):
+    # Micro-benchmark the scalar pricer, the batch pricer and the warm fare cache.
+    rng = random.Random(seed)
+    now = timezone.now()
+    flights = []
+    for i in range(sample_size):
+        total = rng.randint(50, 300)
+        flights.append(Flight(
+            id=i + 1,
+            base_price=Decimal(rng.randint(2000, 20000)),
+            total_seats=total,
+            available_seats=rng.randint(0, total),
+            departure_time=now + timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+            demand_factor=rng.random(),
+        ))
+
+    def best_of(fn):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return {'seconds': best, 'per_fare_us': best / sample_size * 1e6, 'fares_per_second': sample_size / best}
+
+    results = {
+        'sample_size': sample_size,
+        'scalar': best_of(lambda: [
+            compute_dynamic_fare(f.base_price, f.total_seats, f.available_seats, f.departure_time, f.demand_factor, now=now)
+            for f in flights
+        ]),
+        'batch': best_of(lambda: compute_dynamic_fares(flights, now=now)),
+    }
+    # The sample flights are unsaved, so keep their quotes out of FareHistory.
+    recording, fare_recorder.enabled = fare_recorder.enabled, False
+    try:
+        fare_cache.get_fares(flights, now=now)
+        results['cache_hit'] = best_of(lambda: fare_cache.get_fares(flights, now=now))
+    finally:
+        fare_recorder.enabled = recording
+        fare_cache.clear()
+    return results
+
+
+class LoadGenerator:
+    # Drives the booking endpoints through the Django test client.
+
+    def __init__(self, routes, days, concurrency=8, seed=3):
+        self.routes = routes
+        self.days = days
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.flight_ids = list(Flight.objects.values_list('id', flat=True))
+        self.confirmed = []
+        self._confirmed_lock = threading.Lock()
+        self._local = threading.local()
+
+    def client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = Client()
+        return self._local.client
+
+    def post(self, url, payload):
+        return self.client().post(url, json.dumps(payload), content_type='application/json')
+
+    # Scenario steps. An optional <name>_setup runs untimed first; a None
+    # result skips the request, anything else is passed to the step.
+
+    def search(self, rng):
+        origin, destination = rng.choice(self.routes)
+        day = (timezone.localtime() + timedelta(days=rng.randint(1, self.days))).date()
+        return self.client().get('/flights/search/', {
+            'origin': origin, 'destination': destination, 'departure_date': day.isoformat(),
+        })
+
+    def begin(self, rng):
+        return self.post('/flights/book/begin/', {'flight_id': rng.choice(self.flight_ids), 'seats': rng.randint(1, 3)})
+
+    def confirm_setup(self, rng):
+        quote = self.begin(rng)
+        return quote.json().get('quote_token') if quote.status_code == 200 else None
+
+    def confirm(self, rng, token):
+        response = self.post('/flights/book/confirm/', {
+            'quote_token': token,
+            'passenger': {'first_name': 'Load', 'last_name': 'Test', 'email': f'user{rng.randint(1, 50)}@load.example'},
+        })
+        if response.status_code == 201:
+            with self._confirmed_lock:
+                self.confirmed.append(response.json()['pnr'])
+        return response
+
+    def cancel_setup(self, rng):
+        with self._confirmed_lock:
+            return self.confirmed.pop() if self.confirmed else None
+
+    def cancel(self, rng, pnr):
+        return self.post('/flights/book/cancel/', {'pnr': pnr})
+
+    def history(self, rng):
+        return self.client().get('/flights/bookings/', {'email': f'user{rng.randint(1, 50)}@load.example'})
+
+    def run_scenario(self, name, requests):
+        step = getattr(self, name)
+        setup = getattr(self, f'{name}_setup', None)
+        seeds = [self.rng.random() for _ in range(requests)]
+        samples = []
+        lock = threading.Lock()
+
+        def one(seed):
+            rng = random.Random(seed)
+            try:
+                args = ()
+                if setup is not None:
+                    try:
+                        arg = setup(rng)
+                    except Exception:
+                        arg = None
+                    if arg is None:
+                        return
+                    args = (arg,)
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    try:
+                        status = step(rng, *args).status_code
+                    except Exception as exc:
+                        # Errors that escape the view (e.g. SQLite lock timeouts under write contention).
+                        status = type(exc).__name__
+                    elapsed = time.perf_counter() - start
+                with lock:
+                    samples.append((elapsed, len(ctx.captured_queries), status))
+            finally:
+                if self.concurrency > 1:
+                    close_old_connections()
+
+        start = time.perf_counter()
+        if self.concurrency > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                list(pool.map(one, seeds))
+        else:
+            for seed in seeds:
+                one(seed)
+        wall = time.perf_counter() - start
+
+        result = summarize(
+            [s[0] for s in samples],
+            queries=[s[1] for s in samples],
+            elapsed=wall,
+            errors=sum(1 for s in samples if not isinstance(s[2], int) or s[2] >= 500),
+        )
+        statuses = {}
+        for _, _, status in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        result['status_codes'] = statuses
+        return result
+
+
+SCENARIOS = ['search', 'begin', 'confirm', 'cancel', 'history']
+
+
+def run_load(routes, days, requests=200, concurrency=8, scenarios=SCENARIOS):
+    generator = LoadGenerator(routes, days, concurrency=concurrency)
+    return {name: generator.run_scenario(name, requests) for name in scenarios}
+
+
+def compare(current, baseline, threshold=0.2):
+    # List endpoints whose p95 latency or mean query count grew by more than threshold.
+    regressions = []
+    for name, result in current.get('endpoints', {}).items():
+        old = baseline.get('endpoints', {}).get(name)
+        if not old or not old.get('latency_ms') or not result.get('latency_ms'):
+            continue
+        for metric, new_value, old_value in (
+            ('p95_ms', result['latency_ms']['p95'], old['latency_ms']['p95']),
+            ('queries', (result.get('queries') or {}).get('mean', 0), (old.get('queries') or {}).get('mean', 0)),
+        ):
+            if old_value and new_value > old_value * (1 + threshold):
+                regressions.append({'endpoint': name, 'metric': metric, 'baseline': old_value, 'current': new_value})
+    return regressions
@@ -0,0 +1,189 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .demand import CONFIRM, demand_engine
+from .fare_grid import FARE_FIELDS, PRICING_FIELDS, current_fares
+from .holds import consume_holds, create_hold, release_hold
+from .inventory import release_seats, reserve_seats
+from .models import Booking, Flight, SeatHold
+from .passengers import passenger_resolver
+from .pnr import pnr_allocator
+from .seatmap import SeatMapError, allocate_seats
+
+
+class BulkBookingError(Exception):
+    pass
+
+
+@dataclass
+class BulkItem:
+    index: int
+    flight_id: int = None
+    passengers: list = field(default_factory=list)
+    error: str = None
+    price_per_seat: Decimal = None
+    seat_numbers: list = field(default_factory=list)
+    pnrs: list = field(default_factory=list)
+    hold: SeatHold = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def total_price(self):
+        return self.price_per_seat * len(self.passengers)
+
+    def as_dict(self):
+        if not self.ok:
+            return {"index": self.index, "success": False, "flight_id": self.flight_id, "error": self.error}
+        return {
+            "index": self.index,
+            "success": True,
+            "flight_id": str(self.flight_id),
+            "pnrs": self.pnrs,
+            "seat_numbers": self.seat_numbers,
+            "price_per_seat": str(self.price_per_seat),
+            "total_price": str(self.total_price),
+        }
+
+
+def parse_items(raw_items):
+    # Validate the body; malformed items are marked failed instead of rejecting the order.
+    if not isinstance(raw_items, list) or not raw_items:
+        raise BulkBookingError("items must be a non-empty list")
+
+    items = []
+    for index, raw in enumerate(raw_items):
+        item = BulkItem(index=index)
+        items.append(item)
+        if not isinstance(raw, dict):
+            item.error = "item must be an object"
+            continue
+        try:
+            item.flight_id = int(raw.get('flight_id'))
+        except (TypeError, ValueError):
+            item.error = "flight_id required"
+            continue
+        passengers = raw.get('passengers')
+        if not isinstance(passengers, list) or not passengers or not all(isinstance(p, dict) for p in passengers):
+            item.error = "passengers must be a non-empty list of objects"
+            continue
+        item.passengers = passengers
+
+    limit = getattr(settings, 'BULK_BOOKING_MAX_PASSENGERS', 500)
+    if sum(len(item.passengers) for item in items) > limit:
+        raise BulkBookingError(f"At most {limit} passengers per request")
+    return items
+
+
+def reserve(items, seat_class=None):
+    # Reserve, seat, hold and price every valid item in one transaction; the reaper frees unpaid holds.
+    wanted = [item for item in items if item.ok]
+    with transaction.atomic():
+        available = dict(
+            Flight.objects.filter(id__in={item.flight_id for item in wanted}).values_list('id', 'available_seats')
+        )
+
+        by_flight = defaultdict(list)
+        for item in wanted:
+            if item.flight_id not in available:
+                item.error = "Flight not found"
+            elif available[item.flight_id] < len(item.passengers):
+                item.error = "Not enough seats available"
+            else:
+                available[item.flight_id] -= len(item.passengers)
+                by_flight[item.flight_id].append(item)
+
+        reserved = {}
+        for flight_id, flight_items in by_flight.items():
+            seats = sum(len(item.passengers) for item in flight_items)
+            flight = reserve_seats(flight_id, seats, fields=(*PRICING_FIELDS, *FARE_FIELDS))
+            if flight is None:
+                _fail(flight_items, "Not enough seats available")
+                continue
+
+            try:
+                labels = allocate_seats(flight_id, seats, seat_class=seat_class, allow_unassigned=True)
+            except SeatMapError as exc:
+                release_seats(flight_id, seats)
+                _fail(flight_items, str(exc))
+                continue
+
+            hold = create_hold(flight_id, seats, seat_numbers=labels)
+            # Passengers past the cabin under the oversell allowance are seated at check-in.
+            labels += [None] * (seats - len(labels))
+            reserved[flight_id] = flight
+            for item in flight_items:
+                item.hold = hold
+                item.seat_numbers, labels = labels[:len(item.passengers)], labels[len(item.passengers):]
+
+        fares = dict(zip(reserved, current_fares(reserved.values())))
+        for flight_id in reserved:
+            for item in by_flight[flight_id]:
+                item.price_per_seat = fares[flight_id]
+    return items
+
+
+def _holds(items):
+    return {item.hold.hold_id: item.hold for item in items if item.ok}.values()
+
+
+def claim(items):
+    # Consume the holds before the order is charged, so an item whose hold the
+    # reaper already released is dropped from the charge instead of paid for.
+    consumed = consume_holds(hold.hold_id for hold in _holds(items))
+    for item in items:
+        if item.ok and item.hold.hold_id not in consumed:
+            item.error = "Seat hold expired"
+    return items
+
+
+def release(items):
+    # Undo reserve and claim for every successful item, e.g. after a failed payment.
+    with transaction.atomic():
+        for hold in _holds(items):
+            release_hold(
+                hold.hold_id, hold.flight_id, hold.seats,
+                hold.seat_numbers.split(',') if hold.seat_numbers else (),
+                status=SeatHold.STATUS_CONSUMED,
+            )
+
+
+def create_bookings(items):
+    # One single-seat Booking per passenger, inserted with one bulk_create.
+    # PNR blocks are reserved in their own durable transaction, so before ours.
+    pnrs = iter(pnr_allocator.allocate_many(sum(len(item.seat_numbers) for item in items if item.ok)))
+    with transaction.atomic():
+        booked = [item for item in items if item.ok]
+        passenger_ids = passenger_resolver.resolve_many([p for item in booked for p in item.passengers])
+
+        bookings = []
+        passenger_iter = iter(passenger_ids)
+        for item in booked:
+            for seat in item.seat_numbers:
+                bookings.append(Booking(
+                    pnr=next(pnrs),
+                    flight_id=item.flight_id,
+                    passenger_id=next(passenger_iter),
+                    seat_number=seat,
+                    booked_seats=1,
+                    price_paid=item.price_per_seat,
+                    status=Booking.STATUS_CONFIRMED,
+                ))
+        Booking.objects.bulk_create(bookings)
+
+    booking_iter = iter(bookings)
+    for item in booked:
+        item.pnrs = [next(booking_iter).pnr for _ in item.seat_numbers]
+        demand_engine.record(item.flight_id, CONFIRM, len(item.seat_numbers))
+    return items
+
+
+def _fail(items, error):
+    for item in items:
+        item.error = error
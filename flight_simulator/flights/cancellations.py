@@ -0,0 +1,134 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .background import start_periodic_task
+from .inventory import lock_rows, release_seats
+from .models import Booking, Refund
+from .seatmap import release_seat_labels
+from .utils import simulate_refund
+
+logger = logging.getLogger(__name__)
+
+
+def cancel_bookings(pnrs=None, flight_id=None, batch_size: int = 1000) -> dict:
+    # Cancel confirmed bookings by PNR list and/or flight, in batches.
+    if pnrs is None and flight_id is None:
+        raise ValueError("Pass pnrs and/or flight_id")
+    confirmed = Booking.objects.filter(status=Booking.STATUS_CONFIRMED)
+    if flight_id is not None:
+        confirmed = confirmed.filter(flight_id=flight_id)
+
+    result = {'bookings': 0, 'seats': 0, 'flights': set(), 'refunds': 0, 'pnrs': []}
+    if pnrs is None:
+        _cancel_batches(confirmed, batch_size, result)
+    else:
+        pnrs = list(pnrs)
+        for i in range(0, len(pnrs), batch_size):
+            _cancel_batches(confirmed.filter(pnr__in=pnrs[i:i + batch_size]), batch_size, result)
+    result['flights'] = len(result['flights'])
+    return result
+
+
+def _cancel_batches(confirmed, batch_size, result):
+    while True:
+        with transaction.atomic():
+            bookings = list(
+                lock_rows(confirmed).order_by('id')
+                .only('id', 'pnr', 'flight_id', 'booked_seats', 'seat_number', 'price_paid')[:batch_size]
+            )
+            if not bookings:
+                return
+            Booking.objects.filter(id__in=[b.id for b in bookings], status=Booking.STATUS_CONFIRMED).update(
+                status=Booking.STATUS_CANCELLED, updated_at=timezone.now(),
+            )
+
+            seats_by_flight = defaultdict(int)
+            labels_by_flight = defaultdict(list)
+            for booking in bookings:
+                seats_by_flight[booking.flight_id] += booking.booked_seats
+                if booking.seat_number:
+                    labels_by_flight[booking.flight_id].extend(booking.seat_number.split(','))
+            for flight_id, seats in seats_by_flight.items():
+                release_seats(flight_id, seats)
+            for flight_id, labels in labels_by_flight.items():
+                release_seat_labels(flight_id, labels)
+
+            refunds = Refund.objects.bulk_create(
+                [Refund(booking_id=b.id, amount=b.price_paid) for b in bookings if b.price_paid]
+            )
+
+        result['bookings'] += len(bookings)
+        result['seats'] += sum(seats_by_flight.values())
+        result['flights'].update(seats_by_flight)
+        result['refunds'] += len(refunds)
+        result['pnrs'].extend(b.pnr for b in bookings)
+        if len(bookings) < batch_size:
+            return
+
+
+def process_refunds(batch_size: int = 500, max_attempts: int = 3, claim_timeout: int = 300) -> dict:
+    # Claim PENDING refunds, call the processor with no locks held, then record the outcomes.
+    now = timezone.now()
+    with transaction.atomic():
+        claimable = Refund.objects.filter(
+            Q(status=Refund.STATUS_PENDING)
+            | Q(status=Refund.STATUS_PROCESSING, claimed_at__lte=now - timedelta(seconds=claim_timeout))
+        )
+        claimed = list(
+            lock_rows(claimable, skip_locked=True).order_by('id').only('id', 'amount', 'attempts')[:batch_size]
+        )
+        Refund.objects.filter(id__in=[refund.id for refund in claimed]).update(
+            status=Refund.STATUS_PROCESSING, claimed_at=now, attempts=F('attempts') + 1,
+        )
+
+    outcomes = {refund.id: simulate_refund(refund.amount) for refund in claimed}
+
+    processed_at = timezone.now()
+    retry, failed = [], []
+    done = []
+    with transaction.atomic():
+        # Skip rows whose claim lapsed and was taken over by another processor.
+        ours = set(
+            lock_rows(Refund.objects.filter(id__in=outcomes, status=Refund.STATUS_PROCESSING, claimed_at=now))
+            .values_list('id', flat=True)
+        )
+        for refund in claimed:
+            if refund.id not in ours:
+                continue
+            outcome = outcomes[refund.id]
+            if outcome.get('success'):
+                refund.status = Refund.STATUS_REFUNDED
+                refund.transaction_id = outcome['transaction_id']
+                refund.processed_at = processed_at
+                done.append(refund)
+            elif refund.attempts + 1 >= max_attempts:
+                failed.append(refund.id)
+            else:
+                retry.append(refund.id)
+
+        Refund.objects.bulk_update(done, ['status', 'transaction_id', 'processed_at'], batch_size=500)
+        Refund.objects.filter(id__in=retry).update(status=Refund.STATUS_PENDING)
+        Refund.objects.filter(id__in=failed).update(status=Refund.STATUS_FAILED, processed_at=processed_at)
+    if failed:
+        logger.warning("%d refund(s) failed after %d attempts", len(failed), max_attempts)
+    return {'refunded': len(done), 'retrying': len(retry), 'failed': len(failed)}
+
+
+def _process():
+    config = getattr(settings, 'REFUNDS', {})
+    process_refunds(
+        batch_size=config.get('BATCH_SIZE', 500),
+        max_attempts=config.get('MAX_ATTEMPTS', 3),
+        claim_timeout=config.get('CLAIM_TIMEOUT', 300),
+    )
+
+
+def start_refund_processor():
+    # Process queued refunds every REFUNDS['PROCESS_INTERVAL'] seconds in this process.
+    return start_periodic_task('refund-processor', getattr(settings, 'REFUNDS', {}).get('PROCESS_INTERVAL', 0), _process)
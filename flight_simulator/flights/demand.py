@@ -0,0 +1,138 @@
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from .background import start_periodic_task
+from .inventory import lock_rows
+from .models import Flight
+
+SEARCH = 'search'
+HOLD = 'hold'
+CONFIRM = 'confirm'
+
+DEFAULT_WEIGHTS = {SEARCH: 1.0, HOLD: 5.0, CONFIRM: 10.0}
+
+
+class DemandEngine:
+    # Per-flight booking-velocity tracker that drives Flight.demand_factor.
+
+    # Stored levels at or above this read back as this; 1.0 has no finite score.
+    MAX_LEVEL = 0.999
+
+    def __init__(self, half_life=3600.0, saturation=50.0, baseline=0.2, weights=None, min_change=0.01,
+                 clock=time.time):
+        self.decay_rate = math.log(2) / half_life
+        self.saturation = saturation
+        self.baseline = baseline
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.min_change = min_change
+        self.clock = clock
+        self._scores = {}
+        # Flights this worker wrote above baseline; flushed until they decay back.
+        self._decaying = set()
+        self._lock = threading.Lock()
+
+    def record(self, flight_id, event, count=1):
+        self.record_many([flight_id], event, count)
+
+    def record_many(self, flight_ids, event, count=1):
+        weight = self.weights[event] * count
+        now = self.clock()
+        with self._lock:
+            for flight_id in flight_ids:
+                score, at = self._scores.get(flight_id, (0.0, now))
+                self._scores[flight_id] = (score * math.exp(-self.decay_rate * (now - at)) + weight, now)
+
+    def score(self, flight_id):
+        # This worker's unflushed score for flight_id.
+        now = self.clock()
+        score, at = self._scores.get(flight_id, (0.0, now))
+        return score * math.exp(-self.decay_rate * (now - at))
+
+    def demand_level(self, flight_id):
+        return self._level(self.score(flight_id))
+
+    def _level(self, score):
+        return self.baseline + (1.0 - self.baseline) * score / (score + self.saturation)
+
+    def score_for_level(self, level):
+        # Inverse of the level curve; levels at or below baseline are a zero score.
+        level = min(level, self.MAX_LEVEL)
+        if level <= self.baseline:
+            return 0.0
+        return self.saturation * (level - self.baseline) / (1.0 - level)
+
+    def flush(self):
+        # Merge unflushed demand into the stored levels; returns the number of flights updated.
+        now = self.clock()
+        with self._lock:
+            pending = {
+                flight_id: score * math.exp(-self.decay_rate * (now - at))
+                for flight_id, (score, at) in self._scores.items()
+            }
+            self._scores.clear()
+            decaying, self._decaying = self._decaying, set()
+        flight_ids = pending.keys() | decaying
+        if not flight_ids:
+            return 0
+
+        written_at = datetime.fromtimestamp(now, tz=dt_timezone.utc)
+        changed = []
+        still_decaying = set()
+        unwritten = {}
+        with transaction.atomic():
+            rows = lock_rows(Flight.objects.filter(id__in=flight_ids)).values_list(
+                'id', 'demand_factor', 'demand_updated_at',
+            )
+            for flight_id, stored, updated_at in rows:
+                # A NULL timestamp means the engine never wrote this row; its
+                # demand_factor is the model default, so start from baseline.
+                score = 0.0
+                if updated_at is not None:
+                    score = self.score_for_level(stored)
+                    score *= math.exp(-self.decay_rate * max(now - updated_at.timestamp(), 0.0))
+                score += pending.get(flight_id, 0.0)
+                level = self._level(score)
+                if abs(level - stored) >= self.min_change:
+                    changed.append(Flight(
+                        id=flight_id, demand_factor=round(level, 4), demand_updated_at=written_at, current_fare=None,
+                    ))
+                elif pending.get(flight_id, 0.0) >= 1e-3:
+                    unwritten[flight_id] = pending[flight_id]
+                if score >= 1e-3:
+                    still_decaying.add(flight_id)
+            if changed:
+                Flight.objects.bulk_update(
+                    changed, ['demand_factor', 'demand_updated_at', 'current_fare'], batch_size=500,
+                )
+
+        with self._lock:
+            self._decaying |= still_decaying
+            # Deltas too small to move a stored level yet are kept for the next flush.
+            for flight_id, score in unwritten.items():
+                previous, at = self._scores.get(flight_id, (0.0, now))
+                self._scores[flight_id] = (previous * math.exp(-self.decay_rate * (now - at)) + score, now)
+        return len(changed)
+
+
+def build_demand_engine():
+    config = getattr(settings, 'DEMAND_ENGINE', {})
+    return DemandEngine(
+        half_life=config.get('HALF_LIFE', 3600.0),
+        saturation=config.get('SATURATION', 50.0),
+        baseline=config.get('BASELINE', 0.2),
+        weights=config.get('WEIGHTS'),
+        min_change=config.get('MIN_CHANGE', 0.01),
+    )
+
+
+demand_engine = build_demand_engine()
+
+
+def start_demand_flusher():
+    interval = getattr(settings, 'DEMAND_ENGINE', {}).get('FLUSH_INTERVAL', 0)
+    return start_periodic_task('demand-flusher', interval, demand_engine.flush)
@@ -0,0 +1,186 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .fare_history import fare_recorder
+from .invalidation import schedule_generation
+from .pricing import compute_dynamic_fares
+from .pricing_rules import pricing_rules
+
+
+class LocalFareCacheBackend:
+    # Bounded in-process LRU store.
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys_by_flight = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = value
+        return found
+
+    def set_many(self, items):
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                self._keys_by_flight.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, flight_id):
+        with self._lock:
+            for key in self._keys_by_flight.pop(flight_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_flight.clear()
+
+    def size(self):
+        return len(self._entries)
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_flight.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_flight[key[0]]
+
+
+class DjangoFareCacheBackend:
+    # Store backed by Django's cache framework (locmem, memcached, redis, ...).
+
+    def __init__(self, alias='default', timeout=60):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _version_key(self, flight_id):
+        return f'fare:{flight_id}:version'
+
+    def _versioned(self, keys):
+        versions = self.cache.get_many([self._version_key(k[0]) for k in keys])
+        return {
+            key: 'fare:{}:{}:{}'.format(key[0], versions.get(self._version_key(key[0]), 0), ':'.join(map(str, key[1:])))
+            for key in keys
+        }
+
+    def get_many(self, keys):
+        names = self._versioned(keys)
+        found = self.cache.get_many(list(names.values()))
+        return {key: found[name] for key, name in names.items() if name in found}
+
+    def set_many(self, items):
+        names = self._versioned(list(items))
+        self.cache.set_many({names[key]: value for key, value in items.items()}, timeout=self.timeout)
+
+    def invalidate(self, flight_id):
+        key = self._version_key(flight_id)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, timeout=None)
+
+    def clear(self):
+        # Clears the whole alias; point CACHE_ALIAS at a dedicated cache.
+        self.cache.clear()
+
+    def size(self):
+        return None
+
+
+class FareQuoteCache:
+    # Short-lived cache of compute_dynamic_fare results.
+
+    def __init__(self, backend, bucket_seconds=30):
+        self.backend = backend
+        self.bucket_seconds = bucket_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, flight, bucket, rules_version):
+        return (flight.id, flight.available_seats, float(flight.demand_factor), bucket, rules_version)
+
+    def get_fares(self, flights, now=None):
+        # Fares for flights in order; misses are priced together in one batch.
+        flights = list(flights)
+        if now is None:
+            now = timezone.now()
+        bucket = int(now.timestamp() // self.bucket_seconds)
+
+        rules_version = pricing_rules.current().version
+        keys = [self._key(f, bucket, rules_version) for f in flights]
+        found = self.backend.get_many(keys)
+
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            fares = compute_dynamic_fares([flights[i] for i in missing], now=now)
+            fresh = {keys[i]: fare for i, fare in zip(missing, fares)}
+            self.backend.set_many(fresh)
+            found.update(fresh)
+
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        fares = [found[key] for key in keys]
+        fare_recorder.record_many(
+            ((f.id, fare, f.available_seats) for f, fare in zip(flights, fares)),
+            timestamp=now,
+        )
+        return fares
+
+    def get_fare(self, flight, now=None):
+        return self.get_fares([flight], now=now)[0]
+
+    def invalidate(self, flight_id):
+        self.backend.invalidate(flight_id)
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'size': self.backend.size(),
+        }
+
+
+def build_fare_cache():
+    config = getattr(settings, 'FARE_QUOTE_CACHE', {})
+    bucket_seconds = config.get('BUCKET_SECONDS', 30)
+    if config.get('BACKEND', 'local') == 'django':
+        backend = DjangoFareCacheBackend(alias=config.get('CACHE_ALIAS', 'default'), timeout=bucket_seconds * 2)
+    else:
+        backend = LocalFareCacheBackend(max_entries=config.get('MAX_ENTRIES', 50000))
+    return FareQuoteCache(backend, bucket_seconds=bucket_seconds)
+
+
+fare_cache = build_fare_cache()
+schedule_generation.subscribe(fare_cache.clear)
@@ -0,0 +1,107 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .background import start_periodic_task
+from .fare_cache import fare_cache
+from .fare_history import fare_recorder
+from .inventory import lock_rows
+from .models import Flight
+from .pricing import compute_dynamic_fares, next_fare_change
+from .pricing_rules import pricing_rules
+
+logger = logging.getLogger(__name__)
+
+PRICING_FIELDS = (
+    'id', 'base_price', 'total_seats', 'oversell_seats', 'available_seats', 'departure_time', 'demand_factor',
+    'origin_key', 'destination_key',
+)
+FARE_FIELDS = ('current_fare', 'fare_valid_until', 'fare_rules_version')
+
+# Rules version whose outdated stored fares this process has already cleared.
+_swept_rules_version = None
+
+
+def has_current_fare(flight, now, rules_version) -> bool:
+    return (
+        flight.current_fare is not None
+        and flight.fare_rules_version == rules_version
+        and (flight.fare_valid_until is None or now < flight.fare_valid_until)
+    )
+
+
+def current_fares(flights, now=None):
+    # Fares for flights in order, read from Flight.current_fare.
+    flights = list(flights)
+    if now is None:
+        now = timezone.now()
+    version = pricing_rules.current().version
+
+    fares = [None] * len(flights)
+    stale = []
+    for i, flight in enumerate(flights):
+        if has_current_fare(flight, now, version):
+            fares[i] = flight.current_fare
+        else:
+            stale.append(i)
+
+    if stale:
+        for i, fare in zip(stale, fare_cache.get_fares([flights[i] for i in stale], now=now)):
+            fares[i] = fare
+    if len(stale) < len(flights):
+        fare_recorder.record_many(
+            ((f.id, f.current_fare, f.available_seats) for f in flights if has_current_fare(f, now, version)),
+            timestamp=now,
+        )
+    return fares
+
+
+def current_fare(flight, now=None):
+    return current_fares([flight], now=now)[0]
+
+
+def refresh_fares(now=None, batch_size=1000) -> int:
+    # Re-price the flights whose stored fare is stale and return how many were written.
+    global _swept_rules_version
+    now = now or timezone.now()
+    version = pricing_rules.current().version
+    if _swept_rules_version != version:
+        Flight.objects.filter(current_fare__isnull=False).exclude(fare_rules_version=version).update(current_fare=None)
+        _swept_rules_version = version
+    due = Flight.objects.filter(Q(current_fare__isnull=True) | Q(fare_valid_until__lte=now))
+    refreshed = 0
+
+    while True:
+        with transaction.atomic():
+            flights = list(lock_rows(due, skip_locked=True).only(*PRICING_FIELDS)[:batch_size])
+            if not flights:
+                break
+            for flight, fare in zip(flights, compute_dynamic_fares(flights, now=now)):
+                flight.current_fare = fare
+                flight.fare_valid_until = next_fare_change(
+                    flight.departure_time, now, route=(flight.origin_key, flight.destination_key),
+                )
+                flight.fare_rules_version = version
+            Flight.objects.bulk_update(flights, FARE_FIELDS, batch_size=500)
+
+        refreshed += len(flights)
+        if len(flights) < batch_size:
+            break
+
+    return refreshed
+
+
+def _refresh():
+    config = getattr(settings, 'FARE_GRID', {})
+    count = refresh_fares(batch_size=config.get('BATCH_SIZE', 1000))
+    if count:
+        logger.debug("Refreshed %d stored fare(s)", count)
+
+
+def start_fare_refresher():
+    # Refresh stale stored fares every FARE_GRID['REFRESH_INTERVAL'] seconds in this process.
+    interval = getattr(settings, 'FARE_GRID', {}).get('REFRESH_INTERVAL', 0)
+    return start_periodic_task('fare-refresher', interval, _refresh)
@@ -0,0 +1,167 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import FareHistory
+from .pricing import CENT
+
+logger = logging.getLogger(__name__)
+
+
+class FareHistoryRecorder:
+    # Buffers priced quotes and writes them to FareHistory in batches.
+
+    def __init__(self, buffer_size=500, flush_interval=5.0, enabled=True):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def record(self, flight_id, fare, seats_available, timestamp=None):
+        self.record_many([(flight_id, fare, seats_available)], timestamp=timestamp)
+
+    def record_many(self, samples, timestamp=None):
+        # samples: iterable of (flight_id, fare, seats_available).
+        if not self.enabled:
+            return
+        timestamp = timestamp or timezone.now()
+        with self._lock:
+            self._buffer.extend((flight_id, fare, seats, timestamp) for flight_id, fare, seats in samples)
+            full = len(self._buffer) >= self.buffer_size
+            if not full and self._timer is None and self.flush_interval:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if batch:
+            FareHistory.objects.bulk_create(
+                [
+                    FareHistory(flight_id=flight_id, fare=fare, seats_available=seats, timestamp=ts)
+                    for flight_id, fare, seats, ts in batch
+                ],
+                batch_size=1000,
+            )
+        return len(batch)
+
+    def pending(self):
+        return len(self._buffer)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Fare history flush failed")
+        finally:
+            close_old_connections()
+
+
+def build_recorder():
+    config = getattr(settings, 'FARE_HISTORY', {})
+    return FareHistoryRecorder(
+        buffer_size=config.get('BUFFER_SIZE', 500),
+        flush_interval=config.get('FLUSH_INTERVAL', 5.0),
+        enabled=config.get('ENABLED', True),
+    )
+
+
+fare_recorder = build_recorder()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        fare_recorder.flush()
+    except Exception:
+        pass
+
+
+def rollup_fare_history(older_than=timedelta(hours=24), now=None, window=timedelta(days=1)):
+    # Compact raw samples older than older_than into one row per flight-hour.
+    now = now or timezone.now()
+    cutoff = (now - older_than).replace(minute=0, second=0, microsecond=0)
+    raw = FareHistory.objects.filter(granularity=FareHistory.GRANULARITY_RAW)
+
+    removed = written = 0
+    start = raw.filter(timestamp__lt=cutoff).order_by('timestamp').values_list('timestamp', flat=True).first()
+    if start is None:
+        return removed, written
+    start = start.replace(minute=0, second=0, microsecond=0)
+
+    while start < cutoff:
+        end = min(start + window, cutoff)
+        with transaction.atomic():
+            samples = raw.filter(timestamp__gte=start, timestamp__lt=end)
+            buckets = {
+                (row['flight_id'], row['hour']): row
+                for row in samples.annotate(hour=TruncHour('timestamp'))
+                .values('flight_id', 'hour')
+                .annotate(
+                    fare_min=Min('fare'), fare_max=Max('fare'), fare_avg=Avg('fare'),
+                    seats=Min('seats_available'), count=Count('id'),
+                )
+            }
+            if buckets:
+                written += _write_rollups(buckets, start, end)
+                removed += samples.delete()[0]
+        start = end
+
+    return removed, written
+
+
+def _write_rollups(buckets, start, end):
+    existing = FareHistory.objects.filter(
+        granularity=FareHistory.GRANULARITY_HOUR,
+        timestamp__gte=start,
+        timestamp__lt=end,
+        flight_id__in={flight_id for flight_id, _ in buckets},
+    )
+    merged = defaultdict(list)
+    for row in existing:
+        key = (row.flight_id, row.timestamp)
+        if key in buckets:
+            merged[key].append(row)
+
+    rows = []
+    for (flight_id, hour), agg in buckets.items():
+        count = agg['count']
+        total = Decimal(str(agg['fare_avg'])) * count
+        fare_min, fare_max, seats = agg['fare_min'], agg['fare_max'], agg['seats']
+        for old in merged.get((flight_id, hour), ()):
+            total += old.fare * old.sample_count
+            count += old.sample_count
+            fare_min = min(fare_min, old.fare_min)
+            fare_max = max(fare_max, old.fare_max)
+            seats = min(seats, old.seats_available)
+        rows.append(FareHistory(
+            flight_id=flight_id,
+            timestamp=hour,
+            granularity=FareHistory.GRANULARITY_HOUR,
+            fare=(total / count).quantize(CENT),
+            fare_min=fare_min,
+            fare_max=fare_max,
+            seats_available=seats,
+            sample_count=count,
+        ))
+
+    FareHistory.objects.filter(id__in=[old.id for olds in merged.values() for old in olds]).delete()
+    FareHistory.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,119 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .background import start_periodic_task
+from .inventory import lock_rows, release_seats
+from .models import SeatHold
+from .seatmap import release_seat_labels
+
+logger = logging.getLogger(__name__)
+
+
+def hold_ttl() -> int:
+    return getattr(settings, 'SEAT_HOLD_TTL', 600)
+
+
+def create_hold(flight_id: int, seats: int, now=None, seat_numbers=()) -> SeatHold:
+    # Record seats already taken off available_seats by reserve_seats.
+    now = now or timezone.now()
+    return SeatHold.objects.create(
+        flight_id=flight_id,
+        seats=seats,
+        seat_numbers=','.join(seat_numbers),
+        expires_at=now + timedelta(seconds=hold_ttl()),
+    )
+
+
+def consume_hold(hold_id, flight_id: int, seats: int, now=None) -> bool:
+    # Atomically turn a live hold into a booking; False if it expired or was used.
+    now = now or timezone.now()
+    updated = SeatHold.objects.filter(
+        hold_id=hold_id,
+        flight_id=flight_id,
+        seats=seats,
+        status=SeatHold.STATUS_ACTIVE,
+        expires_at__gt=now,
+    ).update(status=SeatHold.STATUS_CONSUMED)
+    return updated == 1
+
+
+def consume_holds(hold_ids) -> set:
+    # Bulk orders consume their holds just before paying; only a hold the
+    # reaper already released is lost. Returns the ids that are now CONSUMED.
+    hold_ids = set(hold_ids)
+    holds = SeatHold.objects.filter(hold_id__in=hold_ids)
+    if holds.filter(status=SeatHold.STATUS_ACTIVE).update(status=SeatHold.STATUS_CONSUMED) == len(hold_ids):
+        return hold_ids
+    return set(holds.filter(status=SeatHold.STATUS_CONSUMED).values_list('hold_id', flat=True))
+
+
+def release_hold(hold_id, flight_id: int, seats: int, seat_numbers=(), status=SeatHold.STATUS_ACTIVE) -> bool:
+    # Give back a hold's seats and seat labels unless it was already released.
+    with transaction.atomic():
+        released = SeatHold.objects.filter(
+            hold_id=hold_id, flight_id=flight_id, seats=seats, status=status,
+        ).update(status=SeatHold.STATUS_RELEASED)
+        if released:
+            release_seats(flight_id, seats)
+            if seat_numbers:
+                release_seat_labels(flight_id, seat_numbers)
+    return released == 1
+
+
+def release_consumed_hold(hold_id, flight_id: int, seats: int) -> bool:
+    # The caller's quote names the flight and seat count, so no read is needed.
+    return release_hold(hold_id, flight_id, seats, status=SeatHold.STATUS_CONSUMED)
+
+
+def release_expired_holds(now=None, batch_size: int = 1000) -> dict:
+    # Return the seats of every expired hold to inventory.
+    now = now or timezone.now()
+    released_holds = 0
+    released_seats = 0
+
+    while True:
+        with transaction.atomic():
+            # Holds locked by another reaper or by a confirm in flight are left
+            # for the next pass rather than waited on.
+            rows = list(
+                lock_rows(SeatHold.objects.filter(status=SeatHold.STATUS_ACTIVE, expires_at__lte=now), skip_locked=True)
+                .values_list('id', 'flight_id', 'seats', 'seat_numbers')[:batch_size]
+            )
+            if not rows:
+                break
+
+            SeatHold.objects.filter(id__in=[r[0] for r in rows]).update(status=SeatHold.STATUS_RELEASED)
+
+            seats_by_flight = defaultdict(int)
+            labels_by_flight = defaultdict(list)
+            for _, flight_id, seats, seat_numbers in rows:
+                seats_by_flight[flight_id] += seats
+                if seat_numbers:
+                    labels_by_flight[flight_id].extend(seat_numbers.split(','))
+            for flight_id, seats in seats_by_flight.items():
+                release_seats(flight_id, seats)
+            for flight_id, labels in labels_by_flight.items():
+                release_seat_labels(flight_id, labels)
+
+        released_holds += len(rows)
+        released_seats += sum(seats_by_flight.values())
+        if len(rows) < batch_size:
+            break
+
+    return {'holds': released_holds, 'seats': released_seats}
+
+
+def _reap():
+    result = release_expired_holds()
+    if result['holds']:
+        logger.info("Released %(holds)d expired hold(s), %(seats)d seat(s)", result)
+
+
+def start_hold_reaper():
+    # Release expired holds every SEAT_HOLD_REAPER_INTERVAL seconds in this process.
+    return start_periodic_task('seat-hold-reaper', getattr(settings, 'SEAT_HOLD_REAPER_INTERVAL', 0), _reap)
@@ -0,0 +1,194 @@
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .inventory import lock_rows
+from .models import Flight, SeatMap, normalize_airport
+
+REQUIRED_FIELDS = ('flight_number', 'origin', 'destination', 'departure_time', 'arrival_time', 'base_price', 'total_seats')
+
+# Columns overwritten when a (flight_number, departure_time) row already exists.
+# Demand is live state and is left alone; seat availability is carried over
+# from the existing row (shifted when total_seats changes, see
+# carry_over_inventory); the stored fare is cleared so the fare refresher
+# re-prices the flight.
+UPDATE_FIELDS = (
+    'origin', 'destination', 'origin_key', 'destination_key', 'arrival_time', 'base_price', 'total_seats',
+    'available_seats', 'oversell_seats', 'current_fare', 'fare_valid_until',
+)
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(stream, fmt):
+    # Yield (line_number, dict) from a CSV or JSONL text stream without loading it.
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, RowError(f"invalid JSON: {exc}")
+                continue
+            yield line_number, row if isinstance(row, dict) else RowError("expected a JSON object")
+    else:
+        raise ValueError(f"Unknown format {fmt!r}")
+
+
+def _datetime(value, name):
+    try:
+        parsed = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise RowError(f"{name}: expected an ISO 8601 datetime")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def build_flight(row):
+    # Validate one input row and return an unsaved Flight; raises RowError.
+    if isinstance(row, RowError):
+        raise row
+    missing = [name for name in REQUIRED_FIELDS if row.get(name) in (None, '')]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+
+    departure = _datetime(row['departure_time'], 'departure_time')
+    arrival = _datetime(row['arrival_time'], 'arrival_time')
+    if arrival <= departure:
+        raise RowError("arrival_time must be after departure_time")
+    try:
+        base_price = Decimal(str(row['base_price'])).quantize(Decimal('0.01'))
+        total_seats = int(row['total_seats'])
+        available = row.get('available_seats')
+        available_seats = total_seats if available in (None, '') else int(available)
+        demand = row.get('demand_factor')
+        demand_factor = Flight._meta.get_field('demand_factor').default if demand in (None, '') else float(demand)
+    except (InvalidOperation, TypeError, ValueError) as exc:
+        raise RowError(f"invalid number: {exc}")
+    if base_price < 0:
+        raise RowError("base_price must be >= 0")
+    if total_seats <= 0:
+        raise RowError("total_seats must be > 0")
+    if not 0 <= available_seats <= total_seats:
+        raise RowError("available_seats must be between 0 and total_seats")
+
+    flight_number = str(row['flight_number']).strip().upper()
+    if len(flight_number) > Flight._meta.get_field('flight_number').max_length:
+        raise RowError("flight_number too long")
+    origin, destination = str(row['origin']).strip(), str(row['destination']).strip()
+    return Flight(
+        flight_number=flight_number,
+        origin=origin,
+        destination=destination,
+        origin_key=normalize_airport(origin),
+        destination_key=normalize_airport(destination),
+        departure_time=departure,
+        arrival_time=arrival,
+        base_price=base_price,
+        total_seats=total_seats,
+        available_seats=available_seats,
+        demand_factor=demand_factor,
+    )
+
+
+# Copies live seat state from existing rows onto the batch about to be upserted.
+# A capacity change shifts available_seats by the delta, scales the oversell
+# allowance and resizes the seat map; flights that would drop below the seats
+# already sold or assigned are returned as {key: error} and left untouched.
+def carry_over_inventory(flights) -> dict:
+    existing = lock_rows(Flight.objects.filter(
+        flight_number__in={number for number, _ in flights},
+        departure_time__in={departure for _, departure in flights},
+    )).values_list('id', 'flight_number', 'departure_time', 'total_seats', 'oversell_seats', 'available_seats')
+
+    errors = {}
+    resized = {}
+    for flight_id, number, departure, total, oversell, available in existing:
+        key = (number, departure)
+        flight = flights.get(key)
+        if flight is None:
+            continue
+        if flight.total_seats == total:
+            flight.oversell_seats, flight.available_seats = oversell, available
+            continue
+        sold = total + oversell - available
+        new_oversell = oversell * flight.total_seats // total
+        if flight.total_seats + new_oversell < sold:
+            errors[key] = f"total_seats {flight.total_seats} is below the {sold} seat(s) already sold"
+            continue
+        flight.oversell_seats = new_oversell
+        flight.available_seats = flight.total_seats + new_oversell - sold
+        resized[flight_id] = key
+
+    seat_maps = SeatMap.objects.filter(flight_id__in=resized).values_list('flight_id', 'occupied', 'version')
+    for flight_id, occupied, version in seat_maps:
+        key = resized[flight_id]
+        capacity = flights[key].total_seats
+        occupied = int.from_bytes(bytes(occupied), 'little')
+        if occupied >> capacity:
+            errors[key] = f"seats past row {capacity} are already assigned"
+            continue
+        updated = SeatMap.objects.filter(flight_id=flight_id, version=version).update(
+            capacity=capacity, occupied=occupied.to_bytes((capacity + 7) // 8, 'little'), version=version + 1,
+        )
+        if not updated:
+            errors[key] = "seat map busy, please retry"
+    return errors
+
+
+def import_flights(rows, batch_size=2000, dry_run=False, on_error=None, on_batch=None):
+    # Validate and upsert (line_number, row) pairs in batches of batch_size.
+    stats = {'rows': 0, 'written': 0, 'invalid': 0}
+    batch = {}
+    lines = {}
+
+    def flush():
+        if batch and not dry_run:
+            with transaction.atomic():
+                for key, error in carry_over_inventory(batch).items():
+                    del batch[key]
+                    stats['invalid'] += 1
+                    if on_error is not None:
+                        on_error(lines[key], error)
+                if batch:
+                    Flight.objects.bulk_create(
+                        list(batch.values()),
+                        update_conflicts=True,
+                        unique_fields=['flight_number', 'departure_time'],
+                        update_fields=UPDATE_FIELDS,
+                    )
+        stats['written'] += len(batch)
+        batch.clear()
+        lines.clear()
+        if on_batch is not None:
+            on_batch(stats)
+
+    for line_number, row in rows:
+        stats['rows'] += 1
+        try:
+            flight = build_flight(row)
+        except RowError as exc:
+            stats['invalid'] += 1
+            if on_error is not None:
+                on_error(line_number, str(exc))
+            continue
+        key = (flight.flight_number, flight.departure_time)
+        batch[key] = flight
+        lines[key] = line_number
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return stats
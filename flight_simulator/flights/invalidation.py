@@ -0,0 +1,92 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.models import F
+
+from .models import CacheGeneration
+
+
+class Generation:
+    # A counter row shared by every process. Writers that bypass the model
+    # signals (bulk imports) bump it; each process reads it at most every
+    # interval seconds and runs its subscribers' clear() when it moved.
+
+    def __init__(self, name, interval=2.0):
+        self.name = name
+        self.interval = interval
+        self._seen = None
+        self._checked_at = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def due(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.interval
+
+    def check(self) -> bool:
+        if not self.due():
+            return False
+        with self._lock:
+            if not self.due():
+                return False
+            value = CacheGeneration.objects.filter(name=self.name).values_list('value', flat=True).first() or 0
+            changed = self._seen is not None and value != self._seen
+            self._seen = value
+            self._checked_at = time.monotonic()
+        if changed:
+            self._notify()
+        return changed
+
+    def bump(self):
+        if not CacheGeneration.objects.filter(name=self.name).update(value=F('value') + 1):
+            CacheGeneration.objects.get_or_create(name=self.name, defaults={'value': 1})
+        self._notify()
+
+    def reset(self):
+        # Treat the caches as current as of now (tests, fresh workers).
+        with self._lock:
+            self._seen = None
+            self._checked_at = time.monotonic()
+
+    def _notify(self):
+        for callback in self._subscribers:
+            callback()
+
+
+def build_schedule_generation():
+    config = getattr(settings, 'CACHE_INVALIDATION', {})
+    return Generation('schedule', interval=config.get('CHECK_INTERVAL', 2.0))
+
+
+# Bumped when flights change outside the ORM signals; clears the route index,
+# connection index, fare cache and search cache in every process.
+schedule_generation = build_schedule_generation()
+
+
+class CacheGenerationMiddleware:
+    # Checks schedule_generation before each request (at most once per interval).
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        schedule_generation.check()
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if schedule_generation.due():
+            await sync_to_async(schedule_generation.check)()
+        return await self.get_response(request)
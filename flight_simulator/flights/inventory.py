@@ -0,0 +1,64 @@
+from django.db import connections, router
+from django.db.models import F
+
+from .fare_cache import fare_cache
+from .search_cache import search_cache
+from .metrics import timed
+from .models import Flight
+
+
+def can_return_from_update(connection) -> bool:
+    # UPDATE ... RETURNING is available on PostgreSQL and SQLite >= 3.35.
+    if connection.vendor == 'postgresql':
+        return True
+    # SQLite added RETURNING to INSERT and UPDATE in the same release.
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+def _reservable(flight_id, seats):
+    return Flight.objects.filter(id=flight_id, available_seats__gte=seats)
+
+
+def _invalidate(flight_id):
+    fare_cache.invalidate(flight_id)
+    search_cache.invalidate_flight(flight_id)
+
+
+@timed('reserve')
+def reserve_seats(flight_id: int, seats: int, fields=('id', 'available_seats')):
+    # Take seats off a flight and return it with only fields loaded; None if missing or short of seats.
+    alias = router.db_for_write(Flight)
+    connection = connections[alias]
+    if can_return_from_update(connection):
+        meta = Flight._meta
+        qn = connection.ops.quote_name
+        available = qn(meta.get_field('available_seats').column)
+        columns = ', '.join(qn(meta.get_field(name).column) for name in fields)
+        flight = next(iter(Flight.objects.db_manager(alias).raw(
+            f"UPDATE {qn(meta.db_table)} SET {available} = {available} - %s, "
+            f"{qn(meta.get_field('current_fare').column)} = NULL "
+            f"WHERE {qn(meta.pk.column)} = %s AND {available} >= %s RETURNING {columns}",
+            [seats, flight_id, seats],
+        )), None)
+    else:
+        updated = _reservable(flight_id, seats).update(
+            available_seats=F('available_seats') - seats, current_fare=None,
+        )
+        flight = Flight.objects.using(alias).only(*fields).get(id=flight_id) if updated else None
+    if flight is not None:
+        _invalidate(flight_id)
+    return flight
+
+
+def release_seats(flight_id: int, seats: int) -> None:
+    Flight.objects.filter(id=flight_id).update(available_seats=F('available_seats') + seats, current_fare=None)
+    _invalidate(flight_id)
+
+
+def lock_rows(queryset, skip_locked: bool = False):
+    # select_for_update with the lightest lock the backend offers.
+    features = connections[queryset.db].features
+    return queryset.select_for_update(
+        skip_locked=skip_locked and features.has_select_for_update_skip_locked,
+        no_key=features.has_select_for_no_key_update,
+    )
@@ -0,0 +1,199 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .fare_grid import current_fares
+from .invalidation import schedule_generation
+from .models import Flight, normalize_airport
+from .search_index import day_bounds
+
+Leg = namedtuple('Leg', 'id origin destination departure arrival')
+
+
+class SortedLegs:
+    # Legs ordered by departure timestamp, with bisect range lookups.
+
+    __slots__ = ('keys', 'legs')
+
+    def __init__(self):
+        self.keys = []
+        self.legs = []
+
+    def add(self, leg):
+        key = (leg.departure, leg.id)
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.legs.insert(i, leg)
+
+    def remove(self, leg):
+        i = bisect_left(self.keys, (leg.departure, leg.id))
+        if i < len(self.keys) and self.keys[i] == (leg.departure, leg.id):
+            del self.keys[i]
+            del self.legs[i]
+
+    def between(self, start, end):
+        # Legs departing in [start, end).
+        lo = bisect_left(self.keys, (start,))
+        hi = bisect_left(self.keys, (end,))
+        return self.legs[lo:hi]
+
+
+class ConnectionIndex:
+    # In-memory adjacency index of upcoming flights; kept current by signals, rebuilt every ttl seconds.
+
+    def __init__(self, horizon_days=365, ttl=300):
+        self.horizon_days = horizon_days
+        self.ttl = ttl
+        self._by_origin = {}
+        self._by_route = {}
+        self._legs = {}
+        self._built_at = None
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+
+    def _stale(self):
+        return self._built_at is None or time.monotonic() - self._built_at > self.ttl
+
+    def _ensure_built(self):
+        if not self._stale():
+            return
+        # Re-check under the lock so threads that queued behind a rebuild use it
+        # instead of each running their own.
+        with self._rebuild_lock:
+            if self._stale():
+                self.rebuild()
+
+    def rebuild(self):
+        now = timezone.now()
+        rows = Flight.objects.filter(
+            departure_time__gte=now - timedelta(days=1),
+            departure_time__lt=now + timedelta(days=self.horizon_days),
+        ).order_by('departure_time', 'id').values_list(
+            'id', 'origin_key', 'destination_key', 'departure_time', 'arrival_time',
+        )
+        by_origin, by_route, legs = {}, {}, {}
+        for flight_id, origin, destination, departure, arrival in rows.iterator(chunk_size=5000):
+            leg = Leg(flight_id, origin, destination, departure.timestamp(), arrival.timestamp())
+            legs[flight_id] = leg
+            # Rows arrive in (departure, id) order, so appending keeps both lists sorted.
+            for bucket in (by_origin.setdefault(origin, SortedLegs()), by_route.setdefault((origin, destination), SortedLegs())):
+                bucket.keys.append((leg.departure, leg.id))
+                bucket.legs.append(leg)
+        with self._lock:
+            self._by_origin, self._by_route, self._legs = by_origin, by_route, legs
+            self._built_at = time.monotonic()
+
+    def update_flight(self, flight):
+        # Re-index one saved flight (no-op until the index is first built).
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(flight.pk)
+            if flight.departure_time is None or flight.arrival_time is None:
+                return
+            leg = Leg(
+                flight.pk, normalize_airport(flight.origin), normalize_airport(flight.destination),
+                flight.departure_time.timestamp(), flight.arrival_time.timestamp(),
+            )
+            self._legs[leg.id] = leg
+            self._by_origin.setdefault(leg.origin, SortedLegs()).add(leg)
+            self._by_route.setdefault((leg.origin, leg.destination), SortedLegs()).add(leg)
+
+    def remove_flight(self, flight_id):
+        with self._lock:
+            self._remove(flight_id)
+
+    def _remove(self, flight_id):
+        leg = self._legs.pop(flight_id, None)
+        if leg is not None:
+            self._by_origin[leg.origin].remove(leg)
+            self._by_route[(leg.origin, leg.destination)].remove(leg)
+
+    def clear(self):
+        with self._lock:
+            self._by_origin, self._by_route, self._legs = {}, {}, {}
+            self._built_at = None
+
+    def connections(self, origin, destination, start, end, max_stops=2, min_layover=2700, max_layover=21600):
+        # Leg sequences origin -> destination, first leg departing in [start, end), layovers within bounds.
+        self._ensure_built()
+        origin, destination = normalize_airport(origin), normalize_airport(destination)
+        with self._lock:
+            by_origin, by_route = self._by_origin, self._by_route
+            empty = SortedLegs()
+            found = []
+            for first in by_origin.get(origin, empty).between(start, end):
+                if first.destination == destination:
+                    found.append((first,))
+                    continue
+                if max_stops < 1 or first.destination == origin:
+                    continue
+                window = (first.arrival + min_layover, first.arrival + max_layover)
+                for second in by_route.get((first.destination, destination), empty).between(*window):
+                    found.append((first, second))
+                if max_stops < 2:
+                    continue
+                for second in by_origin.get(first.destination, empty).between(*window):
+                    if second.destination in (origin, destination, first.destination):
+                        continue
+                    window2 = (second.arrival + min_layover, second.arrival + max_layover)
+                    for third in by_route.get((second.destination, destination), empty).between(*window2):
+                        found.append((first, second, third))
+            return found
+
+
+def build_connection_index():
+    config = getattr(settings, 'ITINERARY_SEARCH', {})
+    return ConnectionIndex(horizon_days=config.get('HORIZON_DAYS', 365), ttl=config.get('INDEX_TTL', 300))
+
+
+connection_index = build_connection_index()
+schedule_generation.subscribe(connection_index.clear)
+
+
+def search_itineraries(origin, destination, day, passengers=1, max_stops=None, min_layover=None,
+                       max_layover=None, sort='fare', limit=20):
+    # Priced itineraries for one direction of travel, best first.
+    config = getattr(settings, 'ITINERARY_SEARCH', {})
+    max_stops = config.get('MAX_STOPS', 2) if max_stops is None else max_stops
+    min_layover = timedelta(minutes=config.get('MIN_LAYOVER_MINUTES', 45) if min_layover is None else min_layover)
+    max_layover = timedelta(minutes=config.get('MAX_LAYOVER_MINUTES', 360) if max_layover is None else max_layover)
+
+    start, end = day_bounds(day)
+    candidates = connection_index.connections(
+        origin, destination, start.timestamp(), end.timestamp(),
+        max_stops=max_stops,
+        min_layover=min_layover.total_seconds(),
+        max_layover=max_layover.total_seconds(),
+    )
+    # Bound the pricing work: keep the quickest candidates.
+    max_candidates = config.get('MAX_CANDIDATES', 2000)
+    if len(candidates) > max_candidates:
+        candidates.sort(key=lambda legs: legs[-1].arrival - legs[0].departure)
+        del candidates[max_candidates:]
+
+    flight_ids = {leg.id for legs in candidates for leg in legs}
+    flights = Flight.objects.filter(id__in=flight_ids, available_seats__gte=passengers).in_bulk()
+    priced = list(flights.values())
+    fares = dict(zip((f.id for f in priced), current_fares(priced)))
+
+    itineraries = []
+    for legs in candidates:
+        if all(leg.id in flights for leg in legs):
+            itineraries.append({
+                'legs': [flights[leg.id] for leg in legs],
+                'fare': sum((fares[leg.id] for leg in legs), Decimal('0.00')),
+                'duration': legs[-1].arrival - legs[0].departure,
+            })
+
+    if sort == 'duration':
+        itineraries.sort(key=lambda it: (it['duration'], it['fare']))
+    else:
+        itineraries.sort(key=lambda it: (it['fare'], it['duration']))
+    return itineraries[:limit]
@@ -0,0 +1,103 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.utils import timezone
+
+from flights import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic catalog into a throwaway database, micro-benchmark pricing and "
+        "load-test the booking endpoints. Writes a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=10)
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--flights-per-day', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--pricing-sample', type=int, default=10000)
+        parser.add_argument('--scenarios', default=','.join(benchmarks.SCENARIOS))
+        parser.add_argument('--output', default=None, help="Report path (default: benchmark-<timestamp>.json).")
+        parser.add_argument('--compare', default=None, help="Previous report to check for regressions.")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Relative growth flagged as a regression.")
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='flight-bench-')
+        # File-backed so every load-generator thread sees the same database.
+        connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            report = self.run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        output = options['output'] or f"benchmark-{timezone.now():%Y%m%d-%H%M%S}.json"
+        Path(output).write_text(json.dumps(report, indent=2))
+        self.print_report(report)
+        self.stdout.write(f"Report written to {output}")
+
+        if options['compare']:
+            baseline = json.loads(Path(options['compare']).read_text())
+            regressions = benchmarks.compare(report, baseline, options['threshold'])
+            for r in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"REGRESSION {r['endpoint']} {r['metric']}: {r['baseline']:.2f} -> {r['current']:.2f}"
+                ))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS("No regressions against baseline"))
+
+    def run(self, options):
+        routes = benchmarks.seed_catalog(options['routes'], options['days'], options['flights_per_day'])
+        return {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'debug': settings.DEBUG,
+                'config': {k: options[k] for k in (
+                    'routes', 'days', 'flights_per_day', 'requests', 'concurrency', 'pricing_sample'
+                )},
+            },
+            'pricing': benchmarks.bench_pricing(options['pricing_sample']),
+            'endpoints': benchmarks.run_load(
+                routes, options['days'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                scenarios=[s for s in options['scenarios'].split(',') if s],
+            ),
+        }
+
+    def print_report(self, report):
+        pricing = report['pricing']
+        for name in ('scalar', 'batch', 'cache_hit'):
+            self.stdout.write(f"pricing {name:<10} {pricing[name]['per_fare_us']:8.2f} us/fare "
+                              f"{pricing[name]['fares_per_second']:12.0f} fares/s")
+        for name, result in report['endpoints'].items():
+            latency = result['latency_ms']
+            if not latency:
+                self.stdout.write(f"{name:<10} no requests")
+                continue
+            self.stdout.write(
+                f"{name:<10} p50 {latency['p50']:7.2f}ms  p95 {latency['p95']:7.2f}ms  p99 {latency['p99']:7.2f}ms  "
+                f"{result.get('throughput_rps', 0):7.1f} req/s  queries {result['queries']['mean']:.1f}  "
+                f"status {result['status_codes']}"
+            )
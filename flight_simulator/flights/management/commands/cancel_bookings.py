@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flights.cancellations import cancel_bookings, process_refunds
+from flights.models import Refund
+from flights.pnr import normalize_pnr
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel confirmed bookings for a flight and/or a PNR list, releasing seats "
+        "and queueing refunds in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flight', type=int, help="Cancel every confirmed booking on this flight id.")
+        parser.add_argument('--pnr', action='append', default=[], help="PNR to cancel (repeatable).")
+        parser.add_argument('--pnr-file', help="File with one PNR per line.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--process-refunds', action='store_true',
+            help="Send the queued refunds afterwards instead of leaving them to the background processor.",
+        )
+
+    def handle(self, *args, **options):
+        pnrs = [normalize_pnr(p) for p in options['pnr']]
+        if options['pnr_file']:
+            with open(options['pnr_file'], encoding='utf-8') as fh:
+                pnrs.extend(normalize_pnr(line) for line in fh if line.strip())
+        if options['flight'] is None and not pnrs:
+            raise CommandError("Pass --flight and/or --pnr/--pnr-file")
+
+        started = time.perf_counter()
+        result = cancel_bookings(
+            pnrs=pnrs or None,
+            flight_id=options['flight'],
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+        rate = result['bookings'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Cancelled {result['bookings']} booking(s) on {result['flights']} flight(s), "
+            f"released {result['seats']} seat(s), queued {result['refunds']} refund(s) "
+            f"in {elapsed:.2f}s ({rate:.0f} bookings/s)"
+        )
+
+        if options['process_refunds']:
+            refunded = failed = 0
+            while True:
+                outcome = process_refunds(batch_size=options['batch_size'])
+                refunded += outcome['refunded']
+                failed += outcome['failed']
+                if not outcome['refunded'] and not outcome['failed']:
+                    break
+            pending = Refund.objects.filter(status=Refund.STATUS_PENDING).count()
+            self.stdout.write(f"Refunds: {refunded} refunded, {failed} failed, {pending} pending retry")
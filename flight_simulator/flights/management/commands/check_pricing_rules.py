@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flights.pricing_rules import PricingRules
+
+# (hours to departure, seats left of 100, demand level)
+SAMPLES = ((720, 100, 0.5), (48, 50, 0.5), (3, 3, 0.9))
+
+
+class Command(BaseCommand):
+    help = "Validate a pricing rules JSON file and print sample multipliers (before floor/cap) under it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8') as fh:
+                rules = PricingRules(json.load(fh))
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Invalid pricing rules: {exc}")
+
+        self.stdout.write(f"Rules {rules.version} OK ({len(rules.routes)} route override(s))")
+        compiled = [('default', rules.default)] + [('-'.join(route), c) for route, c in rules.routes.items()]
+        for label, route_rules in compiled:
+            samples = ', '.join(
+                f"{hours}h/{seats} seats/demand {demand}: x{route_rules.multiplier(100, seats, hours, demand):.3f}"
+                for hours, seats, demand in SAMPLES
+            )
+            bounds = f"floor x{route_rules.floor}, cap x{route_rules.cap}"
+            self.stdout.write(f"  {label} ({bounds}): {samples}")
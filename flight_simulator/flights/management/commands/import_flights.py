@@ -0,0 +1,66 @@
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flights.importer import import_flights, read_rows
+from flights.invalidation import schedule_generation
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV or JSONL flight schedule into Flight, upserting on (flight_number, departure_time). "
+        "Columns: flight_number, origin, destination, departure_time, arrival_time, base_price, "
+        "total_seats[, available_seats, demand_factor]."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: from the file extension.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help="Validate only; write nothing.")
+        parser.add_argument('--max-errors', type=int, default=20, help="Invalid rows to print (all are counted).")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or Path(path).suffix.lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError("Cannot infer the format; pass --format csv or --format jsonl")
+
+        printed_errors = 0
+        started = time.perf_counter()
+
+        def on_error(line_number, message):
+            nonlocal printed_errors
+            if printed_errors < options['max_errors']:
+                self.stderr.write(f"line {line_number}: {message}")
+                printed_errors += 1
+
+        def on_batch(stats):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{stats['rows']} rows read, {stats['written']} upserted ({stats['rows'] / elapsed:.0f} rows/s)")
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            stats = import_flights(
+                read_rows(stream, fmt),
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+                on_error=on_error,
+                on_batch=on_batch,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if not options['dry_run']:
+            # bulk_create sends no signals; tell every process to drop its cached views of the schedule.
+            schedule_generation.bump()
+
+        elapsed = time.perf_counter() - started
+        verb = "validated" if options['dry_run'] else "upserted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['rows']} rows in {elapsed:.1f}s ({stats['rows'] / elapsed if elapsed else 0:.0f} rows/s): "
+            f"{stats['written']} {verb}, {stats['invalid']} invalid"
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from flights.fare_grid import refresh_fares
+
+
+class Command(BaseCommand):
+    help = "Re-price flights whose stored fare is stale (seat/demand change or new time-to-departure tier)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep running and refresh every N seconds (default: refresh once and exit).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = refresh_fares(batch_size=options['batch_size'])
+            self.stdout.write(f"Refreshed {count} fare(s)")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from flights.holds import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Return seats held by expired SeatHolds to inventory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep running and sweep every N seconds (default: sweep once and exit).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            result = release_expired_holds(batch_size=options['batch_size'])
+            self.stdout.write(f"Released {result['holds']} hold(s), {result['seats']} seat(s)")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
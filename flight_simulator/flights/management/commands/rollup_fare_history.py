@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from flights.fare_history import fare_recorder, rollup_fare_history
+
+
+class Command(BaseCommand):
+    help = "Compact raw FareHistory samples into hourly min/max/avg rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=float, default=24,
+            help="Only roll up samples older than this many hours (default: 24).",
+        )
+
+    def handle(self, *args, **options):
+        fare_recorder.flush()
+        removed, written = rollup_fare_history(older_than=timedelta(hours=options['older_than']))
+        self.stdout.write(f"Compacted {removed} raw sample(s) into {written} hourly row(s)")
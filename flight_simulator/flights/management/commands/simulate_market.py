@@ -0,0 +1,84 @@
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from flights.models import Flight
+from flights.simulation import MarketSimulation, np, write_fare_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay synthetic searches and bookings against the pricing rules on a virtual clock, "
+        "entirely in memory, then bulk-write the sampled fares to FareHistory."
+    )
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'MARKET_SIMULATION', {})
+        parser.add_argument('--start', help="Virtual start time (ISO 8601). Default: now.")
+        parser.add_argument('--days', type=float, default=30.0, help="Simulated days to run.")
+        parser.add_argument('--step-minutes', type=float, default=config.get('STEP_MINUTES', 15))
+        parser.add_argument('--sample-every', type=int, default=config.get('SAMPLE_EVERY', 4),
+                            help="Record fares every N ticks.")
+        parser.add_argument('--flights', type=int, default=0,
+                            help="Simulate at most N flights departing after the start (default: all).")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--searches-per-hour', type=float)
+        parser.add_argument('--conversion', type=float)
+        parser.add_argument('--elasticity', type=float)
+        parser.add_argument('--dry-run', action='store_true', help="Report results without writing FareHistory.")
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("simulate_market requires numpy")
+        if options['step_minutes'] <= 0:
+            raise CommandError("--step-minutes must be positive")
+        if options['sample_every'] <= 0:
+            raise CommandError("--sample-every must be positive")
+        if options['start']:
+            start = datetime.fromisoformat(options['start'])
+            if timezone.is_naive(start):
+                start = timezone.make_aware(start)
+        else:
+            start = timezone.now()
+        until = start + timedelta(days=options['days'])
+
+        catalog = Flight.objects.filter(departure_time__gt=start).order_by('departure_time', 'id').only(
+            'id', 'base_price', 'total_seats', 'oversell_seats', 'available_seats', 'departure_time', 'demand_factor',
+            'origin_key', 'destination_key',
+        )
+        if options['flights']:
+            catalog = catalog[:options['flights']]
+        flights = list(catalog.iterator(chunk_size=5000))
+        if not flights:
+            raise CommandError("No flights depart after the start time")
+
+        arrivals = {
+            key: options[name]
+            for key, name in (('SEARCHES_PER_HOUR', 'searches_per_hour'), ('CONVERSION', 'conversion'),
+                              ('ELASTICITY', 'elasticity'))
+            if options[name] is not None
+        }
+        simulation = MarketSimulation(
+            flights, start, step=timedelta(minutes=options['step_minutes']), seed=options['seed'], arrivals=arrivals,
+        )
+
+        started = time.perf_counter()
+        stats = simulation.run(until, sample_every=options['sample_every'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Simulated {len(flights)} flight(s) over {options['days']:g} day(s) in {stats['ticks']} ticks: "
+            f"{stats['searches']} searches, {stats['bookings']} bookings, revenue {stats['revenue']:.2f}, "
+            f"load factor {stats['load_factor']:.1%}"
+        )
+        rate = stats['bookings'] / elapsed if elapsed else 0
+        self.stdout.write(f"Wall time {elapsed:.2f}s ({rate:.0f} bookings/s)")
+
+        if options['dry_run']:
+            self.stdout.write(f"Dry run: {stats['samples']} fare sample(s) not written")
+            return
+        started = time.perf_counter()
+        written = write_fare_history(simulation)
+        self.stdout.write(f"Wrote {written} FareHistory row(s) in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,218 @@
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+class Histogram:
+    # Cumulative-bucket histogram keyed by a tuple of label values.
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        with self._lock:
+            return {labels: ([*counts], total, count) for labels, (counts, total, count) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.collect().items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, n in zip((*self.buckets, '+Inf'), counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}" for labels, value in values)
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _labels(names, values):
+    return ",".join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+
+
+REQUESTS = Counter('flights_http_requests_total', "HTTP requests by endpoint, method and status.",
+                   ('endpoint', 'method', 'status'))
+REQUEST_LATENCY = Histogram('flights_http_request_duration_seconds', "Time spent producing the response.",
+                            ('endpoint',))
+REQUEST_QUERIES = Histogram('flights_db_queries_per_request', "SQL queries issued per request.",
+                            ('endpoint',), buckets=QUERY_BUCKETS)
+REQUEST_DB_TIME = Histogram('flights_db_time_per_request_seconds', "Time spent in SQL per request.",
+                            ('endpoint',))
+STAGE_LATENCY = Histogram('flights_stage_duration_seconds', "Latency of instrumented hot-path calls.",
+                          ('stage',))
+
+METRICS = [REQUESTS, REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, STAGE_LATENCY]
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+# Set by the middleware for the duration of a request. asgiref copies the
+# context into sync_to_async threads, so queries run there are counted too.
+_current = contextvars.ContextVar('flights_request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - start
+        stats.queries += 1
+
+
+def instrument_connection(connection):
+    # Install the query recorder on a database connection (once).
+    if metrics_enabled() and record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def timed(stage):
+    # Decorator recording each call's duration in flights_stage_duration_seconds{stage=...}.
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    STAGE_LATENCY.observe(time.perf_counter() - start, stage)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    STAGE_LATENCY.observe(time.perf_counter() - start, stage)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    # Records per-endpoint latency, status and SQL query count/time.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    def start(self):
+        stats = RequestStats()
+        return stats, _current.set(stats), time.perf_counter()
+
+    def finish(self, request, response, stats, start):
+        elapsed = time.perf_counter() - start
+        match = request.resolver_match
+        endpoint = match.view_name if match else 'unmatched'
+        REQUESTS.inc(endpoint, request.method, response.status_code)
+        REQUEST_LATENCY.observe(elapsed, endpoint)
+        REQUEST_QUERIES.observe(stats.queries, endpoint)
+        REQUEST_DB_TIME.observe(stats.db_time, endpoint)
+
+
+def render_metrics(extra=()):
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    for metric in METRICS:
+        metric.clear()
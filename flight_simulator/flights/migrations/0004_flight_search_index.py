@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:47
+
+from django.db import migrations, models
+from django.db.models.functions import Trim, Upper
+
+
+def populate_route_keys(apps, schema_editor):
+    Flight = apps.get_model('flights', 'Flight')
+    Flight.objects.update(
+        origin_key=Upper(Trim('origin')),
+        destination_key=Upper(Trim('destination')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0003_passenger_booking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='destination_key',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='origin_key',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(populate_route_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['origin_key', 'destination_key', 'departure_time'], name='flight_route_departure_idx'),
+        ),
+    ]
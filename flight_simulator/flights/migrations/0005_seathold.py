@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:50
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_flight_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hold_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('seats', models.IntegerField()),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('CONSUMED', 'Consumed'), ('RELEASED', 'Released')], default='ACTIVE', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='flights.flight')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='seathold_status_expiry_idx')],
+            },
+        ),
+    ]
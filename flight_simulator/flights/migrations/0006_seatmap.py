@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0005_seathold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatMap',
+            fields=[
+                ('flight', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seat_map', serialize=False, to='flights.flight')),
+                ('capacity', models.IntegerField()),
+                ('occupied', models.BinaryField(default=b'')),
+                ('version', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='seat_number',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:54
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Lower, Trim
+
+
+def populate_email_normalized(apps, schema_editor):
+    Passenger = apps.get_model('flights', 'Passenger')
+    Passenger.objects.update(email_normalized=Coalesce(Lower(Trim('email')), Value('')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0006_seatmap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passenger',
+            name='email_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.RunPython(populate_email_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['passenger', '-created_at', '-id'], name='booking_passenger_recent_idx'),
+        ),
+    ]
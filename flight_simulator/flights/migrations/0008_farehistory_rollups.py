@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0007_booking_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farehistory',
+            name='fare_max',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='farehistory',
+            name='fare_min',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='farehistory',
+            name='granularity',
+            field=models.CharField(choices=[('RAW', 'Raw sample'), ('HOUR', 'Hourly rollup')], default='RAW', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='farehistory',
+            name='sample_count',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='farehistory',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='farehistory',
+            index=models.Index(fields=['flight', 'timestamp'], name='farehistory_flight_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='farehistory',
+            index=models.Index(fields=['granularity', 'timestamp'], name='farehistory_gran_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0008_farehistory_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PnrSequence',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0009_pnrsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='current_fare',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='fare_valid_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['fare_valid_until'], name='flight_fare_valid_until_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(condition=models.Q(('current_fare__isnull', True)), fields=['id'], name='flight_fare_stale_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0010_flight_current_fare'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='flight_number',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='flight',
+            constraint=models.UniqueConstraint(fields=('flight_number', 'departure_time'), name='flight_number_departure_uniq'),
+        ),
+    ]
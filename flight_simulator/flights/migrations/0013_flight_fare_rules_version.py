@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0012_refund'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='fare_rules_version',
+            field=models.CharField(default='', editable=False, max_length=12),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations, models
+
+
+def _normalize_phone(value):
+    value = (value or '').strip()
+    digits = ''.join(ch for ch in value if ch.isdigit())
+    return '+' + digits if digits and value.startswith('+') else digits
+
+
+def _normalize_name(first_name, last_name):
+    return ' '.join(f"{first_name or ''} {last_name or ''}".split()).casefold()
+
+
+def merge_duplicate_passengers(apps, schema_editor):
+    # Fill phone_normalized, then fold rows for the same person (same email,
+    # phone and name) into the oldest one. People who only share contact
+    # details (family members, agency clients) are left alone.
+    Passenger = apps.get_model('flights', 'Passenger')
+    Booking = apps.get_model('flights', 'Booking')
+
+    changed = []
+    for passenger in Passenger.objects.exclude(phone=None).exclude(phone='').only('id', 'phone').iterator(chunk_size=2000):
+        passenger.phone_normalized = _normalize_phone(passenger.phone)
+        changed.append(passenger)
+        if len(changed) >= 2000:
+            Passenger.objects.bulk_update(changed, ['phone_normalized'])
+            changed = []
+    Passenger.objects.bulk_update(changed, ['phone_normalized'])
+
+    keep = {}
+    duplicates = {}
+    rows = (
+        Passenger.objects.exclude(email_normalized='', phone_normalized='')
+        .order_by('id').values_list('id', 'email_normalized', 'phone_normalized', 'first_name', 'last_name')
+    )
+    for passenger_id, email, phone, first_name, last_name in rows.iterator(chunk_size=5000):
+        first = keep.setdefault((email, phone, _normalize_name(first_name, last_name)), passenger_id)
+        if first != passenger_id:
+            duplicates.setdefault(first, []).append(passenger_id)
+    for first, others in duplicates.items():
+        Booking.objects.filter(passenger_id__in=others).update(passenger_id=first)
+        Passenger.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0013_flight_fare_rules_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passenger',
+            name='phone_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(merge_duplicate_passengers, migrations.RunPython.noop),
+    ]
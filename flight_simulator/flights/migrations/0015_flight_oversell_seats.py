@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0014_passenger_identity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='oversell_seats',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0015_flight_oversell_seats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seathold',
+            name='seat_numbers',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0016_seathold_seat_numbers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='demand_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+def _normalize_name(first_name, last_name):
+    return ' '.join(f"{first_name or ''} {last_name or ''}".split()).casefold()
+
+
+def populate_names(apps, schema_editor):
+    Passenger = apps.get_model('flights', 'Passenger')
+    changed = []
+    for passenger in Passenger.objects.only('id', 'first_name', 'last_name').iterator(chunk_size=2000):
+        passenger.name_normalized = _normalize_name(passenger.first_name, passenger.last_name)
+        changed.append(passenger)
+        if len(changed) >= 2000:
+            Passenger.objects.bulk_update(changed, ['name_normalized'])
+            changed = []
+    Passenger.objects.bulk_update(changed, ['name_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0018_refund_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passenger',
+            name='name_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=201),
+        ),
+        migrations.RunPython(populate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='passenger',
+            constraint=models.UniqueConstraint(condition=models.Q(('email_normalized', ''), ('phone_normalized', ''), _negated=True), fields=('email_normalized', 'phone_normalized', 'name_normalized'), name='passenger_identity_uniq'),
+        ),
+    ]
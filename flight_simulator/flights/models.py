@@ -3,6 +3,7 @@ from django.db import models
 from django.utils import timezone
 
 class Flight(models.Model):
+    flight_number = models.CharField(max_length=10, null=True, blank=True)
     origin = models.CharField(max_length=50)
     destination = models.CharField(max_length=50)
     departure_time = models.DateTimeField()
@@ -11,9 +12,63 @@ class Flight(models.Model):
     total_seats = models.IntegerField(default=100)
     available_seats = models.IntegerField(default=100)
     demand_factor = models.FloatField(default=1.0)  
+    # When demand_factor was last written by flights.demand; it decays from there.
+    demand_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Seats sold beyond total_seats against expected no-shows (see
+    # flights.overbooking). available_seats counts down from the authorized
+    # capacity, total_seats + oversell_seats, so it goes negative only if the
+    # allowance is cut after those seats were sold.
+    oversell_seats = models.IntegerField(default=0, editable=False)
+
+    # Upper-cased copies of origin/destination used by the search index.
+    origin_key = models.CharField(max_length=50, default='', editable=False)
+    destination_key = models.CharField(max_length=50, default='', editable=False)
+
+    # Materialized fare (see flights.fare_grid). NULL means seats, demand or the
+    # flight itself changed since it was priced; fare_valid_until is when the
+    # next time-to-departure tier starts (NULL once the last tier is reached).
+    # fare_rules_version is the pricing rule set it was computed under.
+    current_fare = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    fare_valid_until = models.DateTimeField(null=True, blank=True, editable=False)
+    fare_rules_version = models.CharField(max_length=12, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['origin_key', 'destination_key', 'departure_time'], name='flight_route_departure_idx'),
+            models.Index(fields=['fare_valid_until'], name='flight_fare_valid_until_idx'),
+            models.Index(fields=['id'], condition=models.Q(current_fare__isnull=True), name='flight_fare_stale_idx'),
+        ]
+        constraints = [
+            # Natural key used by `manage.py import_flights` to upsert schedules.
+            models.UniqueConstraint(fields=['flight_number', 'departure_time'], name='flight_number_departure_uniq'),
+        ]
+
+    @property
+    def authorized_seats(self) -> int:
+        return self.total_seats + self.oversell_seats
 
     def __str__(self):
         return f"{self.origin} → {self.destination} ({self.departure_time.strftime('%Y-%m-%d %H:%M')})"
+
+    def save(self, *args, **kwargs):
+        self.origin_key = normalize_airport(self.origin)
+        self.destination_key = normalize_airport(self.destination)
+        self.current_fare = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'current_fare'}
+            if 'origin' in update_fields:
+                update_fields.add('origin_key')
+            if 'destination' in update_fields:
+                update_fields.add('destination_key')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+
+def normalize_airport(value) -> str:
+    return (value or '').strip().upper()
+
  ##------------------------------------------------------------   
 ## Milestone 3 additions
 ##---------------------------------------------------------------
@@ -23,10 +78,57 @@ class Passenger(models.Model):
     email = models.EmailField(null=True, blank=True)
     phone = models.CharField(max_length=20, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Lower-cased email used for indexed history lookups.
+    email_normalized = models.CharField(max_length=254, blank=True, default='', db_index=True, editable=False)
+    # Digits (and a leading +) of phone.
+    phone_normalized = models.CharField(max_length=20, blank=True, default='', editable=False)
+    # Case-folded "first last". A passenger is identified by (email_normalized,
+    # phone_normalized, name_normalized) so family members or agency clients
+    # sharing contact details stay separate; see flights.passengers.
+    name_normalized = models.CharField(max_length=201, blank=True, default='', editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['email_normalized', 'phone_normalized', 'name_normalized'],
+                condition=~models.Q(email_normalized='', phone_normalized=''),
+                name='passenger_identity_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        self.email_normalized = normalize_email(self.email)
+        self.phone_normalized = normalize_phone(self.phone)
+        self.name_normalized = normalize_name(self.first_name, self.last_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'email' in update_fields:
+                update_fields.add('email_normalized')
+            if 'phone' in update_fields:
+                update_fields.add('phone_normalized')
+            if update_fields & {'first_name', 'last_name'}:
+                update_fields.add('name_normalized')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+
+def normalize_email(value) -> str:
+    return (value or '').strip().lower()
+
+
+def normalize_phone(value) -> str:
+    value = (value or '').strip()
+    digits = ''.join(ch for ch in value if ch.isdigit())
+    return '+' + digits if digits and value.startswith('+') else digits
+
+
+def normalize_name(first_name, last_name) -> str:
+    return ' '.join(f"{first_name or ''} {last_name or ''}".split()).casefold()
+
 class Booking(models.Model):
     STATUS_PENDING = 'PENDING'    
     STATUS_CONFIRMED = 'CONFIRMED'
@@ -43,22 +145,137 @@ class Booking(models.Model):
     pnr = models.CharField(max_length=12, unique=True, db_index=True)
     flight = models.ForeignKey('Flight', on_delete=models.PROTECT, related_name='bookings')
     passenger = models.ForeignKey(Passenger, on_delete=models.CASCADE, related_name='bookings')
-    seat_number = models.CharField(max_length=10, null=True, blank=True)
+    seat_number = models.CharField(max_length=255, null=True, blank=True)
     booked_seats = models.IntegerField(default=1)   # number of seats held
     price_paid = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['passenger', '-created_at', '-id'], name='booking_passenger_recent_idx'),
+        ]
+
     def __str__(self):
         return f"PNR {self.pnr} - {self.flight.origin}->{self.flight.destination} ({self.status})"
 
 
+class Refund(models.Model):
+    STATUS_PENDING = 'PENDING'
+    STATUS_PROCESSING = 'PROCESSING'
+    STATUS_REFUNDED = 'REFUNDED'
+    STATUS_FAILED = 'FAILED'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_REFUNDED, 'Refunded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    booking = models.OneToOneField('Booking', on_delete=models.CASCADE, related_name='refund')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    transaction_id = models.CharField(max_length=32, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When a refund processor claimed the row; PROCESSING rows claimed longer
+    # than REFUNDS['CLAIM_TIMEOUT'] ago are picked up again.
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='refund_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Refund {self.amount} for booking {self.booking_id} ({self.status})"
+
+
+class CacheGeneration(models.Model):
+    # Shared invalidation counter for per-process caches; see flights.invalidation.
+    name = models.CharField(max_length=32, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class PnrSequence(models.Model):
+    # Next unreserved PNR sequence number; see flights.pnr.PnrAllocator.
+    name = models.CharField(max_length=32, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
 class FareHistory(models.Model):
+    GRANULARITY_RAW = 'RAW'
+    GRANULARITY_HOUR = 'HOUR'
+
+    GRANULARITY_CHOICES = [
+        (GRANULARITY_RAW, 'Raw sample'),
+        (GRANULARITY_HOUR, 'Hourly rollup'),
+    ]
+
     flight = models.ForeignKey('Flight', on_delete=models.CASCADE, related_name='fare_history')
-    timestamp = models.DateTimeField(auto_now_add=True)
-    fare = models.DecimalField(max_digits=10, decimal_places=2)
+    timestamp = models.DateTimeField(default=timezone.now)
+    fare = models.DecimalField(max_digits=10, decimal_places=2)  # average for rollups
     seats_available = models.IntegerField()
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES, default=GRANULARITY_RAW)
+    fare_min = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    fare_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    sample_count = models.IntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['flight', 'timestamp'], name='farehistory_flight_ts_idx'),
+            models.Index(fields=['granularity', 'timestamp'], name='farehistory_gran_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.flight} @ {self.timestamp}: {self.fare}"
+
+
+class SeatHold(models.Model):
+    STATUS_ACTIVE = 'ACTIVE'
+    STATUS_CONSUMED = 'CONSUMED'
+    STATUS_RELEASED = 'RELEASED'
+
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_CONSUMED, 'Consumed'),
+        (STATUS_RELEASED, 'Released'),
+    ]
+
+    hold_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    flight = models.ForeignKey('Flight', on_delete=models.CASCADE, related_name='holds')
+    seats = models.IntegerField()
+    # Comma-separated labels already taken on the seat map (bulk orders seat
+    # before paying), freed together with the seats when the hold is released.
+    seat_numbers = models.TextField(blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='seathold_status_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Hold {self.hold_id} - {self.seats} seat(s) on flight {self.flight_id} ({self.status})"
+
+
+class SeatMap(models.Model):
+    # Occupancy bitmap, bit i set = seat i assigned; see flights.seatmap.
+    flight = models.OneToOneField('Flight', on_delete=models.CASCADE, primary_key=True, related_name='seat_map')
+    capacity = models.IntegerField()
+    occupied = models.BinaryField(default=b'')
+    version = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Seat map for flight {self.flight_id} (v{self.version})"
@@ -0,0 +1,102 @@
+import logging
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, FloatField, IntegerField, Q, Sum, Value
+from django.db.models.functions import Cast, Floor
+from django.utils import timezone
+
+from .background import start_periodic_task
+from .models import Booking, Flight
+from .search_cache import search_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OVERBOOKING = {
+    'REFRESH_INTERVAL': 3600,
+    'LOOKBACK_DAYS': 90,
+    'MIN_SEATS': 200,
+    'MAX_FACTOR': 1.10,
+}
+
+LOST = (Booking.STATUS_CANCELLED, Booking.STATUS_FAILED)
+
+
+def overbooking_config() -> dict:
+    return dict(DEFAULT_OVERBOOKING, **getattr(settings, 'OVERBOOKING', {}))
+
+
+def oversell_factors(now=None) -> dict:
+    # {(origin_key, destination_key): factor} learned from departed flights.
+    config = overbooking_config()
+    now = now or timezone.now()
+    rows = (
+        Booking.objects.filter(
+            flight__departure_time__gte=now - timedelta(days=config['LOOKBACK_DAYS']),
+            flight__departure_time__lt=now,
+        )
+        .exclude(status=Booking.STATUS_PENDING)
+        .values_list('flight__origin_key', 'flight__destination_key')
+        .annotate(seats=Sum('booked_seats'), lost=Sum('booked_seats', filter=Q(status__in=LOST)))
+        .order_by()
+    )
+
+    factors = {}
+    for origin, destination, seats, lost in rows:
+        if not seats or seats < config['MIN_SEATS']:
+            continue
+        rate = (lost or 0) / seats
+        factor = config['MAX_FACTOR'] if rate >= 1 else min(config['MAX_FACTOR'], 1.0 / (1.0 - rate))
+        factor = math.floor(factor * 100 + 1e-9) / 100
+        if factor > 1.0:
+            factors[(origin, destination)] = factor
+    return factors
+
+
+def refresh_oversell(now=None) -> int:
+    # Move upcoming flights' oversell_seats to total_seats times their route factor; returns flights changed.
+    now = now or timezone.now()
+    routes_by_factor = defaultdict(list)
+    for route, factor in oversell_factors(now).items():
+        routes_by_factor[factor].append(route)
+
+    upcoming = Flight.objects.filter(departure_time__gt=now)
+    oversold = Q(pk__in=[])
+    changed = 0
+    for factor, routes in routes_by_factor.items():
+        on_routes = Q(pk__in=[])
+        for origin, destination in routes:
+            on_routes |= Q(origin_key=origin, destination_key=destination)
+        oversold |= on_routes
+        changed += _set_oversell(upcoming.filter(on_routes), factor - 1.0)
+    changed += _set_oversell(upcoming.exclude(oversold), 0.0)
+
+    if changed:
+        # Cached fares are keyed by available_seats, which moved with the
+        # allowance; cached search pages are not, so start those afresh.
+        search_cache.clear()
+    return changed
+
+
+def _set_oversell(flights, extra: float) -> int:
+    # The epsilon keeps e.g. 100 * 0.29 (28.999...) from flooring a seat short.
+    extra = Value(round(extra, 2) + 1e-9, output_field=FloatField())
+    target = Cast(Floor(F('total_seats') * extra), IntegerField())
+    return flights.exclude(oversell_seats=target).update(
+        available_seats=F('available_seats') + target - F('oversell_seats'),
+        oversell_seats=target,
+        current_fare=None,
+    )
+
+
+def _refresh():
+    count = refresh_oversell()
+    if count:
+        logger.info("Updated the oversell allowance of %d flight(s)", count)
+
+
+def start_oversell_refresher():
+    # Re-learn oversell factors every OVERBOOKING['REFRESH_INTERVAL'] seconds in this process.
+    return start_periodic_task('oversell-refresher', overbooking_config()['REFRESH_INTERVAL'], _refresh)
@@ -0,0 +1,146 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Passenger, normalize_email, normalize_name, normalize_phone
+
+
+def identity(details) -> tuple:
+    # Normalized (email, phone, name); details with neither email nor phone are never matched.
+    return (
+        normalize_email(details.get('email')),
+        normalize_phone(details.get('phone')),
+        normalize_name(details.get('first_name'), details.get('last_name')),
+    )
+
+
+def _anonymous(key):
+    return key[:2] == ('', '')
+
+
+def _new_passenger(details):
+    return Passenger(
+        first_name=details.get('first_name', ''),
+        last_name=details.get('last_name', ''),
+        email=details.get('email'),
+        phone=details.get('phone'),
+        email_normalized=normalize_email(details.get('email')),
+        phone_normalized=normalize_phone(details.get('phone')),
+        name_normalized=normalize_name(details.get('first_name'), details.get('last_name')),
+    )
+
+
+class PassengerResolver:
+    # Maps passenger details to a Passenger id, creating rows only for new customers; see identity().
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            passenger_id = self._ids.get(key)
+            if passenger_id is not None:
+                self._ids.move_to_end(key)
+            return passenger_id
+
+    def _remember(self, key, passenger_id):
+        with self._lock:
+            self._ids[key] = passenger_id
+            self._ids.move_to_end(key)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+
+    def _remember_after_commit(self, key, passenger_id, created):
+        # A row inserted by a transaction that rolls back must not be cached.
+        if created:
+            transaction.on_commit(lambda: self._remember(key, passenger_id))
+        else:
+            self._remember(key, passenger_id)
+
+    def resolve(self, details) -> int:
+        key = identity(details)
+        if _anonymous(key):
+            passenger = _new_passenger(details)
+            passenger.save()
+            return passenger.id
+
+        passenger_id = self._cached(key)
+        if passenger_id is None:
+            # get_or_create inserts inside a savepoint and re-reads on IntegrityError.
+            passenger, created = Passenger.objects.only('id').get_or_create(
+                email_normalized=key[0],
+                phone_normalized=key[1],
+                name_normalized=key[2],
+                defaults={
+                    'first_name': details.get('first_name', ''),
+                    'last_name': details.get('last_name', ''),
+                    'email': details.get('email'),
+                    'phone': details.get('phone'),
+                },
+            )
+            passenger_id = passenger.id
+            self._remember_after_commit(key, passenger_id, created)
+        return passenger_id
+
+    def resolve_many(self, details_list) -> list:
+        # Ids in order: one lookup, one bulk_create for new identities and one re-read of those.
+        keys = [identity(details) for details in details_list]
+        ids = {}
+        missing = {}
+        for key, details in zip(keys, details_list):
+            if _anonymous(key) or key in ids or key in missing:
+                continue
+            passenger_id = self._cached(key)
+            if passenger_id is not None:
+                ids[key] = passenger_id
+            else:
+                missing[key] = details
+
+        if missing:
+            ids.update(self._lookup(missing))
+            new = {key: details for key, details in missing.items() if key not in ids}
+            if new:
+                # Rows inserted concurrently are skipped here and picked up by the re-read.
+                Passenger.objects.bulk_create([_new_passenger(d) for d in new.values()], ignore_conflicts=True)
+                ids.update(self._lookup(new))
+            for key in missing:
+                self._remember_after_commit(key, ids[key], key in new)
+
+        anonymous = [details for key, details in zip(keys, details_list) if _anonymous(key)]
+        created = iter(Passenger.objects.bulk_create([_new_passenger(d) for d in anonymous]))
+        return [next(created).id if _anonymous(key) else ids[key] for key in keys]
+
+    def _lookup(self, keys):
+        query = Q()
+        for email, phone, name in keys:
+            query |= Q(email_normalized=email, phone_normalized=phone, name_normalized=name)
+        rows = Passenger.objects.filter(query).values_list(
+            'email_normalized', 'phone_normalized', 'name_normalized', 'id',
+        )
+        return {(email, phone, name): passenger_id for email, phone, name, passenger_id in rows}
+
+    def forget(self, passenger):
+        key = (passenger.email_normalized, passenger.phone_normalized, passenger.name_normalized)
+        with self._lock:
+            if self._ids.get(key) == passenger.pk:
+                del self._ids[key]
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def build_passenger_resolver():
+    config = getattr(settings, 'PASSENGER_LOOKUP', {})
+    return PassengerResolver(max_entries=config.get('CACHE_SIZE', 50000))
+
+
+passenger_resolver = build_passenger_resolver()
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import random
+import weakref
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .metrics import timed
+from .utils import simulate_payment
+
+logger = logging.getLogger(__name__)
+
+
+class TransientPaymentError(Exception):
+    # Raised by gateways for failures that are safe to retry (network, 5xx, ...).
+    pass
+
+
+class PaymentGateway:
+    # Async payment provider: charge() returns the simulate_payment dict; reference is an idempotency key.
+
+    async def charge(self, amount: Decimal, reference: str) -> dict:
+        raise NotImplementedError
+
+
+class SimulatedPaymentGateway(PaymentGateway):
+    # Local stand-in for a provider: sleeps latency (+/- jitter) seconds, then runs simulate_payment.
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, transient_failure_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.transient_failure_rate = transient_failure_rate
+        self._results = OrderedDict()
+
+    async def charge(self, amount, reference):
+        delay = max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if reference in self._results:
+            return self._results[reference]
+        if random.random() < self.transient_failure_rate:
+            raise TransientPaymentError("Simulated gateway error")
+        result = simulate_payment(amount)
+        self._results[reference] = result
+        if len(self._results) > 10000:
+            self._results.popitem(last=False)
+        return result
+
+
+class PaymentStage:
+    # Bounded-concurrency wrapper around a gateway.
+
+    def __init__(self, gateway, max_concurrency=100, timeout=5.0, retries=2, backoff=0.1):
+        self.gateway = gateway
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    @timed('payment')
+    async def charge(self, amount: Decimal, reference: str) -> dict:
+        async with self._semaphore():
+            for attempt in range(self.retries + 1):
+                try:
+                    return await asyncio.wait_for(self.gateway.charge(amount, reference), self.timeout)
+                except (asyncio.TimeoutError, TransientPaymentError) as exc:
+                    logger.warning("Payment attempt %d for %s failed: %r", attempt + 1, reference, exc)
+                    if attempt < self.retries:
+                        await asyncio.sleep(self.backoff * (2 ** attempt))
+        return {"success": False, "error": "Payment provider unavailable"}
+
+
+def build_payment_stage():
+    config = getattr(settings, 'PAYMENT_GATEWAY', {})
+    gateway_class = import_string(config.get('CLASS', 'flights.payments.SimulatedPaymentGateway'))
+    return PaymentStage(
+        gateway_class(**config.get('OPTIONS', {})),
+        max_concurrency=config.get('MAX_CONCURRENCY', 100),
+        timeout=config.get('TIMEOUT', 5.0),
+        retries=config.get('RETRIES', 2),
+        backoff=config.get('BACKOFF', 0.1),
+    )
+
+
+payment_stage = build_payment_stage()
@@ -0,0 +1,102 @@
+import re
+import secrets
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import PnrSequence
+
+# Crockford base32: no I, L, O or U, so PNRs survive being read out over the phone.
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_VALUES = {ch: i for i, ch in enumerate(ALPHABET)}
+_VALUES.update({'O': 0, 'I': 1, 'L': 1})
+
+PREFIX = 'PN'
+SEQUENCE_CHARS = 7   # 32**7 ~ 3.4e10 bookings
+RANDOM_CHARS = 2
+PNR_LENGTH = len(PREFIX) + SEQUENCE_CHARS + RANDOM_CHARS + 1
+
+# Bookings made before the allocator have PN + 8 random letters/digits and no
+# check character; they stay valid so their holders can still cancel them.
+LEGACY_PNR = re.compile(r'PN[A-Z0-9]{8}')
+
+
+def encode(value: int, width: int) -> str:
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    if value:
+        raise OverflowError("PNR sequence exhausted")
+    return ''.join(reversed(chars))
+
+
+def check_character(body: str) -> str:
+    # Luhn mod 32 check symbol: catches every single-character error and most transpositions.
+    total = 0
+    factor = 2
+    for ch in reversed(body):
+        addend = factor * _VALUES[ch]
+        total += addend // 32 + addend % 32
+        factor = 3 - factor
+    return ALPHABET[-total % 32]
+
+
+def normalize_pnr(value) -> str:
+    return (value or '').strip().upper()
+
+
+def is_valid_pnr(value) -> bool:
+    # True for well-formed allocator PNRs and legacy PNRs (see LEGACY_PNR).
+    pnr = normalize_pnr(value)
+    if len(pnr) != PNR_LENGTH:
+        return LEGACY_PNR.fullmatch(pnr) is not None
+    body = pnr[len(PREFIX):-1]
+    if not pnr.startswith(PREFIX) or any(ch not in _VALUES for ch in pnr[len(PREFIX):]):
+        return False
+    return _VALUES[check_character(body)] == _VALUES[pnr[-1]]
+
+
+class PnrAllocator:
+    # Hands out unique PNRs of the form PN + sequence + random + check.
+
+    def __init__(self, name='booking', block_size=1000):
+        self.name = name
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _reserve_block(self, size):
+        sequence = PnrSequence.objects.filter(name=self.name)
+        with transaction.atomic(durable=True):
+            if not sequence.update(next_value=F('next_value') + size):
+                try:
+                    with transaction.atomic():
+                        PnrSequence.objects.create(name=self.name, next_value=size)
+                except IntegrityError:
+                    sequence.update(next_value=F('next_value') + size)
+            end = sequence.values_list('next_value', flat=True).get()
+        return end - size, end
+
+    def allocate_many(self, count: int) -> list:
+        with self._lock:
+            if self._end - self._next < count:
+                start, end = self._reserve_block(max(count, self.block_size))
+                self._next, self._end = start, end
+            first = self._next
+            self._next += count
+        return [self.format(n) for n in range(first, first + count)]
+
+    def allocate(self) -> str:
+        return self.allocate_many(1)[0]
+
+    @staticmethod
+    def format(sequence: int) -> str:
+        body = encode(sequence, SEQUENCE_CHARS) + ''.join(secrets.choice(ALPHABET) for _ in range(RANDOM_CHARS))
+        return f"{PREFIX}{body}{check_character(body)}"
+
+
+pnr_allocator = PnrAllocator(block_size=getattr(settings, 'PNR_BLOCK_SIZE', 1000))
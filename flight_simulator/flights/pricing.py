@@ -1,60 +1,181 @@
 
 from decimal import Decimal, ROUND_HALF_UP
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils import timezone
 
+from .metrics import timed
+from .pricing_rules import pricing_rules
+
+try:
+    import numpy as np
+except ImportError:  # batch pricing falls back to the scalar path
+    np = None
+
+CENT = Decimal('0.01')
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+
 def compute_dynamic_fare(base_fare: Decimal,
                          total_seats: int,
                          seats_available: int,
                          departure: datetime,
-                         demand_level: float) -> Decimal:
-    
-
-    
-    if total_seats <= 0:
-        total_seats = 1
-    if seats_available < 0:
-        seats_available = 0
-    if demand_level < 0:
-        demand_level = 0.0
-    if demand_level > 1:
-        demand_level = 1.0
-
-    
-    now = timezone.now()
-    if departure.tzinfo:
-        now = now.astimezone(departure.tzinfo)
-    hours_to_departure = max((departure - now).total_seconds() / 3600.0, 0.0)
-
-    remaining_pct = seats_available / float(total_seats)
-
-    
-    if hours_to_departure > 168:      
-        time_mult = 1.0
-    elif hours_to_departure > 72:     
-        time_mult = 1.05
-    elif hours_to_departure > 24:     
-        time_mult = 1.20
-    elif hours_to_departure > 6:     
-        time_mult = 1.5
-    else:                             
-        time_mult = 2.0
-
-    
-    availability_mult = 1.0 + (1.0 - remaining_pct) ** 2 * 2.0
-
-    
-    demand_mult = 0.9 + demand_level * 1.1
-
-    multiplier = time_mult * availability_mult * demand_mult
-
-    if remaining_pct < 0.05:
-        multiplier *= 1.25
-
-    fare = (Decimal(base_fare) * Decimal(str(multiplier))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-    base = Decimal(base_fare).quantize(Decimal('0.01'))
-    if fare < base:
-        fare = base
+                         demand_level: float,
+                         now: datetime = None,
+                         route: tuple = None) -> Decimal:
+    # Fare for one flight under the active pricing rules (see pricing_rules).
+    if now is None:
+        now = timezone.now()
+    rules = pricing_rules.current().for_route(route)
+    multiplier = rules.multiplier(total_seats, seats_available, (departure - now).total_seconds() / 3600.0, demand_level)
+    return _apply_multiplier(base_fare, multiplier, rules)
+
+
+def _apply_multiplier(base_fare, multiplier: float, rules) -> Decimal:
+    # Shared by the scalar and batch paths so both round identically. Rounding
+    # is monotonic, so the floor/cap can only bind when the multiplier crosses them.
+    base = Decimal(base_fare)
+    fare = (base * Decimal(str(multiplier))).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    if rules.floor is not None and multiplier < rules.floor:
+        floor = (base * rules.floor_factor).quantize(CENT, rounding=ROUND_HALF_UP)
+        if fare < floor:
+            fare = floor
+    if rules.cap is not None and multiplier > rules.cap:
+        cap = (base * rules.cap_factor).quantize(CENT, rounding=ROUND_HALF_UP)
+        if fare > cap:
+            fare = cap
 
     return fare
+
+
+def round_fare_cents(cents, multipliers, rules):
+    # Vectorised _apply_multiplier in float cents: half-up rounding, then the
+    # rules' floor/cap where the multiplier crosses them.
+    rounded = np.floor(cents * multipliers + 0.5)
+    if rules.floor is not None:
+        rounded = np.where(multipliers < rules.floor, np.maximum(rounded, np.floor(cents * rules.floor + 0.5)), rounded)
+    if rules.cap is not None:
+        rounded = np.where(multipliers > rules.cap, np.minimum(rounded, np.floor(cents * rules.cap + 0.5)), rounded)
+    return rounded
+
+
+def _apply_multipliers(base_fares, multipliers, rules) -> list:
+    # _apply_multiplier over a batch without a Decimal multiply per fare.
+    cents = np.fromiter((Decimal(base).scaleb(2) for base in base_fares), dtype=np.float64, count=len(base_fares))
+    product = cents * multipliers
+    rounded = round_fare_cents(cents, multipliers, rules)
+    exact = (
+        (np.abs(product - np.floor(product) - 0.5) < 1e-6 + np.abs(product) * 1e-12)
+        | (cents != np.floor(cents))
+        | ~(multipliers > 0)
+        | ~np.isfinite(product)
+    )
+    if rules.floor is not None:
+        exact |= multipliers < rules.floor
+    if rules.cap is not None:
+        exact |= multipliers > rules.cap
+
+    fares = [Decimal(value).scaleb(-2) for value in np.where(exact, 0, rounded).astype(np.int64).tolist()]
+    for i in np.flatnonzero(exact).tolist():
+        fares[i] = _apply_multiplier(base_fares[i], float(multipliers[i]), rules)
+    return fares
+
+
+def compute_dynamic_fares_from_arrays(base_fares, total_seats, seats_available,
+                                      departures, demand_levels, now: datetime = None, routes=None) -> list:
+    # Price many flights against a single shared now.
+    if now is None:
+        now = timezone.now()
+    if routes is None:
+        routes = [None] * len(base_fares)
+
+    if np is None:
+        return [
+            compute_dynamic_fare(base, total, available, departure, demand, now=now, route=route)
+            for base, total, available, departure, demand, route
+            in zip(base_fares, total_seats, seats_available, departures, demand_levels, routes)
+        ]
+    if not len(base_fares):
+        return []
+
+    active = pricing_rules.current()
+
+    # timedelta.total_seconds() divides integer microseconds by 10**6; doing the
+    # same here keeps the float hours identical to the scalar path.
+    micros = np.fromiter(
+        ((departure - now) // _ONE_MICROSECOND for departure in departures),
+        dtype=np.int64,
+    )
+    hours = micros / 1e6 / 3600.0
+
+    if not active.routes:
+        rules = active.default
+        multipliers = rules.multipliers(total_seats, seats_available, hours, demand_levels)
+        return _apply_multipliers(base_fares, multipliers, rules)
+
+    groups = {}
+    for i, route in enumerate(routes):
+        rules = active.for_route(route)
+        groups.setdefault(id(rules), (rules, []))[1].append(i)
+
+    fares = [None] * len(base_fares)
+    base_fares = list(base_fares)
+    total_seats = np.asarray(total_seats)
+    seats_available = np.asarray(seats_available)
+    demand_levels = np.asarray(demand_levels, dtype=np.float64)
+    for rules, indexes in groups.values():
+        picked = np.asarray(indexes)
+        multipliers = rules.multipliers(total_seats[picked], seats_available[picked], hours[picked], demand_levels[picked])
+        for i, fare in zip(indexes, _apply_multipliers([base_fares[i] for i in indexes], multipliers, rules)):
+            fares[i] = fare
+    return fares
+
+
+@timed('pricing')
+def compute_dynamic_fares(flights, now: datetime = None) -> list:
+    # Batch compute_dynamic_fare for Flight objects, priced on their authorized capacity.
+    flights = list(flights)
+    return compute_dynamic_fares_from_arrays(
+        [f.base_price for f in flights],
+        [f.authorized_seats for f in flights],
+        [f.available_seats for f in flights],
+        [f.departure_time for f in flights],
+        [float(f.demand_factor) for f in flights],
+        now=now,
+        routes=[(f.origin_key, f.destination_key) for f in flights],
+    )
+
+
+def next_fare_change(departure: datetime, now: datetime = None, route: tuple = None):
+    # The instant the time multiplier for departure next changes, or None if it never will.
+    if now is None:
+        now = timezone.now()
+    return pricing_rules.current().for_route(route).next_change(departure, now)
+
+
+def iter_flight_fares(queryset, now: datetime = None, chunk_size: int = 5000):
+    # Stream (flight_id, fare) pairs for every flight in queryset.
+    if now is None:
+        now = timezone.now()
+
+    rows = queryset.values_list(
+        'id', 'base_price', 'total_seats', 'oversell_seats', 'available_seats', 'departure_time', 'demand_factor',
+        'origin_key', 'destination_key',
+    ).iterator(chunk_size=chunk_size)
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _price_rows(chunk, now)
+            chunk = []
+    if chunk:
+        yield from _price_rows(chunk, now)
+
+
+def _price_rows(rows, now):
+    ids, base, total, oversell, available, departures, demand, origins, destinations = zip(*rows)
+    fares = compute_dynamic_fares_from_arrays(
+        base, [t + o for t, o in zip(total, oversell)], available, departures, demand, now=now, routes=list(zip(origins, destinations)),
+    )
+    return zip(ids, fares)
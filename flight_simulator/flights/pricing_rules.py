@@ -0,0 +1,285 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+
+from .models import normalize_airport
+
+try:
+    import numpy as np
+except ImportError:  # batch evaluation falls back to the scalar path
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# The fare rules. A fare is
+#
+#     base_price * time * availability * demand [* scarcity]
+#
+# rounded to the cent and held between base_price * floor and base_price * cap.
+# ``time_to_departure`` buckets apply while more than ``hours`` remain (first
+# match wins, else ``otherwise``); availability is
+# ``1 + (1 - remaining) ** exponent * scale``; demand is ``base + level * slope``
+# with the level clamped to [0, 1]; scarcity applies below ``below`` remaining.
+# ``routes`` maps "ORIGIN-DESTINATION" to partial overrides of any section.
+DEFAULT_RULES = {
+    'time_to_departure': {
+        'buckets': [[168, 1.0], [72, 1.05], [24, 1.20], [6, 1.5]],
+        'otherwise': 2.0,
+    },
+    'availability': {'exponent': 2, 'scale': 2.0},
+    'scarcity': {'below': 0.05, 'multiplier': 1.25},
+    'demand': {'base': 0.9, 'slope': 1.1},
+    'floor': 1.0,
+    'cap': None,
+    'routes': {},
+}
+
+SECTIONS = ('time_to_departure', 'availability', 'scarcity', 'demand', 'floor', 'cap')
+MAX_CAPACITY_TABLES = 1024
+
+
+class PricingRulesError(ValueError):
+    pass
+
+
+def merge_rules(base, override):
+    # override on top of base; dict sections are merged one level deep.
+    merged = copy.deepcopy(base)
+    for name, value in override.items():
+        if name not in SECTIONS and name != 'routes':
+            raise PricingRulesError(f"unknown section {name!r}")
+        if isinstance(value, dict) and isinstance(merged.get(name), dict):
+            merged[name].update(value)
+        else:
+            merged[name] = value
+    return merged
+
+
+def _number(value, name, minimum=None):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise PricingRulesError(f"{name} must be a number")
+    if minimum is not None and value < minimum:
+        raise PricingRulesError(f"{name} must be >= {minimum}")
+    return float(value)
+
+
+def _power(x, exponent):
+    # Repeated multiplication for integer exponents keeps the table bit-identical
+    # to the historical ``s * s`` formula.
+    if exponent == int(exponent):
+        result = 1.0
+        for i in range(int(exponent)):
+            result = x if i == 0 else result * x
+        return result
+    return x ** exponent
+
+
+class CompiledRules:
+    # One route's rules as lookup tables.
+
+    def __init__(self, rules):
+        time_rules = rules['time_to_departure']
+        try:
+            buckets = sorted(
+                ((_number(h, 'time_to_departure hours', 0), _number(m, 'time_to_departure multiplier', 0))
+                 for h, m in time_rules['buckets']),
+                reverse=True,
+            )
+        except (KeyError, TypeError, ValueError) as exc:
+            if isinstance(exc, PricingRulesError):
+                raise
+            raise PricingRulesError("time_to_departure.buckets must be [[hours, multiplier], ...]")
+        # Ascending thresholds; bisect_left gives how many are strictly below the hours left.
+        self.thresholds = [h for h, _ in reversed(buckets)]
+        self.time_multipliers = [_number(time_rules.get('otherwise'), 'time_to_departure.otherwise', 0)]
+        self.time_multipliers += [m for _, m in reversed(buckets)]
+
+        availability = rules['availability']
+        self.exponent = _number(availability.get('exponent'), 'availability.exponent', 0)
+        self.scale = _number(availability.get('scale'), 'availability.scale')
+        scarcity = rules['scarcity']
+        self.scarcity_below = _number(scarcity.get('below'), 'scarcity.below', 0)
+        self.scarcity_multiplier = _number(scarcity.get('multiplier'), 'scarcity.multiplier', 0)
+        demand = rules['demand']
+        self.demand_base = _number(demand.get('base'), 'demand.base')
+        self.demand_slope = _number(demand.get('slope'), 'demand.slope')
+        self.floor = None if rules['floor'] is None else _number(rules['floor'], 'floor', 0)
+        self.cap = None if rules['cap'] is None else _number(rules['cap'], 'cap', 0)
+        if self.floor is not None and self.cap is not None and self.cap < self.floor:
+            raise PricingRulesError("cap must be >= floor")
+        self.floor_factor = None if self.floor is None else Decimal(str(self.floor))
+        self.cap_factor = None if self.cap is None else Decimal(str(self.cap))
+
+        self._tables = {}
+        self._np_tables = {}
+        if np is not None:
+            self._np_thresholds = np.asarray(self.thresholds, dtype=np.float64)
+            self._np_time_multipliers = np.asarray(self.time_multipliers, dtype=np.float64)
+
+    def _table(self, capacity):
+        table = self._tables.get(capacity)
+        if table is None:
+            if len(self._tables) >= MAX_CAPACITY_TABLES:
+                self._tables.clear()
+                self._np_tables.clear()
+            availability, scarcity = [], []
+            for seats in range(capacity + 1):
+                remaining = seats / float(capacity)
+                availability.append(1.0 + _power(1.0 - remaining, self.exponent) * self.scale)
+                scarcity.append(self.scarcity_multiplier if remaining < self.scarcity_below else 1.0)
+            table = self._tables[capacity] = (availability, scarcity)
+        return table
+
+    def multiplier(self, total_seats, seats_available, hours_to_departure, demand_level):
+        capacity = total_seats if total_seats > 0 else 1
+        seats = seats_available if seats_available > 0 else 0
+        if seats > capacity:
+            seats = capacity
+        if demand_level < 0:
+            demand_level = 0.0
+        elif demand_level > 1:
+            demand_level = 1.0
+        availability, scarcity = self._tables.get(capacity) or self._table(capacity)
+
+        # Thresholds are >= 0, so a departed flight bisects like hours == 0.
+        multiplier = (
+            self.time_multipliers[bisect_left(self.thresholds, hours_to_departure)]
+            * availability[seats]
+            * (self.demand_base + demand_level * self.demand_slope)
+        )
+        return multiplier * scarcity[seats]
+
+    def multipliers(self, total_seats, seats_available, hours_to_departure, demand_levels):
+        # Vectorised multiplier over equal-length sequences; returns a NumPy array.
+        capacity = np.maximum(np.asarray(total_seats, dtype=np.int64), 1)
+        seats = np.clip(np.asarray(seats_available, dtype=np.int64), 0, capacity)
+        demand = np.clip(np.asarray(demand_levels, dtype=np.float64), 0.0, 1.0)
+        hours = np.maximum(np.asarray(hours_to_departure, dtype=np.float64), 0.0)
+
+        # Gather from one concatenated table per distinct capacity in the batch.
+        capacities, inverse = np.unique(capacity, return_inverse=True)
+        tables = [self._np_table(int(c)) for c in capacities]
+        offsets = np.cumsum([0] + [len(t[0]) for t in tables[:-1]])
+        index = offsets[inverse] + seats
+        availability = np.concatenate([t[0] for t in tables])[index]
+        scarcity = np.concatenate([t[1] for t in tables])[index]
+
+        time_mult = self._np_time_multipliers[np.searchsorted(self._np_thresholds, hours, side='left')]
+        multiplier = time_mult * availability * (self.demand_base + demand * self.demand_slope)
+        return multiplier * scarcity
+
+    def _np_table(self, capacity):
+        table = self._np_tables.get(capacity)
+        if table is None:
+            availability, scarcity = self._table(capacity)
+            table = self._np_tables[capacity] = (
+                np.asarray(availability, dtype=np.float64), np.asarray(scarcity, dtype=np.float64),
+            )
+        return table
+
+    def next_change(self, departure, now):
+        # The instant the time multiplier for departure next changes, or None.
+        for hours in reversed(self.thresholds):
+            boundary = departure - timedelta(hours=hours)
+            if now < boundary:
+                return boundary
+        return None
+
+
+class PricingRules:
+    # Compiled default rules plus per-route overrides, identified by version.
+
+    def __init__(self, rules=None):
+        rules = merge_rules(DEFAULT_RULES, rules or {})
+        self.source = rules
+        self.version = hashlib.blake2b(
+            json.dumps(rules, sort_keys=True).encode(), digest_size=6,
+        ).hexdigest()
+        self.default = CompiledRules(rules)
+
+        routes = rules.get('routes') or {}
+        if not isinstance(routes, dict):
+            raise PricingRulesError("routes must be an object")
+        base = {name: rules[name] for name in SECTIONS}
+        self.routes = {}
+        for route, override in routes.items():
+            origin, sep, destination = route.partition('-')
+            if not sep or not origin.strip() or not destination.strip():
+                raise PricingRulesError(f"route {route!r} must look like 'ORIGIN-DESTINATION'")
+            if not isinstance(override, dict) or 'routes' in override:
+                raise PricingRulesError(f"route {route!r} must be an object of section overrides")
+            try:
+                compiled = CompiledRules(merge_rules(base, override))
+            except PricingRulesError as exc:
+                raise PricingRulesError(f"route {route}: {exc}")
+            self.routes[(normalize_airport(origin), normalize_airport(destination))] = compiled
+
+    def for_route(self, route=None):
+        if route is None or not self.routes:
+            return self.default
+        return self.routes.get(route, self.default)
+
+
+class PricingRuleSource:
+    # The active PricingRules for this process.
+
+    def __init__(self, path=None, check_interval=5, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self._rules = PricingRules()
+        self._stamp = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> PricingRules:
+        if self.path and self.clock() >= self._next_check:
+            self._check()
+        return self._rules
+
+    def _check(self):
+        with self._lock:
+            if self.clock() < self._next_check:
+                return
+            self._next_check = self.clock() + self.check_interval
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                logger.warning("Pricing rules file %s is unreadable; keeping rules %s", self.path, self._rules.version)
+                return
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp == self._stamp:
+                return
+            self._stamp = stamp
+            try:
+                with open(self.path, encoding='utf-8') as fh:
+                    rules = PricingRules(json.load(fh))
+            except (OSError, ValueError) as exc:
+                logger.error("Ignoring pricing rules file %s: %s", self.path, exc)
+                return
+            if rules.version != self._rules.version:
+                logger.info("Pricing rules %s loaded from %s", rules.version, self.path)
+            self._rules = rules
+
+    def load(self, rules=None):
+        # Replace the active rules with rules (a dict of overrides on DEFAULT_RULES).
+        with self._lock:
+            self._rules = PricingRules(rules)
+        return self._rules
+
+
+def build_rule_source():
+    config = getattr(settings, 'PRICING_RULES', {})
+    return PricingRuleSource(path=config.get('FILE'), check_interval=config.get('CHECK_INTERVAL', 5))
+
+
+pricing_rules = build_rule_source()
@@ -0,0 +1,64 @@
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core import signing
+
+QUOTE_SALT = 'flights.quote'
+
+
+class QuoteError(Exception):
+    status = 400
+
+
+class InvalidQuote(QuoteError):
+    status = 400
+
+
+class QuoteExpired(QuoteError):
+    status = 409
+
+
+@dataclass(frozen=True)
+class FareQuote:
+    flight_id: int
+    seats: int
+    price_per_seat: Decimal
+    hold_id: str
+    expires_at: int
+
+    @property
+    def total_price(self) -> Decimal:
+        return self.price_per_seat * self.seats
+
+
+def issue_quote(flight_id, seats, price_per_seat, hold) -> str:
+    # Sign a quote locking the price for the lifetime of hold; HMAC'd with SECRET_KEY.
+    payload = {
+        'f': flight_id,
+        's': seats,
+        'p': str(price_per_seat),
+        'h': str(hold.hold_id),
+        'e': int(hold.expires_at.timestamp()),
+    }
+    return signing.dumps(payload, salt=QUOTE_SALT, compress=True)
+
+
+def read_quote(token) -> FareQuote:
+    if not token or not isinstance(token, str):
+        raise InvalidQuote("quote_token required")
+    try:
+        payload = signing.loads(token, salt=QUOTE_SALT)
+        quote = FareQuote(
+            flight_id=int(payload['f']),
+            seats=int(payload['s']),
+            price_per_seat=Decimal(payload['p']),
+            hold_id=str(payload['h']),
+            expires_at=int(payload['e']),
+        )
+    except (signing.BadSignature, KeyError, TypeError, ValueError, ArithmeticError):
+        raise InvalidQuote("Invalid quote token")
+    if quote.expires_at <= time.time():
+        raise QuoteExpired("Quote expired, please begin the booking again")
+    return quote
+
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+
+from .invalidation import schedule_generation
+from .models import normalize_airport
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+class CachedSearch:
+    __slots__ = ('body', 'etag', 'flight_ids', 'expires_at', '_gzipped')
+
+    def __init__(self, body, flight_ids, expires_at):
+        self.body = body
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.flight_ids = flight_ids
+        self.expires_at = expires_at
+        self._gzipped = None
+
+    @property
+    def gzip_etag(self):
+        return self.etag[:-1] + '-gz"'
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzipped
+
+
+class SearchResponseCache:
+    # Encoded /flights/search/ responses keyed by normalized (origin, destination, day, passengers).
+
+    def __init__(self, max_entries=5000, ttl=10, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._keys_by_route = {}
+        self._route_by_flight = {}
+        self._flights_by_route = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(origin, destination, day, passengers):
+        return (normalize_airport(origin), normalize_airport(destination), day, passengers)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= self.clock():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, flight_ids, route_flight_ids):
+        entry = CachedSearch(body, flight_ids, self.clock() + self.ttl)
+        route = key[:3]
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._keys_by_route.setdefault(route, set()).add(key)
+            flights = self._flights_by_route.setdefault(route, set())
+            for flight_id in route_flight_ids:
+                previous = self._route_by_flight.get(flight_id)
+                if previous is not None and previous != route:
+                    self._flights_by_route.get(previous, set()).discard(flight_id)
+                self._route_by_flight[flight_id] = route
+                flights.add(flight_id)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+        return entry
+
+    def invalidate_flight(self, flight_id, flight=None):
+        # Drop responses for the route/day a flight is known on and, given the instance, its current one.
+        with self._lock:
+            route = self._route_by_flight.pop(flight_id, None)
+            if route is not None:
+                self._drop_route(route)
+            if flight is not None and flight.departure_time is not None:
+                day = timezone.localtime(flight.departure_time).date()
+                self._drop_route((normalize_airport(flight.origin), normalize_airport(flight.destination), day))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_route.clear()
+            self._route_by_flight.clear()
+            self._flights_by_route.clear()
+
+    def _drop_route(self, route):
+        for key in self._keys_by_route.pop(route, ()):
+            self._entries.pop(key, None)
+        self._forget_flights(route)
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        route = key[:3]
+        keys = self._keys_by_route.get(route)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_route[route]
+                self._forget_flights(route)
+
+    def _forget_flights(self, route):
+        # Once no response for the route/day is cached its flights need no mapping.
+        for flight_id in self._flights_by_route.pop(route, ()):
+            if self._route_by_flight.get(flight_id) == route:
+                del self._route_by_flight[flight_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def search_response(request, entry):
+    # JSON response for entry, honouring If-None-Match and gzip Accept-Encoding.
+    config = getattr(settings, 'SEARCH_RESPONSE_CACHE', {})
+    use_gzip = (
+        config.get('GZIP', True)
+        and len(entry.body) >= config.get('GZIP_MIN_BYTES', 1024)
+        and 'gzip' in request.headers.get('Accept-Encoding', '')
+    )
+    etag = entry.gzip_etag if use_gzip else entry.etag
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        if '*' in tags or entry.etag in tags or entry.gzip_etag in tags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return _finish(response)
+
+    if use_gzip:
+        response = HttpResponse(entry.gzipped(), content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(entry.body, content_type='application/json')
+    response['ETag'] = etag
+    return _finish(response)
+
+
+def _finish(response):
+    # Clients may store the response but must revalidate it on every use.
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def build_search_cache():
+    config = getattr(settings, 'SEARCH_RESPONSE_CACHE', {})
+    return SearchResponseCache(
+        max_entries=config.get('MAX_ENTRIES', 5000),
+        ttl=config.get('TTL', 10),
+    )
+
+
+search_cache = build_search_cache()
+schedule_generation.subscribe(search_cache.clear)
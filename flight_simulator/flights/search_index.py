@@ -0,0 +1,109 @@
+import threading
+import time as _time
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .invalidation import schedule_generation
+from .models import Flight, normalize_airport
+
+
+def day_bounds(day):
+    # Half-open [start, end) aware datetimes covering day in the current time zone.
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def route_day_queryset(origin, destination, day):
+    # Flights on a route for one day, served by flight_route_departure_idx.
+    start, end = day_bounds(day)
+    return Flight.objects.filter(
+        origin_key=normalize_airport(origin),
+        destination_key=normalize_airport(destination),
+        departure_time__gte=start,
+        departure_time__lt=end,
+    )
+
+
+class RouteDayIndex:
+    # In-process (origin, destination, day) -> flight ids map.
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_flight = {}
+        self._lock = threading.Lock()
+
+    def flight_ids(self, origin, destination, day):
+        key = (normalize_airport(origin), normalize_airport(destination), day)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > _time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        ids = tuple(
+            route_day_queryset(origin, destination, day)
+            .order_by('departure_time')
+            .values_list('id', flat=True)
+        )
+
+        with self._lock:
+            self._entries[key] = (ids, _time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            for flight_id in ids:
+                self._keys_by_flight[flight_id] = key
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        return ids
+
+    def invalidate_flight(self, flight):
+        # Drop the entries a flight used to belong to and the one it belongs to now.
+        with self._lock:
+            old_key = self._keys_by_flight.pop(flight.pk, None)
+            if old_key is not None:
+                self._drop(old_key)
+            if flight.departure_time is not None:
+                day = timezone.localtime(flight.departure_time).date()
+                self._drop((normalize_airport(flight.origin), normalize_airport(flight.destination), day))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_flight.clear()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        for flight_id in entry[0] if entry else ():
+            if self._keys_by_flight.get(flight_id) == key:
+                del self._keys_by_flight[flight_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+route_index = RouteDayIndex(
+    max_entries=getattr(settings, 'FLIGHT_SEARCH_INDEX_SIZE', 10000),
+    ttl=getattr(settings, 'FLIGHT_SEARCH_INDEX_TTL', 60),
+)
+schedule_generation.subscribe(route_index.clear)
+
+
+def route_flight_ids(origin, destination, day):
+    # Ids of every flight on a route/day, from the in-process index when enabled.
+    if getattr(settings, 'FLIGHT_SEARCH_INDEX_ENABLED', True):
+        return route_index.flight_ids(origin, destination, day)
+    return tuple(route_day_queryset(origin, destination, day).values_list('id', flat=True))
+
+
+def search_flights(origin, destination, day, passengers=1):
+    # Queryset of bookable flights for a route/day, using the in-process index when enabled.
+    if getattr(settings, 'FLIGHT_SEARCH_INDEX_ENABLED', True):
+        ids = route_index.flight_ids(origin, destination, day)
+        qs = Flight.objects.filter(id__in=ids)
+    else:
+        qs = route_day_queryset(origin, destination, day)
+    return qs.filter(available_seats__gte=passengers).order_by('departure_time')
@@ -0,0 +1,240 @@
+import random
+import re
+import time
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+
+from .inventory import lock_rows
+from .models import Flight, SeatMap
+
+SEAT_LETTERS = 'ABCDEFGHJK'
+SEAT_LABEL_RE = re.compile(r'^(\d+)([A-HJK])$')
+# Optimistic writes are retried with jittered exponential backoff; the last
+# attempt holds the seat map's row lock.
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.002
+
+DEFAULT_CABINS = [
+    ('First', 0.05),
+    ('Business', 0.10),
+    ('Premium Economy', 0.15),
+    ('Economy', 0.70),
+]
+
+
+class SeatMapError(Exception):
+    pass
+
+
+class SeatMapFull(SeatMapError):
+    pass
+
+
+class SeatMapConflict(SeatMapError):
+    pass
+
+
+def _config():
+    config = getattr(settings, 'SEAT_MAP', {})
+    seats_per_row = config.get('SEATS_PER_ROW', 6)
+    if not isinstance(seats_per_row, int) or not 1 <= seats_per_row <= len(SEAT_LETTERS):
+        raise ImproperlyConfigured(f"SEAT_MAP['SEATS_PER_ROW'] must be an integer from 1 to {len(SEAT_LETTERS)}")
+    return seats_per_row, tuple(config.get('CABINS', DEFAULT_CABINS))
+
+
+def check_config():
+    _config()
+
+
+class SeatLayout:
+    # Seat geometry for an aircraft with capacity seats.
+
+    def __init__(self, capacity, seats_per_row, cabins):
+        self.capacity = capacity
+        self.seats_per_row = seats_per_row
+        self.full_mask = (1 << capacity) - 1
+        rows = -(-capacity // seats_per_row)
+
+        self.cabin_masks = {}
+        start = 0
+        for position, (name, fraction) in enumerate(cabins):
+            end = rows if position == len(cabins) - 1 else min(rows, start + round(rows * fraction))
+            self.cabin_masks[name] = self._span(start * seats_per_row, end * seats_per_row)
+            start = end
+
+        # Bits where a run of n seats fits without crossing a row end or the last seat.
+        self._run_starts = [0] + [self._runs(length) for length in range(1, seats_per_row + 1)]
+
+    def _span(self, first, last):
+        last = min(last, self.capacity)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def _runs(self, length):
+        mask = 0
+        for row_start in range(0, self.capacity, self.seats_per_row):
+            mask |= self._span(row_start, row_start + self.seats_per_row - length + 1)
+        return mask & self._span(0, self.capacity - length + 1)
+
+    def run_starts(self, length):
+        return self._run_starts[length] if length < len(self._run_starts) else 0
+
+    def label(self, index):
+        return f"{index // self.seats_per_row + 1}{SEAT_LETTERS[index % self.seats_per_row]}"
+
+    def index(self, label):
+        match = SEAT_LABEL_RE.match(label.strip().upper())
+        if not match:
+            return None
+        column = SEAT_LETTERS.index(match.group(2))
+        index = (int(match.group(1)) - 1) * self.seats_per_row + column
+        if column >= self.seats_per_row or not 0 <= index < self.capacity:
+            return None
+        return index
+
+
+@lru_cache(maxsize=64)
+def _layout(capacity, seats_per_row, cabins):
+    return SeatLayout(capacity, seats_per_row, cabins)
+
+
+def get_layout(capacity):
+    seats_per_row, cabins = _config()
+    return _layout(capacity, seats_per_row, cabins)
+
+
+def _lowest_bits(mask, count):
+    bits = []
+    while mask and len(bits) < count:
+        low = mask & -mask
+        bits.append(low.bit_length() - 1)
+        mask ^= low
+    return bits
+
+
+def _adjacent_block(free, layout, count, within):
+    if count > layout.seats_per_row:
+        return None
+    runs = free
+    for offset in range(1, count):
+        runs &= free >> offset
+    runs &= layout.run_starts(count) & within
+    if not runs:
+        return None
+    first = (runs & -runs).bit_length() - 1
+    return list(range(first, first + count))
+
+
+def find_seats(occupied, layout, count, seat_class=None, adjacent=True):
+    # Pick count free seat indexes from an occupancy bitmap.
+    free = ~occupied & layout.full_mask
+    cabin = layout.cabin_masks.get(seat_class, 0) if seat_class else 0
+
+    if cabin:
+        if adjacent:
+            block = _adjacent_block(free, layout, count, cabin)
+            if block:
+                return block
+        seats = _lowest_bits(free & cabin, count)
+        if len(seats) == count:
+            return seats
+
+    if adjacent:
+        block = _adjacent_block(free, layout, count, layout.full_mask)
+        if block:
+            return block
+
+    preferred = _lowest_bits(free & cabin, count) if cabin else []
+    seats = preferred + _lowest_bits(free & ~cabin, count - len(preferred))
+    return sorted(seats) if len(seats) == count else None
+
+
+def _load(flight_id):
+    row = SeatMap.objects.filter(flight_id=flight_id).values_list('capacity', 'occupied', 'version').first()
+    if row is not None:
+        return row[0], int.from_bytes(bytes(row[1]), 'little'), row[2]
+
+    capacity = Flight.objects.filter(id=flight_id).values_list('total_seats', flat=True).first()
+    if capacity is None:
+        raise SeatMapError("Flight not found")
+    try:
+        with transaction.atomic():
+            SeatMap.objects.create(flight_id=flight_id, capacity=capacity, occupied=b'', version=0)
+    except IntegrityError:
+        return _load(flight_id)
+    return capacity, 0, 0
+
+
+def _store(flight_id, version, occupied, capacity):
+    # Conditional write: only succeeds if nobody changed the map since it was read.
+    return SeatMap.objects.filter(flight_id=flight_id, version=version).update(
+        occupied=occupied.to_bytes((capacity + 7) // 8, 'little'),
+        version=version + 1,
+    ) == 1
+
+
+def _oversells(flight_id):
+    return Flight.objects.filter(id=flight_id, oversell_seats__gt=0).exists()
+
+
+@contextmanager
+def _locked(flight_id):
+    with transaction.atomic():
+        list(lock_rows(SeatMap.objects.filter(flight_id=flight_id)).values_list('flight_id', flat=True))
+        yield
+
+
+def _attempts(flight_id):
+    for attempt in range(MAX_ATTEMPTS - 1):
+        if attempt:
+            time.sleep(random.uniform(0, BACKOFF_SECONDS * 2 ** attempt))
+        yield nullcontext()
+    yield _locked(flight_id)
+
+
+def allocate_seats(flight_id, count, seat_class=None, adjacent=True, allow_unassigned=False):
+    # Atomically assign count seats on a flight and return their labels.
+    oversells = None
+    for attempt in _attempts(flight_id):
+        with attempt:
+            capacity, occupied, version = _load(flight_id)
+            layout = get_layout(capacity)
+            seats = find_seats(occupied, layout, count, seat_class=seat_class, adjacent=adjacent)
+            if seats is None:
+                # A flight sold past its cabin under an oversell allowance gets the
+                # free seats; the rest are assigned at check-in.
+                if oversells is None:
+                    oversells = allow_unassigned and _oversells(flight_id)
+                if not oversells:
+                    raise SeatMapFull("No seats left to assign")
+                seats = _lowest_bits(~occupied & layout.full_mask, count)
+                if not seats:
+                    return []
+            for seat in seats:
+                occupied |= 1 << seat
+            if _store(flight_id, version, occupied, capacity):
+                return [layout.label(seat) for seat in seats]
+    raise SeatMapConflict("Seat map busy, please retry")
+
+
+def release_seat_labels(flight_id, labels):
+    # Free previously assigned seats; labels that don't map to a seat are ignored.
+    for attempt in _attempts(flight_id):
+        with attempt:
+            row = SeatMap.objects.filter(flight_id=flight_id).values_list('capacity', 'occupied', 'version').first()
+            if row is None:
+                return
+            capacity, occupied, version = row[0], int.from_bytes(bytes(row[1]), 'little'), row[2]
+            layout = get_layout(capacity)
+            for label in labels:
+                index = layout.index(label)
+                if index is not None:
+                    occupied &= ~(1 << index)
+            if _store(flight_id, version, occupied, capacity):
+                return
+    raise SeatMapConflict("Seat map busy, please retry")
@@ -0,0 +1,46 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .fare_cache import fare_cache
+from .itinerary import connection_index
+from .metrics import instrument_connection
+from .models import Flight, Passenger
+from .passengers import passenger_resolver
+from .search_cache import search_cache
+from .search_index import route_index
+
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+def invalidate_flight_caches(sender, instance, **kwargs):
+    route_index.invalidate_flight(instance)
+    fare_cache.invalidate(instance.pk)
+    search_cache.invalidate_flight(instance.pk, instance)
+
+
+@receiver(post_save, sender=Flight)
+def index_flight_connections(sender, instance, **kwargs):
+    connection_index.update_flight(instance)
+
+
+@receiver(post_delete, sender=Flight)
+def unindex_flight_connections(sender, instance, **kwargs):
+    connection_index.remove_flight(instance.pk)
+
+
+@receiver(post_delete, sender=Passenger)
+def forget_passenger(sender, instance, **kwargs):
+    passenger_resolver.forget(instance)
+
+
+@receiver(post_save, sender=Passenger)
+def reset_passenger_lookup(sender, instance, created, **kwargs):
+    # The previous identity of an edited passenger is unknown here.
+    if not created:
+        passenger_resolver.clear()
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument_connection(connection)
@@ -0,0 +1,162 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .demand import CONFIRM, HOLD, SEARCH, build_demand_engine
+from .models import FareHistory
+from .pricing import round_fare_cents
+from .pricing_rules import pricing_rules
+
+try:
+    import numpy as np
+except ImportError:  # the simulator needs numpy; see MarketSimulation
+    np = None
+
+DEFAULT_ARRIVALS = {
+    # Searches per flight per hour far from departure, rising by up to
+    # PEAK_MULTIPLIER times as departure nears (e-folding over PEAK_HOURS).
+    'SEARCHES_PER_HOUR': 0.5,
+    'PEAK_MULTIPLIER': 6.0,
+    'PEAK_HOURS': 72.0,
+    # Probability a search books at the base fare; scaled by
+    # (fare / base_price) ** -ELASTICITY as the fare moves.
+    'CONVERSION': 0.12,
+    'ELASTICITY': 1.5,
+}
+
+
+def arrival_model():
+    return dict(DEFAULT_ARRIVALS, **getattr(settings, 'MARKET_SIMULATION', {}).get('ARRIVALS', {}))
+
+
+class VirtualClock:
+    # Simulated time: now() only moves when advance is called.
+
+    def __init__(self, start, step):
+        self.start = start
+        self.step = step
+        self.ticks = 0
+
+    def now(self):
+        return self.start + self.step * self.ticks
+
+    def timestamp(self):
+        return self.start.timestamp() + self.step.total_seconds() * self.ticks
+
+    def advance(self):
+        self.ticks += 1
+
+
+class MarketSimulation:
+    # Replays simulated searches and bookings against the pricing rules in memory, faster than real time.
+
+    def __init__(self, flights, start, step=timedelta(minutes=15), seed=None, arrivals=None, demand=None):
+        if np is None:
+            raise RuntimeError("The market simulator requires numpy")
+        flights = list(flights)
+        self.clock = VirtualClock(start, step)
+        self.rng = np.random.default_rng(seed)
+        self.arrivals = dict(arrival_model(), **(arrivals or {}))
+        self.demand = demand or build_demand_engine()
+
+        self.ids = np.array([f.id for f in flights], dtype=np.int64)
+        self.base = np.array([float(f.base_price) for f in flights], dtype=np.float64)
+        self.total = np.array([f.authorized_seats for f in flights], dtype=np.int64)
+        self.available = np.array([max(f.available_seats, 0) for f in flights], dtype=np.int64)
+        self.departure = np.array([f.departure_time.timestamp() for f in flights], dtype=np.float64)
+        self.level = np.clip(np.array([float(f.demand_factor) for f in flights], dtype=np.float64), 0.0, 1.0)
+        # Invert the engine's level curve so demand starts where the catalog has it.
+        self.score = np.array([self.demand.score_for_level(level) for level in self.level.tolist()], dtype=np.float64)
+
+        rules = pricing_rules.current()
+        groups = {}
+        for i, f in enumerate(flights):
+            compiled = rules.for_route((f.origin_key, f.destination_key))
+            groups.setdefault(id(compiled), (compiled, []))[1].append(i)
+        self.groups = [(compiled, np.asarray(indexes, dtype=np.int64)) for compiled, indexes in groups.values()]
+
+        self.stats = {'ticks': 0, 'searches': 0, 'bookings': 0, 'revenue': 0.0}
+        self._samples = []
+
+    def fares(self, now_ts):
+        # Fares for every flight at now_ts (float, to the cent) under the compiled rules.
+        hours = (self.departure - now_ts) / 3600.0
+        fares = np.empty_like(self.base)
+        for compiled, idx in self.groups:
+            multipliers = compiled.multipliers(self.total[idx], self.available[idx], hours[idx], self.level[idx])
+            fares[idx] = round_fare_cents(self.base[idx] * 100.0, multipliers, compiled) / 100.0
+        return fares
+
+    def tick(self, sample=False):
+        now_ts = self.clock.timestamp()
+        step_hours = self.clock.step.total_seconds() / 3600.0
+        hours = (self.departure - now_ts) / 3600.0
+        selling = (hours > 0) & (self.available > 0)
+        fares = self.fares(now_ts)
+
+        if sample:
+            self._samples.append((now_ts, self.ids[selling], fares[selling], self.available[selling]))
+
+        a = self.arrivals
+        rate = a['SEARCHES_PER_HOUR'] * (1.0 + a['PEAK_MULTIPLIER'] * np.exp(-np.maximum(hours, 0.0) / a['PEAK_HOURS']))
+        searches = self.rng.poisson(rate * step_hours * selling)
+        relative = np.divide(fares, self.base, out=np.ones_like(fares), where=self.base > 0)
+        conversion = np.clip(a['CONVERSION'] * relative ** -a['ELASTICITY'], 0.0, 1.0)
+        bookings = np.minimum(self.rng.binomial(searches, conversion), self.available)
+        self.available -= bookings
+
+        weights = self.demand.weights
+        decay = math.exp(-self.demand.decay_rate * self.clock.step.total_seconds())
+        self.score = self.score * decay + weights[SEARCH] * searches + (weights[HOLD] + weights[CONFIRM]) * bookings
+        self.level = self.demand.baseline + (1.0 - self.demand.baseline) * self.score / (self.score + self.demand.saturation)
+
+        self.stats['ticks'] += 1
+        self.stats['searches'] += int(searches.sum())
+        self.stats['bookings'] += int(bookings.sum())
+        self.stats['revenue'] += float((bookings * fares).sum())
+        self.clock.advance()
+
+    def run(self, until, sample_every=4, on_progress=None):
+        # Tick until the virtual clock reaches until; returns stats.
+        until_ts = until.timestamp()
+        while self.clock.timestamp() < until_ts:
+            self.tick(sample=self.clock.ticks % sample_every == 0)
+            if on_progress is not None and self.clock.ticks % 1000 == 0:
+                on_progress(self)
+        seats = int(self.total.sum())
+        self.stats['load_factor'] = 1.0 - float(self.available.sum()) / seats if seats else 0.0
+        self.stats['samples'] = sum(len(ids) for _, ids, _, _ in self._samples)
+        return self.stats
+
+    def fare_history(self):
+        # The sampled fares as unsaved raw FareHistory rows.
+        for now_ts, ids, fares, available in self._samples:
+            timestamp = datetime.fromtimestamp(now_ts, tz=dt_timezone.utc)
+            cents = np.rint(fares * 100.0).astype(np.int64).tolist()
+            for flight_id, fare_cents, seats in zip(ids.tolist(), cents, available.tolist()):
+                yield FareHistory(
+                    flight_id=flight_id,
+                    timestamp=timestamp,
+                    fare=Decimal(fare_cents).scaleb(-2),
+                    seats_available=seats,
+                )
+
+
+def write_fare_history(simulation, batch_size=5000) -> int:
+    # Bulk-insert the simulation's samples in one transaction; returns the row count.
+    written = 0
+    batch = []
+    with transaction.atomic():
+        for row in simulation.fare_history():
+            batch.append(row)
+            if len(batch) >= batch_size:
+                FareHistory.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            FareHistory.objects.bulk_create(batch)
+            written += len(batch)
+    return written
@@ -1,3 +1,1520 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import random
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import bulk_booking, seatmap
+from .benchmarks import compare, run_load, seed_catalog
+from .cancellations import cancel_bookings, process_refunds
+from .holds import release_consumed_hold, release_expired_holds
+from .inventory import can_return_from_update, reserve_seats
+from .invalidation import Generation, schedule_generation
+from .itinerary import ConnectionIndex, connection_index
+from .overbooking import oversell_factors, refresh_oversell
+from .metrics import REQUEST_QUERIES, STAGE_LATENCY, reset_metrics
+from .passengers import PassengerResolver, passenger_resolver
+from .models import Booking, FareHistory, Flight, Passenger, Refund, SeatHold, SeatMap
+from .pnr import ALPHABET, PNR_LENGTH, PnrAllocator, is_valid_pnr, pnr_allocator
+from .payments import PaymentGateway, PaymentStage, TransientPaymentError
+from .pricing import (
+    _apply_multiplier, _apply_multipliers, compute_dynamic_fare, compute_dynamic_fares, iter_flight_fares,
+    next_fare_change, round_fare_cents,
+)
+from .pricing_rules import PricingRuleSource, PricingRulesError, np, pricing_rules
+from .demand import CONFIRM, SEARCH, DemandEngine
+from .fare_grid import current_fares, refresh_fares
+from .fare_history import FareHistoryRecorder, fare_recorder, rollup_fare_history
+from .fare_cache import DjangoFareCacheBackend, FareQuoteCache, LocalFareCacheBackend, fare_cache
+from .search_cache import SearchResponseCache, search_cache
+from .search_index import route_index
+from .simulation import MarketSimulation, write_fare_history
+from .seatmap import SeatLayout, SeatMapFull, allocate_seats, find_seats, release_seat_labels
+
+
+def setUpModule():
+    # The shared recorder flushes from timer threads and at exit; tests use their own.
+    fare_recorder.enabled = False
+
+
+def tearDownModule():
+    fare_recorder.enabled = True
+
+
+def make_flight(**kwargs):
+    departure = kwargs.pop('departure_time', timezone.now() + timedelta(days=10))
+    values = {
+        'origin': 'DEL',
+        'destination': 'BOM',
+        'departure_time': departure,
+        'arrival_time': departure + timedelta(hours=2),
+        'base_price': Decimal('5000.00'),
+        'total_seats': 100,
+        'available_seats': 100,
+        'demand_factor': 0.5,
+    }
+    values.update(kwargs)
+    return Flight.objects.create(**values)
+
+
+class BatchPricingTests(TestCase):
+    def test_batch_matches_scalar_to_the_cent(self):
+        rng = random.Random(42)
+        now = timezone.now()
+        flights = []
+        for _ in range(500):
+            total = rng.randint(1, 400)
+            flights.append(Flight(
+                base_price=Decimal(rng.randint(1000, 99999)) / 100,
+                total_seats=total,
+                available_seats=rng.randint(-2, total),
+                departure_time=now + timedelta(seconds=rng.randint(-3600, 30 * 86400)),
+                demand_factor=rng.uniform(-0.2, 1.2),
+            ))
+
+        batch = compute_dynamic_fares(flights, now=now)
+        scalar = [
+            compute_dynamic_fare(f.base_price, f.total_seats, f.available_seats, f.departure_time, f.demand_factor, now=now)
+            for f in flights
+        ]
+        self.assertEqual(batch, scalar)
+
+    def test_iter_flight_fares_covers_queryset(self):
+        now = timezone.now()
+        flights = [make_flight(available_seats=n) for n in (100, 50, 3)]
+        fares = dict(iter_flight_fares(Flight.objects.all(), now=now, chunk_size=2))
+        self.assertEqual(set(fares), {f.id for f in flights})
+        for f in flights:
+            self.assertEqual(fares[f.id], compute_dynamic_fare(f.base_price, f.total_seats, f.available_seats, f.departure_time, f.demand_factor, now=now))
+
+
+class CacheResetMixin:
+    def setUp(self):
+        route_index.clear()
+        fare_cache.clear()
+        search_cache.clear()
+        connection_index.clear()
+        passenger_resolver.clear()
+        schedule_generation.reset()
+
+
+def legacy_fare(base_fare, total_seats, seats_available, departure, demand_level, now):
+    # The hardcoded formula the rule engine replaced, kept as the parity reference.
+    total_seats = max(total_seats, 1)
+    seats_available = max(seats_available, 0)
+    demand_level = min(max(demand_level, 0.0), 1.0)
+    hours = max((departure - now).total_seconds() / 3600.0, 0.0)
+    remaining_pct = seats_available / float(total_seats)
+    if hours > 168:
+        time_mult = 1.0
+    elif hours > 72:
+        time_mult = 1.05
+    elif hours > 24:
+        time_mult = 1.20
+    elif hours > 6:
+        time_mult = 1.5
+    else:
+        time_mult = 2.0
+    multiplier = time_mult * (1.0 + (1.0 - remaining_pct) ** 2 * 2.0) * (0.9 + demand_level * 1.1)
+    if remaining_pct < 0.05:
+        multiplier *= 1.25
+    fare = (Decimal(base_fare) * Decimal(str(multiplier))).quantize(Decimal('0.01'), rounding='ROUND_HALF_UP')
+    return max(fare, Decimal(base_fare).quantize(Decimal('0.01')))
+
+
+class PricingRulesTests(CacheResetMixin, TestCase):
+    def tearDown(self):
+        pricing_rules.load()
+
+    def test_default_rules_match_the_legacy_formula(self):
+        rng = random.Random(7)
+        now = timezone.now()
+        flights = []
+        for _ in range(2000):
+            total = rng.randint(1, 400)
+            flights.append(Flight(
+                base_price=Decimal(rng.randint(1000, 99999)) / 100,
+                total_seats=total,
+                available_seats=rng.randint(-2, total),
+                departure_time=now + timedelta(seconds=rng.choice([
+                    rng.randint(-3600, 30 * 86400), 6 * 3600, 24 * 3600, 72 * 3600, 168 * 3600,
+                ])),
+                demand_factor=rng.uniform(-0.2, 1.2),
+            ))
+        expected = [
+            legacy_fare(f.base_price, f.total_seats, f.available_seats, f.departure_time, f.demand_factor, now)
+            for f in flights
+        ]
+        self.assertEqual(compute_dynamic_fares(flights, now=now), expected)
+        self.assertEqual([
+            compute_dynamic_fare(f.base_price, f.total_seats, f.available_seats, f.departure_time, f.demand_factor, now=now)
+            for f in flights
+        ], expected)
+
+    @skipUnless(np is not None, "needs numpy")
+    def test_batch_rounding_takes_the_exact_path_near_half_cents(self):
+        rules = pricing_rules.current().default
+        bases = [Decimal('1.00'), Decimal('10.10'), Decimal('12.345'), Decimal('99.99')]
+        multipliers = np.array([1.005, 1.15, 1.3, 0.5])
+        self.assertEqual(
+            _apply_multipliers(bases, multipliers, rules),
+            [_apply_multiplier(b, m, rules) for b, m in zip(bases, multipliers.tolist())],
+        )
+        self.assertEqual(_apply_multipliers(bases[:1], multipliers[:1], rules), [Decimal('1.01')])
+
+    @skipUnless(np is not None, "needs numpy")
+    def test_float_cent_rounding_applies_floor_and_cap(self):
+        pricing_rules.load({'floor': 0.8, 'cap': 1.5})
+        rules = pricing_rules.current().default
+        bases = [Decimal('4500.00'), Decimal('99.99'), Decimal('1234.56'), Decimal('250.00')]
+        multipliers = np.array([0.5, 1.2, 2.75, 1.499])
+        cents = round_fare_cents(np.array([float(b) * 100 for b in bases]), multipliers, rules)
+        self.assertEqual(
+            [Decimal(int(c)).scaleb(-2) for c in cents],
+            [_apply_multiplier(b, m, rules) for b, m in zip(bases, multipliers.tolist())],
+        )
+
+    def test_route_overrides_caps_and_buckets(self):
+        now = timezone.now()
+        departure = now + timedelta(hours=12)
+        pricing_rules.load({
+            'cap': 2.0,
+            'routes': {'del-bom': {'time_to_departure': {'buckets': [[48, 1.0]], 'otherwise': 1.0}, 'cap': None}},
+        })
+        flights = [
+            Flight(origin_key=o, destination_key=d, base_price=Decimal('100.00'), total_seats=100,
+                   available_seats=1, departure_time=departure, demand_factor=1.0)
+            for o, d in (('DEL', 'BOM'), ('DEL', 'BLR'))
+        ]
+        routed, capped = compute_dynamic_fares(flights, now=now)
+        self.assertEqual(capped, Decimal('200.00'))
+        self.assertEqual(routed, compute_dynamic_fare(
+            Decimal('100.00'), 100, 1, departure, 1.0, now=now, route=('DEL', 'BOM'),
+        ))
+        self.assertEqual(routed, (Decimal('100.00') * Decimal(str((1.0 + 0.99 * 0.99 * 2.0) * 2.0 * 1.25))).quantize(Decimal('0.01')))
+        self.assertEqual(next_fare_change(now + timedelta(hours=100), now, route=('DEL', 'BOM')), now + timedelta(hours=52))
+        self.assertEqual(next_fare_change(now + timedelta(hours=100), now), now + timedelta(hours=28))
+
+        for bad in ({'demand': {'slope': 'steep'}}, {'routes': {'DELBOM': {}}}, {'floor': 2, 'cap': 1}, {'surge': 1}):
+            with self.assertRaises(PricingRulesError):
+                pricing_rules.load(bad)
+
+    def test_rules_file_is_hot_reloaded_and_bad_files_ignored(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        clock = [0.0]
+        source = PricingRuleSource(path=path, check_interval=5, clock=lambda: clock[0])
+
+        def write(text, mtime):
+            with open(path, 'w') as fh:
+                fh.write(text)
+            os.utime(path, (mtime, mtime))
+
+        write('{"demand": {"base": 1.0}}', 1000)
+        first = source.current()
+        self.assertEqual(first.default.demand_base, 1.0)
+
+        write('{"demand": {"base": 1.2}}', 2000)
+        self.assertIs(source.current(), first)  # not re-checked within the interval
+        clock[0] = 6
+        self.assertEqual(source.current().default.demand_base, 1.2)
+
+        write('{"demand": ', 3000)
+        clock[0] = 12
+        with self.assertLogs('flights.pricing_rules', 'ERROR'):
+            self.assertEqual(source.current().default.demand_base, 1.2)
+
+    def test_reload_invalidates_stored_fares(self):
+        flight = make_flight()
+        refresh_fares()
+        flight.refresh_from_db()
+        stored = flight.current_fare
+
+        pricing_rules.load({'demand': {'base': 2.0}})
+        self.assertNotEqual(current_fares([flight])[0], stored)
+        self.assertEqual(refresh_fares(), 1)
+        flight.refresh_from_db()
+        self.assertEqual(flight.fare_rules_version, pricing_rules.current().version)
+        self.assertEqual(current_fares([flight])[0], flight.current_fare)
+
+
+class FlightSearchTests(CacheResetMixin, TestCase):
+
+    def search(self, **params):
+        return self.client.get('/flights/search/', params).json()
+
+    def test_search_is_case_insensitive_and_bounded_to_the_day(self):
+        day = timezone.now().date() + timedelta(days=20)
+        start = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time()))
+        inside = make_flight(origin='del', destination='Bom', departure_time=start)
+        make_flight(origin='DEL', destination='BOM', departure_time=start + timedelta(days=1))
+        make_flight(origin='DEL', destination='BOM', departure_time=start - timedelta(seconds=1))
+
+        results = self.search(origin='DEL', destination='bom', departure_date=day.isoformat())
+        self.assertEqual([r['flight_id'] for r in results], [str(inside.id)])
+
+    def search_response(self, flight, **headers):
+        day = timezone.localtime(flight.departure_time).date().isoformat()
+        return self.client.get('/flights/search/', {
+            'origin': flight.origin, 'destination': flight.destination, 'departure_date': day,
+        }, headers=headers)
+
+    def test_etag_revalidation_and_cached_responses(self):
+        flight = make_flight()
+        first = self.search_response(flight)
+        self.assertEqual(first['Cache-Control'], 'no-cache')
+
+        with self.assertNumQueries(0):
+            again = self.search_response(flight, if_none_match=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+        # A seat change drops the cached response and changes the ETag.
+        reserve_seats(flight.id, 3)
+        changed = self.search_response(flight, if_none_match=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertEqual(json.loads(changed.content)[0]['available_seats'], 97)
+
+    @override_settings(SEARCH_RESPONSE_CACHE={'GZIP': True, 'GZIP_MIN_BYTES': 1})
+    def test_gzip_when_accepted(self):
+        flight = make_flight()
+        plain = self.search_response(flight)
+        zipped = self.search_response(flight, accept_encoding='gzip, deflate')
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', zipped['Vary'])
+        self.assertEqual(gzip.decompress(zipped.content), plain.content)
+        self.assertEqual(self.search_response(flight, if_none_match=zipped['ETag']).status_code, 304)
+
+    def test_evicted_and_expired_entries_drop_their_flight_mappings(self):
+        now = [0.0]
+        cache = SearchResponseCache(max_entries=1, ttl=10, clock=lambda: now[0])
+        day = timezone.now().date()
+        cache.put(cache.key('DEL', 'BOM', day, 1), b'[]', [1], [1, 2])
+        cache.put(cache.key('DEL', 'BLR', day, 1), b'[]', [3], [3])
+        self.assertEqual(set(cache._route_by_flight), {3})
+
+        now[0] = 60.0
+        self.assertIsNone(cache.get(cache.key('DEL', 'BLR', day, 1)))
+        self.assertEqual((cache._route_by_flight, cache._flights_by_route), ({}, {}))
+
+    def test_index_is_invalidated_when_a_flight_is_added(self):
+        day = timezone.now().date() + timedelta(days=20)
+        params = {'origin': 'DEL', 'destination': 'BOM', 'departure_date': day.isoformat()}
+        self.assertEqual(self.search(**params), [])
+
+        start = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time()))
+        make_flight(departure_time=start + timedelta(hours=9))
+        self.assertEqual(len(self.search(**params)), 1)
+
+
+class FareQuoteCacheTests(CacheResetMixin, TestCase):
+    def assert_cache_behaviour(self, cache):
+        flight = make_flight()
+        now = timezone.now()
+        first = cache.get_fare(flight, now=now)
+        self.assertEqual(cache.get_fare(flight, now=now), first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        cache.invalidate(flight.id)
+        cache.get_fare(flight, now=now)
+        self.assertEqual(cache.misses, 2)
+
+    def test_local_backend(self):
+        self.assert_cache_behaviour(FareQuoteCache(LocalFareCacheBackend(max_entries=10)))
+
+    def test_django_backend(self):
+        self.assert_cache_behaviour(FareQuoteCache(DjangoFareCacheBackend()))
+
+    def test_local_backend_is_bounded(self):
+        cache = FareQuoteCache(LocalFareCacheBackend(max_entries=2))
+        cache.get_fares([make_flight() for _ in range(5)])
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_reservation_invalidates_cached_quotes(self):
+        flight = make_flight()
+        fare_cache.get_fare(flight)
+        self.assertEqual(fare_cache.stats()['size'], 1)
+        self.assertIsNotNone(reserve_seats(flight.id, 2))
+        self.assertEqual(fare_cache.stats()['size'], 0)
+
+
+def post_json(client, url, payload):
+    return client.post(url, json.dumps(payload), content_type='application/json')
+
+
+PAYMENT_OK = {"success": True, "transaction_id": "TXN"}
+
+
+class BookingFlowMixin(CacheResetMixin):
+    def begin(self, flight, seats=2):
+        return post_json(self.client, '/flights/book/begin/', {'flight_id': flight.id, 'seats': seats}).json()
+
+    def confirm(self, token, **extra):
+        payload = {'quote_token': token, 'passenger': {'first_name': 'Asha', 'email': 'asha@example.com'}}
+        payload.update(extra)
+        return post_json(self.client, '/flights/book/confirm/', payload)
+
+
+class QuoteTokenTests(BookingFlowMixin, TestCase):
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_confirm_charges_the_quoted_price(self, _payment):
+        flight = make_flight()
+        quote = self.begin(flight)
+        Flight.objects.filter(id=flight.id).update(base_price=Decimal('99999.00'))
+
+        response = self.confirm(quote['quote_token'])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['price_paid'], quote['total_price'])
+        self.assertEqual(Booking.objects.get().price_paid, Decimal(quote['total_price']))
+
+    def test_tampered_token_is_rejected(self):
+        token = self.begin(make_flight())['quote_token']
+        self.assertEqual(self.confirm(token[:-2] + 'xx').status_code, 400)
+        self.assertEqual(self.confirm(None).status_code, 400)
+
+    @override_settings(SEAT_HOLD_TTL=-1)
+    def test_expired_token_is_rejected(self):
+        token = self.begin(make_flight())['quote_token']
+        self.assertEqual(self.confirm(token).status_code, 409)
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_token_cannot_be_replayed(self, _payment):
+        token = self.begin(make_flight())['quote_token']
+        self.assertEqual(self.confirm(token).status_code, 201)
+        self.assertEqual(self.confirm(token).status_code, 409)
+
+
+class SeatHoldTests(BookingFlowMixin, TestCase):
+    def test_expired_holds_are_released_in_bulk(self):
+        flight = make_flight(available_seats=10)
+        other = make_flight(available_seats=10)
+        for f, seats in ((flight, 2), (flight, 3), (other, 1)):
+            self.begin(f, seats)
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 5)
+
+        result = release_expired_holds(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(result, {'holds': 3, 'seats': 6})
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 10)
+        self.assertEqual(Flight.objects.get(id=other.id).available_seats, 10)
+        self.assertFalse(SeatHold.objects.filter(status=SeatHold.STATUS_ACTIVE).exists())
+
+    def test_released_hold_cannot_be_confirmed(self):
+        token = self.begin(make_flight())['quote_token']
+        release_expired_holds(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.confirm(token).status_code, 409)
+
+    @mock.patch('flights.payments.simulate_payment', return_value={"success": False, "error": "declined"})
+    def test_failed_payment_returns_held_seats(self, _payment):
+        flight = make_flight(available_seats=10)
+        token = self.begin(flight, 4)['quote_token']
+        self.assertEqual(self.confirm(token).status_code, 402)
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 10)
+        self.assertEqual(SeatHold.objects.get().status, SeatHold.STATUS_RELEASED)
+
+
+class ReservationQueryTests(BookingFlowMixin, TestCase):
+    def test_begin_prices_the_reserved_row_in_one_round_trip(self):
+        flight = make_flight(available_seats=10)
+        refresh_fares()
+        # savepoint, UPDATE ... RETURNING, hold INSERT, release
+        expected_queries = 4 if can_return_from_update(connection) else 5
+        with self.assertNumQueries(expected_queries):
+            quote = self.begin(flight, 3)
+        self.assertEqual(Decimal(quote['dynamic_price_per_seat']), compute_dynamic_fare(
+            flight.base_price, flight.total_seats, 7, flight.departure_time, flight.demand_factor,
+        ))
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 7)
+
+    def test_begin_reports_missing_flights_and_short_inventory(self):
+        flight = make_flight(available_seats=2)
+        response = post_json(self.client, '/flights/book/begin/', {'flight_id': flight.id, 'seats': 3})
+        self.assertEqual(response.status_code, 409)
+        response = post_json(self.client, '/flights/book/begin/', {'flight_id': flight.id + 1, 'seats': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(reserve_seats(flight.id, 3))
+        self.assertEqual(reserve_seats(flight.id, 2, fields=('id', 'available_seats')).available_seats, 0)
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_confirm_query_count(self, _payment):
+        flight = make_flight()
+        # Seat map, PNR block and passenger already exist, as they would after the first booking.
+        allocate_seats(flight.id, 1)
+        pnr_allocator.allocate()
+        with self.captureOnCommitCallbacks(execute=True):
+            passenger_resolver.resolve({'first_name': 'Asha', 'email': 'asha@example.com'})
+        token = self.begin(flight, 2)['quote_token']
+        # hold UPDATE, seat map read + write, savepoint, booking INSERT, release
+        with self.assertNumQueries(6):
+            self.assertEqual(self.confirm(token).status_code, 201)
+
+    @mock.patch('flights.payments.simulate_payment', return_value={"success": False, "error": "declined"})
+    def test_failed_payment_releases_without_rereading_the_flight(self, _payment):
+        flight = make_flight(available_seats=10)
+        allocate_seats(flight.id, 1)
+        token = self.begin(flight, 4)['quote_token']
+        # hold UPDATE, seat map read + write; then savepoint, seat map read + write,
+        # nested savepoint, hold UPDATE, seats UPDATE, two releases
+        with self.assertNumQueries(11):
+            self.assertEqual(self.confirm(token).status_code, 402)
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 10)
+        self.assertFalse(release_consumed_hold(SeatHold.objects.get().hold_id, flight.id, 4))
+
+
+class SeatMapTests(BookingFlowMixin, TestCase):
+    layout = SeatLayout(60, 6, (('Business', 0.2), ('Economy', 0.8)))
+
+    def test_prefers_adjacent_seats_in_requested_cabin(self):
+        seats = find_seats(0, self.layout, 3, seat_class='Economy')
+        self.assertEqual([self.layout.label(i) for i in seats], ['3A', '3B', '3C'])
+
+    def test_adjacent_block_does_not_cross_rows(self):
+        occupied = 0b111100  # 1C-1F taken
+        seats = find_seats(occupied, self.layout, 3, seat_class='Business')
+        self.assertEqual([self.layout.label(i) for i in seats], ['2A', '2B', '2C'])
+
+    def test_falls_back_to_scattered_then_full(self):
+        occupied = self.layout.full_mask & ~((1 << 0) | (1 << 7) | (1 << 59))
+        self.assertEqual(find_seats(occupied, self.layout, 3), [0, 7, 59])
+        self.assertIsNone(find_seats(occupied, self.layout, 4))
+
+    def test_allocation_and_release_round_trip(self):
+        flight = make_flight(total_seats=12)
+        first = allocate_seats(flight.id, 6, adjacent=True)
+        second = allocate_seats(flight.id, 6)
+        self.assertFalse(set(first) & set(second))
+        with self.assertRaises(SeatMapFull):
+            allocate_seats(flight.id, 1)
+        release_seat_labels(flight.id, first[:2])
+        self.assertEqual(allocate_seats(flight.id, 2), first[:2])
+
+    def test_contended_writes_back_off_then_take_the_row_lock(self):
+        flight = make_flight(total_seats=12)
+        allocate_seats(flight.id, 1)
+        real_store = seatmap._store
+        calls = []
+
+        def store(*args):
+            calls.append(connection.in_atomic_block and len(connection.atomic_blocks))
+            # Every optimistic write loses the race; the locked one wins.
+            return len(calls) == seatmap.MAX_ATTEMPTS and real_store(*args)
+
+        with mock.patch('flights.seatmap._store', side_effect=store), mock.patch('flights.seatmap.time.sleep') as sleep:
+            self.assertEqual(allocate_seats(flight.id, 1), ['1B'])
+        self.assertEqual(len(calls), seatmap.MAX_ATTEMPTS)
+        self.assertGreater(calls[-1], calls[0])  # inside the extra atomic block
+        self.assertEqual(sleep.call_count, seatmap.MAX_ATTEMPTS - 2)
+
+    def test_rows_wider_than_the_seat_letters_are_rejected(self):
+        with override_settings(SEAT_MAP={'SEATS_PER_ROW': len(seatmap.SEAT_LETTERS) + 1}):
+            with self.assertRaises(ImproperlyConfigured):
+                seatmap.get_layout(120)
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_confirmed_bookings_get_distinct_seats_and_cancel_frees_them(self, _payment):
+        flight = make_flight()
+        first = self.confirm(self.begin(flight, 2)['quote_token']).json()
+        second = self.confirm(self.begin(flight, 2)['quote_token']).json()
+        self.assertFalse(set(first['seat_number'].split(',')) & set(second['seat_number'].split(',')))
+
+        post_json(self.client, '/flights/book/cancel/', {'pnr': first['pnr']})
+        third = self.confirm(self.begin(flight, 2)['quote_token']).json()
+        self.assertEqual(third['seat_number'], first['seat_number'])
+
+
+class FlakyGateway(PaymentGateway):
+    def __init__(self, failures, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    async def charge(self, amount, reference):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.calls <= self.failures:
+                raise TransientPaymentError("flaky")
+            return {"success": True, "transaction_id": reference}
+        finally:
+            self.in_flight -= 1
+
+
+class PaymentStageTests(SimpleTestCase):
+    def test_transient_errors_are_retried(self):
+        stage = PaymentStage(FlakyGateway(failures=2), retries=2, backoff=0)
+        with self.assertLogs('flights.payments', 'WARNING'):
+            self.assertTrue(asyncio.run(stage.charge(Decimal('10'), 'ref'))['success'])
+
+    def test_gives_up_after_retries(self):
+        gateway = FlakyGateway(failures=0, delay=1)
+        stage = PaymentStage(gateway, timeout=0.01, retries=1, backoff=0)
+        with self.assertLogs('flights.payments', 'WARNING'):
+            self.assertFalse(asyncio.run(stage.charge(Decimal('10'), 'ref'))['success'])
+        self.assertEqual(gateway.calls, 2)
+
+    def test_concurrency_is_bounded(self):
+        gateway = FlakyGateway(failures=0, delay=0.01)
+        stage = PaymentStage(gateway, max_concurrency=3)
+
+        async def run():
+            return await asyncio.gather(*(stage.charge(Decimal('10'), str(i)) for i in range(20)))
+
+        self.assertTrue(all(r['success'] for r in asyncio.run(run())))
+        self.assertEqual(gateway.peak, 3)
+
+
+class BulkBookingTests(CacheResetMixin, TestCase):
+    def passengers(self, n):
+        return [{'first_name': f'P{i}', 'email': f'p{i}@agency.example'} for i in range(n)]
+
+    def book(self, items):
+        return post_json(self.client, '/flights/book/bulk/', {'items': items})
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_reports_per_item_results(self, _payment):
+        roomy = make_flight(available_seats=10)
+        tight = make_flight(available_seats=2)
+        response = self.book([
+            {'flight_id': roomy.id, 'passengers': self.passengers(3)},
+            {'flight_id': tight.id, 'passengers': self.passengers(3)},
+            {'flight_id': roomy.id, 'passengers': self.passengers(2)},
+            {'flight_id': 999999, 'passengers': self.passengers(1)},
+            {'passengers': self.passengers(1)},
+        ])
+        self.assertEqual(response.status_code, 201)
+        items = response.json()['items']
+        self.assertEqual([i['success'] for i in items], [True, False, True, False, False])
+        self.assertEqual(len(items[0]['pnrs']), 3)
+        self.assertEqual(Flight.objects.get(id=roomy.id).available_seats, 5)
+        self.assertEqual(Flight.objects.get(id=tight.id).available_seats, 2)
+        self.assertEqual(Booking.objects.count(), 5)
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_query_count_does_not_grow_with_passengers(self, _payment):
+        flights = [make_flight() for _ in range(3)]
+
+        def queries_for(n):
+            with CaptureQueriesContext(connection) as ctx:
+                self.book([{'flight_id': f.id, 'passengers': self.passengers(n)} for f in flights])
+            return len(ctx.captured_queries)
+
+        queries_for(1)  # creates the seat maps
+        self.assertEqual(queries_for(2), queries_for(8))
+
+    @mock.patch('flights.payments.simulate_payment', return_value={"success": False, "error": "declined"})
+    def test_failed_payment_releases_everything(self, _payment):
+        flight = make_flight(available_seats=10)
+        response = self.book([{'flight_id': flight.id, 'passengers': self.passengers(4)}])
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 10)
+        self.assertFalse(Booking.objects.exists())
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_item_whose_hold_expired_is_not_charged(self, payment):
+        kept, lost = make_flight(available_seats=10), make_flight(available_seats=10)
+        real_reserve = bulk_booking.reserve
+
+        def reserve_then_stall(items, seat_class=None):
+            items = real_reserve(items, seat_class)
+            # The request stalls past the hold TTL and the reaper runs before the order is claimed.
+            SeatHold.objects.filter(flight_id=lost.id).update(expires_at=timezone.now() - timedelta(seconds=1))
+            release_expired_holds()
+            return items
+
+        with mock.patch('flights.bulk_booking.reserve', side_effect=reserve_then_stall):
+            response = self.book([
+                {'flight_id': kept.id, 'passengers': self.passengers(2)},
+                {'flight_id': lost.id, 'passengers': self.passengers(3)},
+            ])
+        body = response.json()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([i['success'] for i in body['items']], [True, False])
+        self.assertEqual(body['items'][1]['error'], "Seat hold expired")
+        charged = Decimal(body['items'][0]['total_price'])
+        self.assertEqual(Decimal(body['total_charged']), charged)
+        payment.assert_called_once_with(charged)
+        self.assertEqual(Flight.objects.get(id=lost.id).available_seats, 10)
+        self.assertEqual(Booking.objects.filter(flight=kept).count(), 2)
+        self.assertFalse(Booking.objects.filter(flight=lost).exists())
+
+    def test_unpaid_reservation_is_held_and_reaped(self):
+        flight = make_flight(available_seats=10)
+        items = bulk_booking.reserve(bulk_booking.parse_items([{'flight_id': flight.id, 'passengers': self.passengers(3)}]))
+        self.assertEqual(items[0].price_per_seat, compute_dynamic_fare(
+            flight.base_price, flight.total_seats, 7, flight.departure_time, flight.demand_factor,
+        ))
+        hold = SeatHold.objects.get()
+        self.assertEqual((hold.seats, hold.seat_numbers.split(',')), (3, items[0].seat_numbers))
+
+        # The process died before paying: the reaper returns seats and seat labels.
+        release_expired_holds(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 10)
+        self.assertEqual(allocate_seats(flight.id, 3), items[0].seat_numbers)
+
+
+class BookingHistoryTests(TestCase):
+    def setUp(self):
+        flight = make_flight()
+        passenger = Passenger.objects.create(first_name='Corp', last_name='User', email='Travel@Corp.example')
+        self.pnrs = []
+        for i in range(7):
+            booking = Booking.objects.create(pnr=f'PNHIST{i:04d}', flight=flight, passenger=passenger, price_paid=Decimal('10.00'), status=Booking.STATUS_CONFIRMED)
+            self.pnrs.append(booking.pnr)
+        self.pnrs.reverse()
+
+    def test_keyset_pages_cover_every_booking_once(self):
+        seen = []
+        params = {'email': 'travel@corp.EXAMPLE', 'limit': 3}
+        while True:
+            response = self.client.get('/flights/bookings/', params)
+            seen += [row['pnr'] for row in response.json()]
+            if 'X-Next-Cursor' not in response:
+                break
+            params['cursor'] = response['X-Next-Cursor']
+        self.assertEqual(seen, self.pnrs)
+
+    def test_ndjson_stream(self):
+        response = self.client.get('/flights/bookings/', {'email': 'travel@corp.example', 'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['pnr'] for row in rows], self.pnrs)
+
+    @mock.patch('flights.views.HISTORY_STREAM_CHUNK', 3)
+    async def test_ndjson_stream_is_async_under_asgi(self):
+        response = await self.async_client.get('/flights/bookings/', {'email': 'travel@corp.example', 'format': 'ndjson'})
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([json.loads(line)['pnr'] for line in body.splitlines()], self.pnrs)
+
+    def test_bad_cursor(self):
+        response = self.client.get('/flights/bookings/', {'email': 'x@y.z', 'cursor': '!!'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_pnr_lookup_is_normalized(self):
+        rows = self.client.get('/flights/bookings/', {'pnr': f' {self.pnrs[0].lower()} '}).json()
+        self.assertEqual([row['pnr'] for row in rows], [self.pnrs[0]])
+
+
+class FareHistoryTests(TestCase):
+    def test_recorder_flushes_on_buffer_size(self):
+        flight = make_flight()
+        recorder = FareHistoryRecorder(buffer_size=3, flush_interval=None)
+        recorder.record(flight.id, Decimal('100.00'), 90)
+        recorder.record_many([(flight.id, Decimal('110.00'), 89)])
+        self.assertEqual(FareHistory.objects.count(), 0)
+        recorder.record(flight.id, Decimal('120.00'), 88)
+        self.assertEqual(FareHistory.objects.count(), 3)
+        self.assertEqual(recorder.pending(), 0)
+
+    def test_rollup_compacts_hours(self):
+        flight = make_flight()
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=3)
+        recorder = FareHistoryRecorder(flush_interval=None)
+        for minute, fare in ((1, '100.00'), (20, '200.00'), (59, '300.00')):
+            recorder.record(flight.id, Decimal(fare), 50 - minute, timestamp=hour + timedelta(minutes=minute))
+        recorder.record(flight.id, Decimal('400.00'), 5, timestamp=hour + timedelta(hours=1, minutes=5))
+        recorder.record(flight.id, Decimal('500.00'), 5, timestamp=timezone.now())
+        recorder.flush()
+
+        removed, written = rollup_fare_history(older_than=timedelta(hours=24))
+        self.assertEqual((removed, written), (4, 2))
+
+        first = FareHistory.objects.get(granularity=FareHistory.GRANULARITY_HOUR, timestamp=hour)
+        self.assertEqual((first.fare, first.fare_min, first.fare_max, first.sample_count, first.seats_available),
+                         (Decimal('200.00'), Decimal('100.00'), Decimal('300.00'), 3, -9))
+        self.assertEqual(FareHistory.objects.filter(granularity=FareHistory.GRANULARITY_RAW).count(), 1)
+
+        recorder.record(flight.id, Decimal('600.00'), 1, timestamp=hour + timedelta(minutes=30))
+        recorder.flush()
+        rollup_fare_history(older_than=timedelta(hours=24))
+        first = FareHistory.objects.get(granularity=FareHistory.GRANULARITY_HOUR, timestamp=hour)
+        self.assertEqual((first.fare, first.fare_max, first.sample_count), (Decimal('300.00'), Decimal('600.00'), 4))
+
+
+class DemandEngineTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.engine = DemandEngine(half_life=100.0, saturation=10.0, baseline=0.2, clock=lambda: self.now)
+
+    def test_scores_decay_with_half_life(self):
+        self.engine.record(1, CONFIRM)
+        self.assertAlmostEqual(self.engine.score(1), 10.0)
+        self.now = 100.0
+        self.assertAlmostEqual(self.engine.score(1), 5.0)
+        self.assertAlmostEqual(self.engine.demand_level(1), 0.2 + 0.8 * 5.0 / 15.0)
+
+    def test_flush_merges_scores_into_stored_levels(self):
+        busy, quiet = make_flight(demand_factor=0.2), make_flight(demand_factor=0.2)
+        self.engine.record_many([busy.id, quiet.id], SEARCH)
+        self.engine.record(busy.id, CONFIRM, count=3)
+
+        with self.assertNumQueries(4):  # savepoint, locked read, one UPDATE, release
+            self.assertEqual(self.engine.flush(), 2)
+        busy.refresh_from_db()
+        quiet.refresh_from_db()
+        self.assertAlmostEqual(busy.demand_factor, 0.2 + 0.8 * 31.0 / 41.0, places=4)
+        self.assertAlmostEqual(quiet.demand_factor, 0.2 + 0.8 * 1.0 / 11.0, places=4)
+
+        self.now = 10000.0
+        self.engine.flush()
+        busy.refresh_from_db()
+        self.assertAlmostEqual(busy.demand_factor, 0.2, places=3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.engine.flush(), 0)
+
+    def test_stored_level_seeds_the_score(self):
+        flight = make_flight(demand_factor=1.0, demand_updated_at=timezone.now())
+        self.engine.record(flight.id, SEARCH)
+        self.engine.flush()
+        flight.refresh_from_db()
+        self.assertGreater(flight.demand_factor, 0.99)
+
+    def test_unmanaged_default_level_starts_from_baseline(self):
+        flight = make_flight(demand_factor=1.0)
+        self.assertIsNone(flight.demand_updated_at)
+        self.engine.record(flight.id, SEARCH)
+        self.engine.flush()
+        flight.refresh_from_db()
+        self.assertAlmostEqual(flight.demand_factor, 0.2 + 0.8 * 1.0 / 11.0, places=4)
+        self.assertIsNotNone(flight.demand_updated_at)
+
+    def test_workers_add_to_each_other(self):
+        flight = make_flight(demand_factor=0.2)
+        other = DemandEngine(half_life=100.0, saturation=10.0, baseline=0.2, clock=lambda: self.now)
+        self.engine.record(flight.id, CONFIRM)
+        other.record(flight.id, CONFIRM)
+        self.engine.flush()
+        other.flush()
+        flight.refresh_from_db()
+        self.assertAlmostEqual(flight.demand_factor, 0.2 + 0.8 * 20.0 / 30.0, places=4)
+
+
+@mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+class BenchmarkTests(CacheResetMixin, TestCase):
+    def test_load_run_reports_every_scenario(self, _payment):
+        routes = seed_catalog(routes=2, days=2, flights_per_day=3)
+        self.assertEqual(Flight.objects.count(), 12)
+
+        report = {'endpoints': run_load(routes, days=2, requests=5, concurrency=1)}
+        for name, result in report['endpoints'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['requests'], 5, name)
+        self.assertEqual(report['endpoints']['confirm']['status_codes'], {'201': 5})
+
+        slower = json.loads(json.dumps(report))
+        slower['endpoints']['search']['latency_ms']['p95'] *= 2
+        self.assertEqual([r['endpoint'] for r in compare(slower, report)], ['search'])
+
+
+class MetricsTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_metrics()
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_requests_queries_and_stages_are_exported(self, _payment):
+        flight = make_flight()
+        self.client.get('/flights/search/', {
+            'origin': flight.origin, 'destination': flight.destination,
+            'departure_date': timezone.localtime(flight.departure_time).date().isoformat(),
+        })
+        quote = post_json(self.client, '/flights/book/begin/', {'flight_id': flight.id, 'seats': 1}).json()
+        post_json(self.client, '/flights/book/confirm/', {
+            'quote_token': quote['quote_token'], 'passenger': {'first_name': 'A', 'last_name': 'B'},
+        })
+
+        queries = REQUEST_QUERIES.collect()
+        self.assertGreaterEqual(queries[('flight-search',)][1], 1)
+        self.assertGreater(queries[('confirm-booking',)][1], queries[('flight-search',)][1])
+        self.assertEqual({labels[0] for labels in STAGE_LATENCY.collect()}, {'pricing', 'reserve', 'payment'})
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('flights_http_requests_total{endpoint="begin-booking",method="POST",status="200"} 1', body)
+        self.assertIn('flights_stage_duration_seconds_bucket{stage="payment",le="+Inf"} 1', body)
+        self.assertIn('flights_fare_cache_lookups_total{result="hit"}', body)
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite connection tuning")
+class PassengerIdentityMigrationTests(TransactionTestCase):
+    before = [('flights', '0013_flight_fare_rules_version')]
+    after = [('flights', '0019_passenger_name_identity')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_people_sharing_contact_details_are_not_merged(self):
+        apps = self.migrate(self.before)
+        Passenger = apps.get_model('flights', 'Passenger')
+        Booking = apps.get_model('flights', 'Booking')
+        Flight = apps.get_model('flights', 'Flight')
+        departure = timezone.now() + timedelta(days=10)
+        flight = Flight.objects.create(
+            origin='DEL', destination='BOM', departure_time=departure, arrival_time=departure + timedelta(hours=2),
+            base_price=Decimal('5000.00'), total_seats=100, available_seats=100,
+        )
+        contact = {'email': 'family@example.com', 'email_normalized': 'family@example.com', 'phone': '+91 98765 43210'}
+        parent = Passenger.objects.create(first_name='Asha', last_name='Rao', **contact)
+        child = Passenger.objects.create(first_name='Ravi', last_name='Rao', **contact)
+        again = Passenger.objects.create(first_name=' asha', last_name='RAO ', **contact)
+        for i, passenger in enumerate((parent, child, again)):
+            Booking.objects.create(pnr=f'PNMIGR{i:04d}', flight=flight, passenger=passenger, price_paid=Decimal('10.00'))
+
+        apps = self.migrate(self.after)
+        Passenger = apps.get_model('flights', 'Passenger')
+        Booking = apps.get_model('flights', 'Booking')
+        self.assertEqual(sorted(Passenger.objects.values_list('id', flat=True)), [parent.id, child.id])
+        self.assertEqual(
+            dict(Booking.objects.values_list('pnr', 'passenger_id')),
+            {'PNMIGR0000': parent.id, 'PNMIGR0001': child.id, 'PNMIGR0002': parent.id},
+        )
+        self.assertEqual(set(Passenger.objects.values_list('phone_normalized', flat=True)), {'+919876543210'})
+
+
+class SQLiteTuningTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        self.assertEqual(self.pragma('busy_timeout'), connection.settings_dict['OPTIONS']['timeout'] * 1000)
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+
+
+class PnrAllocatorTests(TestCase):
+    def test_unique_increasing_and_one_write_per_block(self):
+        allocator = PnrAllocator(name='test', block_size=4)
+        with CaptureQueriesContext(connection) as ctx:
+            pnrs = allocator.allocate_many(3)
+            pnrs.append(allocator.allocate())
+            for _ in range(6):
+                pnrs.append(allocator.allocate())
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "flights_pnrsequence"')]
+        self.assertEqual(len(updates), 3)  # blocks [0, 4), [4, 8), [8, 12)
+
+        self.assertEqual(len(set(pnrs)), 10)
+        self.assertTrue(all(len(p) == PNR_LENGTH and p.startswith('PN') for p in pnrs))
+        sequences = [p[2:9] for p in pnrs]
+        self.assertEqual(sequences, sorted(sequences))
+        self.assertTrue(all(is_valid_pnr(p) for p in pnrs))
+
+    def test_check_character_catches_typos(self):
+        pnr = PnrAllocator(name='test').allocate()
+        for i in range(2, PNR_LENGTH):
+            typo = pnr[:i] + next(c for c in ALPHABET if c != pnr[i]) + pnr[i + 1:]
+            self.assertFalse(is_valid_pnr(typo), typo)
+        self.assertTrue(is_valid_pnr('PNAB12CD34'))  # legacy random PNR
+
+    def test_rejects_malformed_pnrs_of_other_lengths(self):
+        for bad in ('PN', 'PNAB12CD3', 'PNAB12CD345', 'XXAB12CD34', 'PNAB-2CD34', 'A' * 40):
+            self.assertFalse(is_valid_pnr(bad), bad)
+        with self.assertNumQueries(0):
+            response = post_json(self.client, '/flights/book/cancel/', {'pnr': 'PNAB12CD345'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cancel_rejects_malformed_pnr_without_lookup(self):
+        pnr = PnrAllocator(name='test').allocate()
+        bad = pnr[:-1] + next(c for c in ALPHABET if c != pnr[-1])
+        with self.assertNumQueries(0):
+            response = post_json(self.client, '/flights/book/cancel/', {'pnr': bad})
+        self.assertEqual(response.status_code, 404)
+
+
+class FareGridTests(CacheResetMixin, TestCase):
+    def test_refresh_prices_only_stale_flights_and_sets_tier_expiry(self):
+        now = timezone.now()
+        flight = make_flight(departure_time=now + timedelta(days=10))
+        self.assertIsNone(flight.current_fare)
+
+        self.assertEqual(refresh_fares(now=now), 1)
+        flight.refresh_from_db()
+        self.assertEqual(flight.current_fare, compute_dynamic_fare(
+            flight.base_price, flight.total_seats, flight.available_seats, flight.departure_time,
+            flight.demand_factor, now=now,
+        ))
+        self.assertEqual(flight.fare_valid_until, flight.departure_time - timedelta(hours=168))
+        self.assertEqual(refresh_fares(now=now), 0)
+
+        # Crossing into the 72-168h tier makes it due again.
+        later = flight.fare_valid_until
+        self.assertEqual(refresh_fares(now=later), 1)
+        flight.refresh_from_db()
+        self.assertEqual(flight.fare_valid_until, flight.departure_time - timedelta(hours=72))
+
+    def test_seat_changes_clear_the_stored_fare(self):
+        flight = make_flight()
+        refresh_fares()
+        reserve_seats(flight.id, 2)
+        flight.refresh_from_db()
+        self.assertIsNone(flight.current_fare)
+        self.assertEqual(refresh_fares(), 1)
+
+    def test_search_reads_the_stored_fare(self):
+        flight = make_flight()
+        refresh_fares()
+        Flight.objects.filter(id=flight.id).update(current_fare=Decimal('1234.00'))
+        day = timezone.localtime(flight.departure_time).date().isoformat()
+        with mock.patch('flights.fare_cache.compute_dynamic_fares') as pricer:
+            results = self.client.get('/flights/search/', {
+                'origin': 'DEL', 'destination': 'BOM', 'departure_date': day,
+            }).json()
+        pricer.assert_not_called()
+        self.assertEqual(results[0]['dynamic_price_per_seat'], '1234.00')
+
+
+class ImportFlightsTests(TestCase):
+    CSV = (
+        "flight_number,origin,destination,departure_time,arrival_time,base_price,total_seats\n"
+        "ai101,del,bom,2030-01-01T06:00:00,2030-01-01T08:00:00,4500,180\n"
+        "AI102,BOM,DEL,2030-01-01T09:00:00,2030-01-01T08:00:00,4500,180\n"
+        "AI103,DEL,BLR,2030-01-01T10:00:00,2030-01-01T12:45:00,abc,180\n"
+    )
+
+    def run_import(self, content, suffix, *args):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_flights', f.name, '--batch-size', '2', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_validates_and_normalizes(self):
+        out, err = self.run_import(self.CSV, '.csv')
+        self.assertIn("3 rows", out)
+        self.assertIn("1 upserted, 2 invalid", out)
+        self.assertIn("line 3: arrival_time must be after departure_time", err)
+
+        flight = Flight.objects.get()
+        self.assertEqual((flight.flight_number, flight.origin_key, flight.destination_key), ('AI101', 'DEL', 'BOM'))
+        self.assertEqual(flight.available_seats, 180)
+        self.assertIsNone(flight.current_fare)
+
+    def test_jsonl_upsert_keeps_live_seat_counts(self):
+        row = {
+            "flight_number": "AI101", "origin": "DEL", "destination": "BOM", "base_price": "4500",
+            "departure_time": "2030-01-01T06:00:00+00:00", "arrival_time": "2030-01-01T08:00:00+00:00",
+            "total_seats": 180,
+        }
+        self.run_import(json.dumps(row) + "\n", '.jsonl')
+        Flight.objects.update(available_seats=170, current_fare=Decimal('1.00'))
+
+        out, _ = self.run_import(json.dumps(dict(row, base_price="5000")) + "\n\nnot json\n", '.jsonl')
+        self.assertIn("1 upserted, 1 invalid", out)
+        flight = Flight.objects.get()
+        self.assertEqual((flight.base_price, flight.available_seats), (Decimal('5000.00'), 170))
+        self.assertIsNone(flight.current_fare)
+
+    def test_capacity_change_shifts_live_seat_counts(self):
+        row = {
+            "flight_number": "AI101", "origin": "DEL", "destination": "BOM", "base_price": "4500",
+            "departure_time": "2030-01-01T06:00:00+00:00", "arrival_time": "2030-01-01T08:00:00+00:00",
+            "total_seats": 100,
+        }
+        self.run_import(json.dumps(row) + "\n", '.jsonl')
+        flight = Flight.objects.get()
+        Flight.objects.update(oversell_seats=10, available_seats=50)
+        allocate_seats(flight.id, 2)
+
+        self.run_import(json.dumps(dict(row, total_seats=120)) + "\n", '.jsonl')
+        flight = Flight.objects.get()
+        # 60 sold stays sold; the allowance scales with the cabin.
+        self.assertEqual((flight.total_seats, flight.oversell_seats, flight.available_seats), (120, 12, 72))
+        self.assertEqual(SeatMap.objects.get(flight=flight).capacity, 120)
+
+        out, err = self.run_import(json.dumps(dict(row, total_seats=50)) + "\n", '.jsonl')
+        self.assertIn("0 upserted, 1 invalid", out)
+        self.assertIn("line 1: total_seats 50 is below the 60 seat(s) already sold", err)
+        self.assertEqual(Flight.objects.get().total_seats, 120)
+
+    def test_import_invalidates_caches_in_other_processes(self):
+        other_worker = Generation('schedule', interval=0)
+        cleared = []
+        other_worker.subscribe(lambda: cleared.append(1))
+        with self.assertNumQueries(1):
+            self.assertFalse(other_worker.check())
+
+        self.run_import(self.CSV, '.csv')
+        self.assertTrue(other_worker.check())
+        self.assertFalse(other_worker.check())
+        self.assertEqual(cleared, [1])
+
+        other_worker.interval = 60
+        self.run_import(self.CSV, '.csv')
+        with self.assertNumQueries(0):
+            self.assertFalse(other_worker.check())  # not due yet
+
+    def test_dry_run_writes_nothing(self):
+        out, _ = self.run_import(self.CSV, '.csv', '--dry-run')
+        self.assertIn("1 validated", out)
+        self.assertFalse(Flight.objects.exists())
+
+
+class ItinerarySearchTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        day = timezone.now().date() + timedelta(days=30)
+        self.day = day
+        self.t0 = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time())) + timedelta(hours=6)
+
+    def leg(self, origin, destination, depart_h, hours, **kwargs):
+        departure = self.t0 + timedelta(hours=depart_h)
+        return make_flight(origin=origin, destination=destination, departure_time=departure,
+                           arrival_time=departure + timedelta(hours=hours), **kwargs)
+
+    def search(self, **params):
+        params.setdefault('origin', 'DEL')
+        params.setdefault('destination', 'BOM')
+        params.setdefault('departure_date', self.day.isoformat())
+        return self.client.get('/flights/itineraries/', params)
+
+    def routes(self, results):
+        return [[(leg['origin'], leg['destination']) for leg in it['legs']] for it in results]
+
+    def test_direct_one_and_two_stop_connections_with_layover_limits(self):
+        self.leg('DEL', 'BOM', 0, 2, base_price=Decimal('9000.00'))
+        self.leg('DEL', 'BLR', 0, 2, base_price=Decimal('2000.00'))
+        self.leg('BLR', 'BOM', 3, 1.5, base_price=Decimal('2000.00'))      # 60 min layover
+        self.leg('BLR', 'BOM', 2.25, 1.5, base_price=Decimal('100.00'))    # 15 min, too short
+        self.leg('DEL', 'MAA', 1, 2, base_price=Decimal('1000.00'))
+        self.leg('MAA', 'CCU', 4, 2, base_price=Decimal('1000.00'))
+        self.leg('CCU', 'BOM', 7, 2, base_price=Decimal('1000.00'))
+        self.leg('CCU', 'BOM', 20, 2, base_price=Decimal('500.00'))        # 12h, too long
+        self.leg('DEL', 'BOM', 0, 2, available_seats=0)                   # sold out
+
+        with self.assertNumQueries(2):  # index build + one seats/fares query
+            results = self.search().json()['outbound']
+        self.assertEqual(self.routes(results), [
+            [('DEL', 'MAA'), ('MAA', 'CCU'), ('CCU', 'BOM')],
+            [('DEL', 'BLR'), ('BLR', 'BOM')],
+            [('DEL', 'BOM')],
+        ])
+        self.assertEqual([it['stops'] for it in results], [2, 1, 0])
+
+        by_duration = self.search(sort='duration').json()['outbound']
+        self.assertEqual([it['duration_minutes'] for it in by_duration], [120, 270, 480])
+        self.assertEqual(self.routes(self.search(max_stops=0).json()['outbound']), [[('DEL', 'BOM')]])
+
+    def test_round_trip_and_incremental_index_updates(self):
+        self.leg('DEL', 'BOM', 0, 2)
+        response = self.search(return_date=(self.day + timedelta(days=3)).isoformat()).json()
+        self.assertEqual((len(response['outbound']), response['return']), (1, []))
+
+        back = self.leg('BOM', 'DEL', 72, 2)
+        response = self.search(return_date=(self.day + timedelta(days=3)).isoformat()).json()
+        self.assertEqual(response['return'][0]['legs'][0]['flight_id'], str(back.id))
+
+        back.delete()
+        response = self.search(return_date=(self.day + timedelta(days=3)).isoformat()).json()
+        self.assertEqual(response['return'], [])
+        self.assertEqual(self.search(return_date=(self.day - timedelta(days=1)).isoformat()).status_code, 400)
+
+    def test_layover_bounds_are_validated(self):
+        self.assertEqual(self.search(min_layover=-5).status_code, 400)
+        self.assertEqual(self.search(min_layover=120, max_layover=60).status_code, 400)
+        self.assertEqual(self.search(min_layover=500).status_code, 400)  # above the default maximum
+        self.assertEqual(self.search(min_layover=60, max_layover=60).status_code, 200)
+
+    def test_concurrent_stale_reads_rebuild_once(self):
+        index = ConnectionIndex()
+        calls = []
+
+        def rebuild():
+            calls.append(1)
+            time.sleep(0.05)
+            index._built_at = time.monotonic()
+
+        with mock.patch.object(index, 'rebuild', side_effect=rebuild):
+            threads = [threading.Thread(target=index._ensure_built) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+
+
+class CancellationTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.passenger = Passenger.objects.create(first_name='Dis', last_name='Rupted', email='d@r.example')
+
+    def book(self, flight, n, seats=1):
+        Flight.objects.filter(id=flight.id).update(available_seats=flight.available_seats - n * seats)
+        return [
+            Booking.objects.create(
+                pnr=f'PN{flight.id:03d}{i:05d}', flight=flight, passenger=self.passenger, booked_seats=seats,
+                price_paid=Decimal('100.00'), status=Booking.STATUS_CONFIRMED,
+            ).pnr
+            for i in range(n)
+        ]
+
+    def test_cancel_by_flight_in_batches_restores_seats_and_queues_refunds(self):
+        flight = make_flight(available_seats=100)
+        other = make_flight(available_seats=100)
+        self.book(flight, 30, seats=2)
+        self.book(other, 5)
+
+        def queries_for(n):
+            target = make_flight(available_seats=100)
+            self.book(target, n)
+            with CaptureQueriesContext(connection) as ctx:
+                cancel_bookings(flight_id=target.id, batch_size=1000)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries_for(3), queries_for(40))
+
+        result = cancel_bookings(flight_id=flight.id, batch_size=7)
+        self.assertEqual((result['bookings'], result['seats'], result['flights'], result['refunds']), (30, 60, 1, 30))
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 100)
+        self.assertEqual(Flight.objects.get(id=other.id).available_seats, 95)
+        self.assertFalse(Booking.objects.filter(flight=flight, status=Booking.STATUS_CONFIRMED).exists())
+        self.assertEqual(Refund.objects.filter(booking__flight=flight, status=Refund.STATUS_PENDING).count(), 30)
+        self.assertEqual(cancel_bookings(flight_id=flight.id)['bookings'], 0)
+
+    def test_refunds_retry_then_fail(self):
+        flight = make_flight()
+        self.book(flight, 3)
+        cancel_bookings(flight_id=flight.id)
+
+        outcomes = iter([{'success': True, 'transaction_id': 'T1'}] + [{'success': False}] * 10)
+        with mock.patch('flights.cancellations.simulate_refund', side_effect=lambda amount: next(outcomes)):
+            self.assertEqual(process_refunds(max_attempts=2), {'refunded': 1, 'retrying': 2, 'failed': 0})
+            with self.assertLogs('flights.cancellations', 'WARNING'):
+                self.assertEqual(process_refunds(max_attempts=2), {'refunded': 0, 'retrying': 0, 'failed': 2})
+        self.assertEqual(
+            sorted(Refund.objects.values_list('status', flat=True)),
+            [Refund.STATUS_FAILED, Refund.STATUS_FAILED, Refund.STATUS_REFUNDED],
+        )
+
+    def test_refund_processor_is_called_outside_the_claim_transaction(self):
+        flight = make_flight()
+        self.book(flight, 2)
+        cancel_bookings(flight_id=flight.id)
+        depth = len(connection.atomic_blocks)
+        seen = []
+
+        def refund(amount):
+            seen.append((len(connection.atomic_blocks), Refund.objects.filter(status=Refund.STATUS_PROCESSING).count()))
+            return {'success': True, 'transaction_id': 'T'}
+
+        with mock.patch('flights.cancellations.simulate_refund', side_effect=refund):
+            self.assertEqual(process_refunds()['refunded'], 2)
+        self.assertEqual(seen, [(depth, 2), (depth, 2)])
+
+    def test_stale_claims_are_retaken(self):
+        flight = make_flight()
+        self.book(flight, 2)
+        cancel_bookings(flight_id=flight.id)
+        stale, fresh = Refund.objects.order_by('id')
+        Refund.objects.filter(id=stale.id).update(
+            status=Refund.STATUS_PROCESSING, claimed_at=timezone.now() - timedelta(minutes=10),
+        )
+        Refund.objects.filter(id=fresh.id).update(status=Refund.STATUS_PROCESSING, claimed_at=timezone.now())
+
+        with mock.patch('flights.cancellations.simulate_refund', return_value={'success': True, 'transaction_id': 'T'}):
+            self.assertEqual(process_refunds(claim_timeout=300)['refunded'], 1)
+        self.assertEqual(Refund.objects.get(id=stale.id).status, Refund.STATUS_REFUNDED)
+        self.assertEqual(Refund.objects.get(id=fresh.id).status, Refund.STATUS_PROCESSING)
+
+    def test_bulk_api_by_pnr_list(self):
+        flight = make_flight()
+        pnrs = self.book(flight, 4)
+        Booking.objects.filter(pnr=pnrs[0]).update(status=Booking.STATUS_CANCELLED)
+
+        response = post_json(self.client, '/flights/book/cancel/bulk/', {'pnrs': [p.lower() for p in pnrs] + ['NOPE']})
+        body = response.json()
+        self.assertEqual((body['cancelled'], body['refunds_queued']), (3, 3))
+        self.assertEqual(body['not_cancelled'], [pnrs[0], 'NOPE'])
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 99)
+
+        response = post_json(self.client, '/flights/book/cancel/bulk/', {'flight_id': flight.id})
+        self.assertEqual(response.status_code, 403)
+        with override_settings(REFUNDS={'BULK_CANCEL_MAX_PNRS': 2}):
+            response = post_json(self.client, '/flights/book/cancel/bulk/', {'pnrs': pnrs})
+        self.assertEqual(response.status_code, 400)
+
+    def test_single_cancel_response_unchanged(self):
+        pnr = self.book(make_flight(available_seats=100), 1)[0]
+        response = post_json(self.client, '/flights/book/cancel/', {'pnr': pnr})
+        self.assertEqual(response.json(), {'success': True, 'pnr': pnr, 'status': Booking.STATUS_CANCELLED})
+        self.assertEqual(post_json(self.client, '/flights/book/cancel/', {'pnr': pnr}).status_code, 409)
+        self.assertTrue(Refund.objects.filter(booking__pnr=pnr).exists())
+
+    def test_single_cancel_normalizes_the_pnr(self):
+        pnr = self.book(make_flight(available_seats=100), 1)[0]
+        response = post_json(self.client, '/flights/book/cancel/', {'pnr': f' {pnr.lower()} '})
+        self.assertEqual(response.json(), {'success': True, 'pnr': pnr, 'status': Booking.STATUS_CANCELLED})
+
+    def test_command_reports_throughput(self):
+        flight = make_flight()
+        self.book(flight, 5)
+        out = io.StringIO()
+        with mock.patch('flights.cancellations.simulate_refund', return_value={'success': True, 'transaction_id': 'T'}):
+            call_command('cancel_bookings', flight=flight.id, process_refunds=True, stdout=out)
+        self.assertIn('Cancelled 5 booking(s)', out.getvalue())
+        self.assertIn('bookings/s', out.getvalue())
+        self.assertIn('Refunds: 5 refunded', out.getvalue())
+
+
+class PassengerDedupeTests(BookingFlowMixin, TestCase):
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_repeat_customers_reuse_their_passenger(self, _payment):
+        flight = make_flight()
+        for email, phone in (('Asha@Example.com ', '+91 98765-43210'), ('asha@example.com', '+919876543210')):
+            token = self.begin(flight, 1)['quote_token']
+            response = self.confirm(token, passenger={'first_name': 'Asha', 'email': email, 'phone': phone})
+            self.assertEqual(response.status_code, 201)
+        token = self.begin(flight, 1)['quote_token']
+        self.confirm(token, passenger={'first_name': 'Asha', 'email': 'asha@example.com'})
+
+        self.assertEqual(Passenger.objects.count(), 2)
+        history = self.client.get('/flights/bookings/', {'email': 'ASHA@example.com'}).json()
+        self.assertEqual(len(history), 3)
+
+    def test_resolver_caches_committed_lookups(self):
+        resolver = PassengerResolver(max_entries=2)
+        details = {'first_name': 'Ravi', 'email': 'ravi@example.com'}
+        with self.captureOnCommitCallbacks(execute=True):
+            first = resolver.resolve(details)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve({'first_name': ' ravi', 'email': ' RAVI@example.com'}), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                resolver.resolve({'email': f'other{i}@example.com'})
+        self.assertEqual(len(resolver), 2)
+        self.assertNotEqual(resolver.resolve({}), resolver.resolve({}))  # no identity, never merged
+
+        Passenger.objects.get(id=first).delete()
+        self.assertNotEqual(passenger_resolver.resolve(details), first)
+
+    def test_identity_is_unique(self):
+        Passenger.objects.create(first_name='A', last_name='Rao', email='dup@example.com', phone='123')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Passenger.objects.create(first_name='a ', last_name='RAO', email='DUP@example.com', phone='1-2-3')
+        Passenger.objects.create(first_name='B', last_name='Rao', email='dup@example.com', phone='123')
+        Passenger.objects.create(first_name='C')
+        Passenger.objects.create(first_name='D')
+
+    def test_resolve_many_dedupes_in_bulk_and_survives_concurrent_inserts(self):
+        Passenger.objects.create(first_name='Old', email='old@agency.example')
+        people = [
+            {'first_name': 'Old', 'email': 'old@agency.example'},
+            {'first_name': 'New', 'email': 'new@agency.example', 'phone': '555'},
+            {'first_name': 'NEW', 'email': 'NEW@agency.example', 'phone': '5-5-5'},
+            {'first_name': 'Anon'},
+            {'first_name': 'Late', 'email': 'late@agency.example'},
+        ]
+        real_lookup = passenger_resolver._lookup
+        late = ('late@agency.example', '', 'late')
+
+        def racing_lookup(keys):
+            found = real_lookup(keys)
+            if late in keys and not found.get(late):
+                # Another worker inserts the same customer between our read and our insert.
+                Passenger.objects.create(first_name='Late', last_name=' ', email='late@agency.example')
+                return found
+            return found
+
+        with mock.patch.object(passenger_resolver, '_lookup', side_effect=racing_lookup):
+            # lookup, the other worker's insert, our insert, re-read, anonymous insert
+            with self.assertNumQueries(5):
+                ids = passenger_resolver.resolve_many(people)
+        self.assertEqual(ids[1], ids[2])
+        self.assertEqual(Passenger.objects.count(), 4)
+        self.assertEqual(Passenger.objects.get(id=ids[4]).last_name, ' ')
+
+    def test_people_sharing_contact_details_are_not_merged(self):
+        family = [
+            {'first_name': 'Asha', 'last_name': 'Rao', 'email': 'rao@example.com', 'phone': '555'},
+            {'first_name': 'Vikram', 'last_name': 'Rao', 'email': 'rao@example.com', 'phone': '555'},
+            {'first_name': 'asha', 'last_name': 'rao ', 'email': 'RAO@example.com', 'phone': '5-5-5'},
+        ]
+        ids = passenger_resolver.resolve_many(family)
+        self.assertEqual((ids[0] == ids[2], ids[0] == ids[1]), (True, False))
+        self.assertEqual(passenger_resolver.resolve(family[1]), ids[1])
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_repeat_bulk_orders_add_no_passengers(self, _payment):
+        flight = make_flight()
+        items = [{'flight_id': flight.id, 'passengers': [{'first_name': f'P{i}', 'email': f'p{i}@agency.example'} for i in range(4)]}]
+        post_json(self.client, '/flights/book/bulk/', {'items': items})
+        post_json(self.client, '/flights/book/bulk/', {'items': items})
+        self.assertEqual(Booking.objects.count(), 8)
+        self.assertEqual(Passenger.objects.count(), 4)
+
+
+@skipUnless(np is not None, "numpy is not installed")
+class MarketSimulationTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now().replace(microsecond=0)
+        self.flights = [
+            make_flight(departure_time=self.start + timedelta(days=days), total_seats=seats, available_seats=seats)
+            for days, seats in ((1, 20), (3, 50), (6, 180))
+        ]
+
+    def simulate(self, seed=7, **arrivals):
+        return MarketSimulation(self.flights, self.start, seed=seed, arrivals=arrivals or {'SEARCHES_PER_HOUR': 20})
+
+    def test_runs_are_reproducible_and_never_oversell(self):
+        first = self.simulate()
+        stats = first.run(self.start + timedelta(days=7))
+        self.assertEqual(stats, self.simulate().run(self.start + timedelta(days=7)))
+        self.assertEqual(stats['ticks'], 7 * 24 * 4)
+        self.assertGreater(stats['bookings'], 0)
+        self.assertTrue((first.available >= 0).all())
+        self.assertEqual(stats['bookings'], sum(f.available_seats for f in self.flights) - int(first.available.sum()))
+        self.assertEqual(FareHistory.objects.count(), 0)
+
+    def test_sampled_fares_follow_the_pricing_rules(self):
+        simulation = self.simulate()
+        simulation.run(self.start + timedelta(hours=1))
+        expected = [
+            compute_dynamic_fare(f.base_price, f.total_seats, f.available_seats, f.departure_time, f.demand_factor,
+                                 now=self.start)
+            for f in self.flights
+        ]
+        self.assertEqual([Decimal(str(fare)) for fare in simulation._samples[0][2]], expected)
+
+        pricing_rules.load({'cap': 1.1})
+        try:
+            capped = self.simulate().fares(self.start.timestamp())
+        finally:
+            pricing_rules.load()
+        self.assertTrue((capped <= 5500.0).all())
+
+    def test_samples_are_written_in_bulk(self):
+        simulation = self.simulate()
+        stats = simulation.run(self.start + timedelta(days=2), sample_every=8)
+        with self.assertNumQueries(3):  # savepoint, one INSERT, release
+            written = write_fare_history(simulation, batch_size=10000)
+        self.assertEqual(written, stats['samples'])
+        self.assertEqual(FareHistory.objects.count(), written)
+
+    def test_command_reports_throughput(self):
+        out = io.StringIO()
+        call_command('simulate_market', days=2, seed=1, stdout=out)
+        self.assertIn('bookings/s', out.getvalue())
+        self.assertTrue(FareHistory.objects.exists())
+
+    def test_command_rejects_non_positive_steps(self):
+        for options in ({'step_minutes': 0}, {'step_minutes': -15}, {'sample_every': 0}):
+            with self.subTest(**options), self.assertRaises(CommandError):
+                call_command('simulate_market', days=1, stdout=io.StringIO(), **options)
+        self.assertFalse(FareHistory.objects.exists())
+
+
+class OverbookingTests(BookingFlowMixin, TestCase):
+    def book_history(self, flight, confirmed, lost):
+        passenger = Passenger.objects.create(first_name='Hist')
+        statuses = [Booking.STATUS_CONFIRMED] * confirmed + [Booking.STATUS_CANCELLED, Booking.STATUS_FAILED] * (lost // 2)
+        Booking.objects.bulk_create([
+            Booking(pnr=f'H{flight.id:05d}{i:05d}', flight=flight, passenger=passenger, booked_seats=1, status=status)
+            for i, status in enumerate(statuses)
+        ])
+
+    @override_settings(OVERBOOKING={'MAX_FACTOR': 1.2, 'MIN_SEATS': 150})
+    def test_factors_come_from_one_aggregate_over_departed_flights(self):
+        past = timezone.now() - timedelta(days=5)
+        self.book_history(make_flight(departure_time=past), confirmed=180, lost=20)
+        self.book_history(make_flight(departure_time=past, origin='BLR'), confirmed=90, lost=10)
+        self.book_history(make_flight(), confirmed=0, lost=100)  # not departed yet
+        with self.assertNumQueries(1):
+            factors = oversell_factors()
+        self.assertEqual(factors, {('DEL', 'BOM'): 1.11})
+
+    @override_settings(OVERBOOKING={'MAX_FACTOR': 1.05, 'MIN_SEATS': 100})
+    def test_refresh_shifts_capacity_and_availability_together(self):
+        self.book_history(make_flight(departure_time=timezone.now() - timedelta(days=1)), confirmed=150, lost=50)
+        upcoming = make_flight(total_seats=180, available_seats=30)
+        other_route = make_flight(origin='BLR')
+        refresh_fares()
+
+        self.assertEqual(refresh_oversell(), 1)
+        upcoming.refresh_from_db()
+        self.assertEqual((upcoming.oversell_seats, upcoming.available_seats), (9, 39))
+        self.assertIsNone(upcoming.current_fare)
+        self.assertEqual(Flight.objects.get(id=other_route.id).oversell_seats, 0)
+        self.assertEqual(refresh_oversell(), 0)
+
+        with override_settings(OVERBOOKING={'MIN_SEATS': 10000}):
+            self.assertEqual(refresh_oversell(), 1)
+        upcoming.refresh_from_db()
+        self.assertEqual((upcoming.oversell_seats, upcoming.available_seats), (0, 30))
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_oversold_seats_are_priced_on_authorized_capacity_and_booked_unassigned(self, _payment):
+        flight = make_flight(total_seats=2, available_seats=3, oversell_seats=1)
+        first = self.begin(flight, 2)
+        self.assertEqual(Decimal(first['dynamic_price_per_seat']), compute_dynamic_fare(
+            flight.base_price, 3, 1, flight.departure_time, flight.demand_factor,
+        ))
+        second = self.begin(flight, 1)
+        self.assertFalse(self.begin(flight, 1)['success'])
+
+        self.assertEqual(self.confirm(first['quote_token']).json()['seat_number'], '1A,1B')
+        response = self.confirm(second['quote_token'])
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.json()['seat_number'])
+        self.assertEqual(Booking.objects.filter(status=Booking.STATUS_CONFIRMED).count(), 2)
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_only_the_excess_is_left_unassigned(self, _payment):
+        flight = make_flight(total_seats=2, available_seats=3, oversell_seats=1)
+        first = self.begin(flight, 1)
+        second = self.begin(flight, 2)
+        self.assertEqual(self.confirm(first['quote_token']).json()['seat_number'], '1A')
+        self.assertEqual(self.confirm(second['quote_token']).json()['seat_number'], '1B')
+
+        other = make_flight(total_seats=2, available_seats=3, oversell_seats=1)
+        allocate_seats(other.id, 1)
+        response = post_json(self.client, '/flights/book/bulk/', {
+            'items': [{'flight_id': other.id, 'passengers': [{'first_name': 'A'}, {'first_name': 'B'}]}],
+        })
+        self.assertEqual(response.json()['items'][0]['seat_numbers'], ['1B', None])
+
+    @mock.patch('flights.payments.simulate_payment', return_value=PAYMENT_OK)
+    def test_a_full_cabin_without_an_allowance_is_not_booked_unassigned(self, _payment):
+        flight = make_flight(total_seats=2, available_seats=2)
+        allocate_seats(flight.id, 2)  # seats assigned outside the booking flow
+        token = self.begin(flight, 1)['quote_token']
+        response = self.confirm(token)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 2)
+        self.assertFalse(Booking.objects.exists())
+
+        response = post_json(self.client, '/flights/book/bulk/', {
+            'items': [{'flight_id': flight.id, 'passengers': [{'first_name': 'A'}]}],
+        })
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Flight.objects.get(id=flight.id).available_seats, 2)
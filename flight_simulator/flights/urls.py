@@ -4,14 +4,20 @@ from .views import (
     FlightSearchView,
     BeginBookingView,
     ConfirmBookingView,
+    BulkBookingView,
     CancelBookingView,
-    BookingHistoryView
+    BulkCancelView,
+    BookingHistoryView,
+    ItinerarySearchView,
 )
 
 urlpatterns = [
     path('search/', FlightSearchView.as_view(), name='flight-search'),
+    path('itineraries/', ItinerarySearchView.as_view(), name='itinerary-search'),
     path('book/begin/', BeginBookingView.as_view(), name='begin-booking'),
     path('book/confirm/', ConfirmBookingView.as_view(), name='confirm-booking'),
+    path('book/bulk/', BulkBookingView.as_view(), name='bulk-booking'),
     path('book/cancel/', CancelBookingView.as_view(), name='cancel-booking'),
+    path('book/cancel/bulk/', BulkCancelView.as_view(), name='bulk-cancel'),
     path('bookings/', BookingHistoryView.as_view(), name='booking-history'),
 ]
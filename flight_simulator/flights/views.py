@@ -1,30 +1,45 @@
+import base64
 import json
+import time
+import uuid
+from datetime import datetime
 from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
-from django.db.models import F
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from django.db.models import Q
+from django.http import (
+    HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed, StreamingHttpResponse,
+)
 from django.views import View
 from django.utils import timezone
 
-from .models import Flight, Booking, Passenger
-from .utils import generate_pnr, simulate_payment
-from .pricing import compute_dynamic_fare
+from . import bulk_booking
+from .cancellations import cancel_bookings
+from .models import Flight, Booking, normalize_email
+from .demand import CONFIRM, HOLD, SEARCH, demand_engine
+from .fare_cache import fare_cache
+from .fare_grid import FARE_FIELDS, PRICING_FIELDS, current_fare, current_fares
+from .inventory import reserve_seats
+from .holds import consume_hold, create_hold, release_consumed_hold
+from .metrics import render_metrics
+from .passengers import passenger_resolver
+from .payments import payment_stage
+from .pnr import is_valid_pnr, normalize_pnr, pnr_allocator
+from .quotes import QuoteError, issue_quote, read_quote
+from .search_cache import CachedSearch, dumps, search_cache, search_response
+from .search_index import route_flight_ids, search_flights
+from .itinerary import search_itineraries
+from .seatmap import SeatMapError, allocate_seats, release_seat_labels
 
 
-def try_reserve_seats(flight_id: int, seats_to_reserve: int) -> bool:
-    
-    
-    updated = Flight.objects.filter(id=flight_id, available_seats__gte=seats_to_reserve).update(
-        available_seats=F('available_seats') - seats_to_reserve
-    )
-    return updated == 1
-
 class BeginBookingView(View):
     
-    def post(self, request):
+    async def post(self, request):
         try:
             payload = json.loads(request.body)
-            flight_id = payload.get('flight_id')
+            flight_id = int(payload.get('flight_id'))
             seats = int(payload.get('seats', 1))
         except Exception:
             return HttpResponseBadRequest("Invalid JSON or parameters")
@@ -32,92 +47,149 @@ class BeginBookingView(View):
         if seats <= 0:
             return HttpResponseBadRequest("seats must be >= 1")
 
-        try:
-            flight = Flight.objects.get(id=flight_id)
-        except Flight.DoesNotExist:
-            return HttpResponseBadRequest("Flight not found")
+        return await sync_to_async(self.reserve)(flight_id, seats)
 
-        
-        reserved = False
+    def reserve(self, flight_id, seats):
+        # Reserving returns the post-update row, so the fare is priced from the
+        # seats actually left and the flight is never read separately.
         with transaction.atomic():
-            reserved = try_reserve_seats(flight.id, seats)
-            if not reserved:
-                return JsonResponse({"success": False, "error": "Not enough seats available"}, status=409)
+            flight = reserve_seats(flight_id, seats, fields=(*PRICING_FIELDS, *FARE_FIELDS))
+            if flight is not None:
+                hold = create_hold(flight.id, seats)
+        if flight is None:
+            if not Flight.objects.filter(id=flight_id).exists():
+                return HttpResponseBadRequest("Flight not found")
+            return JsonResponse({"success": False, "error": "Not enough seats available"}, status=409)
 
-        dynamic_price = compute_dynamic_fare(Decimal(flight.base_price), flight.total_seats, flight.available_seats, flight.departure_time, float(getattr(flight, 'demand_factor', 1.0)))
+        demand_engine.record(flight.id, HOLD, seats)
+        dynamic_price = current_fare(flight)
         return JsonResponse({
             "success": True,
             "message": "Seats reserved temporarily (atomic decrement)",
             "flight_id": str(flight.id),
             "seats_reserved": seats,
             "dynamic_price_per_seat": str(dynamic_price),
-            "total_price": str(dynamic_price * seats)
+            "total_price": str(dynamic_price * seats),
+            "hold_id": str(hold.hold_id),
+            "hold_expires_at": hold.expires_at.isoformat(),
+            "quote_token": issue_quote(flight.id, seats, dynamic_price, hold)
         })
 
 class ConfirmBookingView(View):
-   
-    def post(self, request):
+    # Database work runs in sync helpers; only the payment is awaited, so a
+    # slow provider holds an event-loop task rather than a worker thread.
+
+    async def post(self, request):
         try:
             payload = json.loads(request.body)
             flight_id = payload.get('flight_id')
-            seats = int(payload.get('seats', 1))
+            seats = payload.get('seats')
+            token = payload.get('quote_token')
+            seat_class = payload.get('seat_class')
+            adjacent = bool(payload.get('adjacent', True))
             p = payload.get('passenger') or {}
         except Exception:
             return HttpResponseBadRequest("Invalid JSON or parameters")
 
-        if seats <= 0:
-            return HttpResponseBadRequest("seats must be >=1")
-
+        # The signed quote from BeginBookingView carries flight, seats and the
+        # locked price, so confirm neither re-reads the flight nor re-prices it.
         try:
-            flight = Flight.objects.get(id=flight_id)
-        except Flight.DoesNotExist:
-            return HttpResponseBadRequest("Flight not found")
+            quote = read_quote(token)
+        except QuoteError as exc:
+            return JsonResponse({"success": False, "error": str(exc)}, status=exc.status)
+
+        if flight_id is not None and str(flight_id) != str(quote.flight_id):
+            return HttpResponseBadRequest("flight_id does not match quote")
+        if seats is not None and str(seats) != str(quote.seats):
+            return HttpResponseBadRequest("seats does not match quote")
 
-        
-        dynamic_price = compute_dynamic_fare(Decimal(flight.base_price), flight.total_seats, flight.available_seats, flight.departure_time, float(getattr(flight, 'demand_factor', 1.0)))
-        total_amount = dynamic_price * seats
+        seat_numbers, error = await sync_to_async(self.claim_seats)(quote, seat_class, adjacent)
+        if error is not None:
+            return error
 
-        payment_result = simulate_payment(total_amount)
+        payment_result = await payment_stage.charge(quote.total_price, reference=quote.hold_id)
         if not payment_result.get('success'):
-            with transaction.atomic():
-                Flight.objects.filter(id=flight.id).update(available_seats=F('available_seats') + seats)
+            await sync_to_async(self.release)(quote, seat_numbers)
             return JsonResponse({"success": False, "error": "Payment failed", "detail": payment_result.get('error')}, status=402)
 
-        with transaction.atomic():
-            passenger = Passenger.objects.create(
-                first_name=p.get('first_name',''),
-                last_name=p.get('last_name',''),
-                email=p.get('email'),
-                phone=p.get('phone')
-            )
-            
-            used = flight.total_seats - flight.available_seats
-            seat_numbers = []
-            for i in range(1, seats+1):
-                seat_num = f"{used + i}"
-                seat_numbers.append(seat_num)
-
-            pnr = generate_pnr(prefix='PN')
-            booking = Booking.objects.create(
-                pnr=pnr,
-                flight=flight,
-                passenger=passenger,
-                seat_number=",".join(seat_numbers),
-                booked_seats=seats,
-                price_paid=total_amount,
-                status=Booking.STATUS_CONFIRMED
-            )
+        booking = await sync_to_async(self.create_booking)(quote, p, seat_numbers)
 
         return JsonResponse({
             "success": True,
             "pnr": booking.pnr,
             "booking_id": booking.id,
-            "flight_id": str(flight.id),
+            "flight_id": str(quote.flight_id),
             "seat_number": booking.seat_number,
             "price_paid": str(booking.price_paid),
             "transaction_id": payment_result.get('transaction_id')
         }, status=201)
 
+    def claim_seats(self, quote, seat_class, adjacent):
+        if not consume_hold(quote.hold_id, quote.flight_id, quote.seats):
+            return None, JsonResponse({"success": False, "error": "Seat hold expired or already used"}, status=409)
+
+        try:
+            seat_numbers = allocate_seats(
+                quote.flight_id, quote.seats, seat_class=seat_class, adjacent=adjacent, allow_unassigned=True,
+            )
+        except SeatMapError as exc:
+            release_consumed_hold(quote.hold_id, quote.flight_id, quote.seats)
+            return None, JsonResponse({"success": False, "error": str(exc)}, status=409)
+        return seat_numbers, None
+
+    def release(self, quote, seat_numbers):
+        with transaction.atomic():
+            release_seat_labels(quote.flight_id, seat_numbers)
+            release_consumed_hold(quote.hold_id, quote.flight_id, quote.seats)
+
+    def create_booking(self, quote, p, seat_numbers):
+        demand_engine.record(quote.flight_id, CONFIRM, quote.seats)
+        pnr = pnr_allocator.allocate()
+        with transaction.atomic():
+            return Booking.objects.create(
+                pnr=pnr,
+                flight_id=quote.flight_id,
+                passenger_id=passenger_resolver.resolve(p),
+                seat_number=",".join(seat_numbers) or None,
+                booked_seats=quote.seats,
+                price_paid=quote.total_price,
+                status=Booking.STATUS_CONFIRMED
+            )
+
+class BulkBookingView(View):
+    # Agency/group orders: many (flight, passengers) items reserved, priced,
+    # paid for and inserted together, with a per-item result.
+
+    async def post(self, request):
+        try:
+            payload = json.loads(request.body)
+            items = bulk_booking.parse_items(payload.get('items'))
+            seat_class = payload.get('seat_class')
+        except bulk_booking.BulkBookingError as exc:
+            return HttpResponseBadRequest(str(exc))
+        except Exception:
+            return HttpResponseBadRequest("Invalid JSON or parameters")
+
+        items = await sync_to_async(bulk_booking.reserve)(items, seat_class)
+        items = await sync_to_async(bulk_booking.claim)(items)
+        reserved = [item for item in items if item.ok]
+        if not reserved:
+            return JsonResponse({"success": False, "items": [item.as_dict() for item in items]}, status=409)
+
+        total_amount = sum((item.total_price for item in reserved), Decimal('0.00'))
+        payment_result = await payment_stage.charge(total_amount, reference=f"bulk-{uuid.uuid4()}")
+        if not payment_result.get('success'):
+            await sync_to_async(bulk_booking.release)(items)
+            return JsonResponse({"success": False, "error": "Payment failed", "detail": payment_result.get('error')}, status=402)
+
+        items = await sync_to_async(bulk_booking.create_bookings)(items)
+        return JsonResponse({
+            "success": True,
+            "items": [item.as_dict() for item in items],
+            "total_charged": str(total_amount),
+            "transaction_id": payment_result.get('transaction_id')
+        }, status=201)
+
 class CancelBookingView(View):
     def post(self, request):
         try:
@@ -126,52 +198,169 @@ class CancelBookingView(View):
         except Exception:
             return HttpResponseBadRequest("Invalid JSON")
 
-        if not pnr:
+        if not isinstance(pnr, str) or not pnr.strip():
             return HttpResponseBadRequest("pnr required")
+        pnr = normalize_pnr(pnr)
 
         try:
-            booking = Booking.objects.select_related('flight').get(pnr=pnr)
+            if not is_valid_pnr(pnr):
+                raise Booking.DoesNotExist
+            booking = Booking.objects.only('pnr', 'status').get(pnr=pnr)
         except Booking.DoesNotExist:
             return JsonResponse({"success": False, "error": "Booking not found"}, status=404)
 
         if booking.status != Booking.STATUS_CONFIRMED:
             return JsonResponse({"success": False, "error": f"Booking not cancellable (status {booking.status})"}, status=409)
 
-        seats = booking.booked_seats
-        with transaction.atomic():
-            booking.status = Booking.STATUS_CANCELLED
-            booking.save()
-            booking.flight.refresh_from_db()
-            Flight.objects.filter(id=booking.flight.id).update(available_seats=F('available_seats') + seats)
+        if not cancel_bookings(pnrs=[booking.pnr])['bookings']:
+            return JsonResponse({"success": False, "error": "Booking not cancellable (status changed)"}, status=409)
+
+        return JsonResponse({"success": True, "pnr": booking.pnr, "status": Booking.STATUS_CANCELLED})
+
+
+class BulkCancelView(View):
+    # Flight disruptions: cancel a PNR list and/or every confirmed booking on
+    # a flight, with seats released and refunds queued in batches.
+
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+            pnrs = payload.get('pnrs')
+            flight_id = payload.get('flight_id')
+            if pnrs is not None:
+                if not isinstance(pnrs, list) or not all(isinstance(p, str) for p in pnrs):
+                    raise ValueError
+                pnrs = list(dict.fromkeys(normalize_pnr(p) for p in pnrs))
+            if flight_id is not None:
+                flight_id = int(flight_id)
+        except Exception:
+            return HttpResponseBadRequest("Invalid JSON or parameters")
+
+        if pnrs is None and flight_id is None:
+            return HttpResponseBadRequest("pnrs or flight_id required")
+        max_pnrs = getattr(settings, 'REFUNDS', {}).get('BULK_CANCEL_MAX_PNRS', 1000)
+        if pnrs is not None and len(pnrs) > max_pnrs:
+            return HttpResponseBadRequest(f"At most {max_pnrs} pnrs per request")
+        if flight_id is not None and pnrs is None and not request.user.is_staff:
+            return JsonResponse({"success": False, "error": "Cancelling a whole flight requires staff"}, status=403)
+
+        started = time.perf_counter()
+        result = cancel_bookings(
+            pnrs=[p for p in pnrs if is_valid_pnr(p)] if pnrs is not None else None,
+            flight_id=flight_id,
+        )
+        elapsed = time.perf_counter() - started
+
+        cancelled = set(result['pnrs'])
+        return JsonResponse({
+            "success": True,
+            "cancelled": result['bookings'],
+            "seats_released": result['seats'],
+            "flights": result['flights'],
+            "refunds_queued": result['refunds'],
+            "not_cancelled": [p for p in pnrs if p not in cancelled] if pnrs is not None else [],
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "bookings_per_second": round(result['bookings'] / elapsed, 1) if elapsed else None,
+        })
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+HISTORY_STREAM_CHUNK = 1000
+HISTORY_FIELDS = (
+    'id', 'pnr', 'seat_number', 'price_paid', 'status', 'created_at',
+    'flight__id', 'flight__origin', 'flight__destination', 'flight__departure_time',
+    'passenger__first_name', 'passenger__last_name',
+)
+
+
+def encode_history_cursor(booking) -> str:
+    raw = f"{booking.created_at.isoformat()}|{booking.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_history_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, booking_id = raw.split('|')
+    return datetime.fromisoformat(created_at), int(booking_id)
+
+
+def history_row(b) -> dict:
+    return {
+        "pnr": b.pnr,
+        "flight_id": str(b.flight.id),
+        "route": f"{b.flight.origin}->{b.flight.destination}",
+        "departure": b.flight.departure_time.isoformat(),
+        "passenger": f"{b.passenger.first_name} {b.passenger.last_name}",
+        "seat_number": b.seat_number,
+        "price_paid": str(b.price_paid),
+        "status": b.status,
+        "created_at": b.created_at.isoformat()
+    }
+
+
+async def stream_history(qs):
+    # ASGI consumes a sync iterator with sync_to_async(list), buffering the
+    # whole export; fetch keyset pages off the event loop and yield as we go.
+    page_qs = qs
+    while True:
+        page = await sync_to_async(list)(page_qs[:HISTORY_STREAM_CHUNK])
+        for b in page:
+            yield json.dumps(history_row(b)) + "\n"
+        if len(page) < HISTORY_STREAM_CHUNK:
+            return
+        last = page[-1]
+        page_qs = qs.filter(Q(created_at__lt=last.created_at) | Q(created_at=last.created_at, id__lt=last.id))
 
-        return JsonResponse({"success": True, "pnr": booking.pnr, "status": booking.status})
 
 class BookingHistoryView(View):
+    # Newest first, keyset-paginated on (created_at, id). The next page's
+    # cursor is returned in the X-Next-Cursor header; format=ndjson streams
+    # every remaining row instead of returning a page.
+
     def get(self, request):
         pnr = request.GET.get('pnr')
         email = request.GET.get('email')
+        cursor = request.GET.get('cursor')
+        stream = request.GET.get('format') == 'ndjson'
 
         if pnr:
-            qs = Booking.objects.filter(pnr=pnr).select_related('passenger','flight')
+            qs = Booking.objects.filter(pnr=normalize_pnr(pnr))
         elif email:
-            qs = Booking.objects.filter(passenger__email__iexact=email).select_related('passenger','flight')
+            qs = Booking.objects.filter(passenger__email_normalized=normalize_email(email))
         else:
             return HttpResponseBadRequest("Provide either pnr or email")
 
-        results = []
-        for b in qs.order_by('-created_at'):
-            results.append({
-                "pnr": b.pnr,
-                "flight_id": str(b.flight.id),
-                "route": f"{b.flight.origin}->{b.flight.destination}",
-                "departure": b.flight.departure_time.isoformat(),
-                "passenger": f"{b.passenger.first_name} {b.passenger.last_name}",
-                "seat_number": b.seat_number,
-                "price_paid": str(b.price_paid),
-                "status": b.status,
-                "created_at": b.created_at.isoformat()
-            })
-        return JsonResponse(results, safe=False)
+        try:
+            limit = min(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        except ValueError:
+            return HttpResponseBadRequest("limit must be an integer")
+        if limit <= 0:
+            return HttpResponseBadRequest("limit must be >= 1")
+
+        if cursor:
+            try:
+                created_at, booking_id = decode_history_cursor(cursor)
+            except Exception:
+                return HttpResponseBadRequest("Invalid cursor")
+            qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=booking_id))
+
+        qs = qs.select_related('passenger', 'flight').only(*HISTORY_FIELDS).order_by('-created_at', '-id')
+
+        if stream:
+            if isinstance(request, ASGIRequest):
+                rows = stream_history(qs)
+            else:
+                rows = (json.dumps(history_row(b)) + "\n" for b in qs.iterator(chunk_size=HISTORY_STREAM_CHUNK))
+            return StreamingHttpResponse(rows, content_type='application/x-ndjson')
+
+        page = list(qs[:limit + 1])
+        results = [history_row(b) for b in page[:limit]]
+        response = JsonResponse(results, safe=False)
+        if len(page) > limit:
+            response['X-Next-Cursor'] = encode_history_cursor(page[limit - 1])
+        return response
+
 class FlightSearchView(View):
     def get(self, request):
         origin = request.GET.get('origin')
@@ -189,24 +378,120 @@ class FlightSearchView(View):
         except ValueError:
             return HttpResponseBadRequest("Invalid departure_date format. Use ISO format YYYY-MM-DDTHH:MM:SS")
 
-        flights = Flight.objects.filter(
-            origin__iexact=origin,
-            destination__iexact=destination,
-            departure_time__date=departure_dt.date(),
-            available_seats__gte=passengers
-        )
+        day = departure_dt.date()
+        key = search_cache.key(origin, destination, day, passengers)
+        caching = getattr(settings, 'SEARCH_RESPONSE_CACHE', {}).get('ENABLED', True)
+        entry = search_cache.get(key) if caching else None
+        if entry is None:
+            flights = list(search_flights(origin, destination, day, passengers))
+            fares = current_fares(flights)
+
+            results = []
+            for flight, dynamic_price in zip(flights, fares):
+                results.append({
+                    "flight_id": str(flight.id),
+                    "origin": flight.origin,
+                    "destination": flight.destination,
+                    "departure_time": flight.departure_time.isoformat(),
+                    "arrival_time": flight.arrival_time.isoformat(),
+                    "available_seats": flight.available_seats,
+                    "dynamic_price_per_seat": str(dynamic_price)
+                })
 
-        results = []
-        for flight in flights:
-            dynamic_price = compute_dynamic_fare(Decimal(flight.base_price), flight.total_seats, flight.available_seats, flight.departure_time, float(getattr(flight, 'demand_factor', 1.0)))
-            results.append({
+            flight_ids = [flight.id for flight in flights]
+            if caching:
+                entry = search_cache.put(key, dumps(results), flight_ids, route_flight_ids(origin, destination, day))
+            else:
+                entry = CachedSearch(dumps(results), flight_ids, expires_at=0)
+
+        demand_engine.record_many(entry.flight_ids, SEARCH)
+        return search_response(request, entry)
+
+
+def itinerary_row(itinerary, passengers):
+    legs = itinerary['legs']
+    return {
+        "stops": len(legs) - 1,
+        "price_per_passenger": str(itinerary['fare']),
+        "total_price": str(itinerary['fare'] * passengers),
+        "duration_minutes": int(itinerary['duration'] // 60),
+        "departure_time": legs[0].departure_time.isoformat(),
+        "arrival_time": legs[-1].arrival_time.isoformat(),
+        "legs": [
+            {
                 "flight_id": str(flight.id),
+                "flight_number": flight.flight_number,
                 "origin": flight.origin,
                 "destination": flight.destination,
                 "departure_time": flight.departure_time.isoformat(),
                 "arrival_time": flight.arrival_time.isoformat(),
                 "available_seats": flight.available_seats,
-                "dynamic_price_per_seat": str(dynamic_price)
-            })
+            }
+            for flight in legs
+        ],
+    }
 
-        return JsonResponse(results, safe=False)
+
+class ItinerarySearchView(View):
+    # Direct and connecting itineraries (up to two stops), optionally with a
+    # return leg; see flights.itinerary.
+
+    def get(self, request):
+        origin = request.GET.get('origin')
+        destination = request.GET.get('destination')
+        departure_date = request.GET.get('departure_date')
+        return_date = request.GET.get('return_date')
+        if not origin or not destination or not departure_date:
+            return HttpResponseBadRequest("origin, destination, and departure_date are required")
+
+        try:
+            outbound_day = datetime.fromisoformat(departure_date).date()
+            return_day = datetime.fromisoformat(return_date).date() if return_date else None
+            passengers = int(request.GET.get('passengers', '1'))
+            config = getattr(settings, 'ITINERARY_SEARCH', {})
+            options = {
+                'max_stops': min(int(request.GET['max_stops']), 2) if 'max_stops' in request.GET else None,
+                'min_layover': int(request.GET.get('min_layover', config.get('MIN_LAYOVER_MINUTES', 45))),
+                'max_layover': int(request.GET.get('max_layover', config.get('MAX_LAYOVER_MINUTES', 360))),
+                'limit': min(int(request.GET.get('limit', 20)), 100),
+            }
+        except ValueError:
+            return HttpResponseBadRequest("Invalid date or numeric parameter")
+        if passengers <= 0:
+            return HttpResponseBadRequest("passengers must be >= 1")
+        if not 0 <= options['min_layover'] <= options['max_layover']:
+            return HttpResponseBadRequest("min_layover and max_layover must satisfy 0 <= min_layover <= max_layover")
+        if return_day is not None and return_day < outbound_day:
+            return HttpResponseBadRequest("return_date must not be before departure_date")
+        sort = request.GET.get('sort', 'fare')
+        if sort not in ('fare', 'duration'):
+            return HttpResponseBadRequest("sort must be 'fare' or 'duration'")
+
+        directions = {'outbound': (origin, destination, outbound_day)}
+        if return_day is not None:
+            directions['return'] = (destination, origin, return_day)
+
+        results = {}
+        for name, (frm, to, day) in directions.items():
+            itineraries = search_itineraries(frm, to, day, passengers, sort=sort, **options)
+            demand_engine.record_many({f.id for it in itineraries for f in it['legs']}, SEARCH)
+            results[name] = [itinerary_row(it, passengers) for it in itineraries]
+        return JsonResponse(results)
+
+
+class MetricsView(View):
+    def get(self, request):
+        stats = fare_cache.stats()
+        extra = [
+            "# HELP flights_fare_cache_lookups_total Fare quote cache lookups by result.",
+            "# TYPE flights_fare_cache_lookups_total counter",
+            f'flights_fare_cache_lookups_total{{result="hit"}} {stats["hits"]}',
+            f'flights_fare_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+        ]
+        if stats['size'] is not None:
+            extra += [
+                "# HELP flights_fare_cache_entries Fare quotes currently cached.",
+                "# TYPE flights_fare_cache_entries gauge",
+                f"flights_fare_cache_entries {stats['size']}",
+            ]
+        return HttpResponse(render_metrics(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -306,29 +306,42 @@ document.addEventListener('DOMContentLoaded', () => {
 	}
 	
 	
-	confirmBookingBtn.addEventListener('click', () => {
-	  const payload = {
-	    flight_id: selectedFlightOffer.id,
-	    seats: passengerList.length,
-	    passenger: {
-	      first_name: passengerList[0]?.name?.split(" ")[0] || "Guest",
-	      last_name: passengerList[0]?.name?.split(" ")[1] || "",
-	      email: "test@example.com",
-	      phone: "9999999999"
-	    }
-	  };
-	
-	  fetch("/flights/book/confirm/", {
+	function postJson(url, body) {
+	  return fetch(url, {
 	    method: "POST",
 	    headers: {
 	      "Content-Type": "application/json",
 	      "X-CSRFToken": getCookie('csrftoken') || ''
 	    },
-	    body: JSON.stringify(payload)
+	    body: JSON.stringify(body)
 	  })
 	  .then(res => {
 	    if (!res.ok) return res.json().then(j => { throw new Error(j.error || 'Server error ' + res.status); });
 	    return res.json();
+	  });
+	}
+	
+	confirmBookingBtn.addEventListener('click', () => {
+	  const passenger = {
+	    first_name: passengerList[0]?.name?.split(" ")[0] || "Guest",
+	    last_name: passengerList[0]?.name?.split(" ")[1] || "",
+	    email: "test@example.com",
+	    phone: "9999999999"
+	  };
+	
+	  // Begin reserves the seats and returns a signed, price-locked quote
+	  // that confirm redeems.
+	  postJson("/flights/book/begin/", {
+	    flight_id: selectedFlightOffer.id,
+	    seats: passengerList.length
+	  })
+	  .then(quote => {
+	    if (!quote.success) throw new Error(quote.error || "Unable to reserve seats");
+	    return postJson("/flights/book/confirm/", {
+	      quote_token: quote.quote_token,
+	      seat_class: chosenClass,
+	      passenger
+	    });
 	  })
 	  .then(data => {
 	    if (!data.success) throw new Error(data.error || "Unknown error");
@@ -337,6 +350,7 @@ document.addEventListener('DOMContentLoaded', () => {
 	      flight: selectedFlightOffer,
 	      class: chosenClass,
 	      passengers: passengerList,
+	      seats: data.seat_number,
 	      total: data.price_paid,
 	      bookedAt: new Date().toLocaleString()
 	    };
@@ -346,6 +360,7 @@ document.addEventListener('DOMContentLoaded', () => {
 	      <p><strong>Route:</strong> ${bookingInfo.flight.from} → ${bookingInfo.flight.to}</p>
 	      <p><strong>Class:</strong> ${bookingInfo.class}</p>
 	      <p><strong>Passengers:</strong> ${bookingInfo.passengers.length}</p>
+	      <p><strong>Seats:</strong> ${bookingInfo.seats}</p>
 	      <p><strong>Total Paid:</strong> ₹${bookingInfo.total}</p>
 	      <p class="small muted">Booked at: ${bookingInfo.bookedAt}</p>
 	    `;